@@ -0,0 +1,151 @@
+"""Account deletion: soft delete now, purge the user's rows in the background.
+
+delete_user only stamps users.user_deleted_at and enqueues a purge job, so
+the request returns at once however much history the account has. The job
+removes the user's rows table by table in small batches, one transaction
+each, so a large account never holds long locks on the hot tables, and
+finally deletes the users row (ON DELETE CASCADE catches anything left).
+
+    python accounts.py sweep-orphans [--batch-size 1000]
+    python accounts.py set-role --user 42 --role instructor
+
+sweep-orphans removes rows whose user no longer exists (left by deletions
+made before the purge existed) and purges soft-deleted users whose job was
+lost, on every shard when SHARD_DATABASE_URLS is set. set-role grants or takes away instructor/admin rights; it applies to
+tokens issued after the change.
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import delete, select, union, update
+
+from database import SessionLocal, engine, Base, shard_directory, shard_session, user_data_engines
+
+from py_models.signin_models import User
+from py_models.quiz_models import Quiz, QuizArchiveSummary
+from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+from py_models.analytics_models import CourseUserFurthest, CourseFunnel
+from py_models.event_models import LearningEvent
+from py_models.cohort_models import CohortMember
+
+from jobs import job_queue
+
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+
+# (table, primary key column) for every per-user table, purged in this order
+PURGE_TABLES = [
+    (LearningEvent.__table__, LearningEvent.__table__.c.event_id),
+    (Quiz.__table__, Quiz.__table__.c.result_id),
+    (CourseVideoProgress.__table__, CourseVideoProgress.__table__.c.id),
+    (QuizPartialProgress.__table__, QuizPartialProgress.__table__.c.id),
+]
+
+
+def active_users():
+    """Criterion that hides soft-deleted accounts."""
+    return User.user_deleted_at.is_(None)
+
+
+def _purge_derived(db, user_id, memberships=True):
+    # The user no longer counts towards the funnel indexes they reached
+    for course_id, furthest in db.execute(
+        select(CourseUserFurthest.course_id, CourseUserFurthest.furthest_index)
+        .where(CourseUserFurthest.user_id == user_id)
+    ).all():
+        db.execute(
+            update(CourseFunnel)
+            .where(CourseFunnel.course_id == course_id, CourseFunnel.video_index <= furthest)
+            .values(users_reached=CourseFunnel.users_reached - 1)
+        )
+    db.execute(delete(CourseUserFurthest).where(CourseUserFurthest.user_id == user_id))
+    db.execute(delete(QuizArchiveSummary).where(QuizArchiveSummary.user_id == user_id))
+    if memberships:
+        db.execute(delete(CohortMember).where(CohortMember.user_id == user_id))
+    db.commit()
+
+
+def purge_rows(db, user_id, batch_size=PURGE_BATCH_SIZE, memberships=True):
+    """Delete a user's progress rows, one committed batch at a time."""
+    total = 0
+    for table, pk in PURGE_TABLES:
+        while True:
+            batch = select(pk).where(table.c.user_id == user_id).limit(batch_size)
+            deleted = db.execute(delete(table).where(pk.in_(batch))).rowcount
+            db.commit()
+            total += deleted
+            if deleted < batch_size:
+                break
+    _purge_derived(db, user_id, memberships)
+    return total
+
+
+@job_queue.register("accounts.purge_user")
+def purge_user(db, user_id):
+    """Background half of delete_user; safe to retry."""
+    purge_rows(db, user_id)
+    db.execute(delete(User).where(User.user_id == user_id, User.user_deleted_at.is_not(None)))
+
+
+def orphaned_user_ids(db):
+    """Users referenced by progress rows that no longer exist, plus soft-deleted ones."""
+    referenced = union(*[
+        select(table.c.user_id).where(table.c.user_id.is_not(None)) for table, _ in PURGE_TABLES
+    ]).subquery()
+    missing = db.scalars(
+        select(referenced.c.user_id)
+        .outerjoin(User, User.user_id == referenced.c.user_id)
+        .where(User.user_id.is_(None))
+    ).all()
+    deleted = db.scalars(select(User.user_id).where(User.user_deleted_at.is_not(None))).all()
+    return missing, deleted
+
+
+def sweep_orphans(batch_size=PURGE_BATCH_SIZE, bind=engine):
+    db = SessionLocal(bind=bind)
+    try:
+        missing, deleted = orphaned_user_ids(db)
+        total = 0
+        for user_id in missing:
+            total += purge_rows(db, user_id, batch_size)
+        for user_id in deleted:
+            total += purge_rows(db, user_id, batch_size)
+            db.execute(delete(User).where(User.user_id == user_id))
+            db.commit()
+        print(f"Purged {total} rows for {len(missing)} missing and {len(deleted)} deleted users",
+              file=sys.stderr)
+        return total
+    finally:
+        db.close()
+
+
+def set_role(user_id, role):
+    db = shard_session(user_id) if shard_directory is not None else SessionLocal()
+    try:
+        updated = db.execute(
+            update(User).where(User.user_id == user_id, active_users()).values(user_role=role)
+        ).rowcount
+        db.commit()
+    finally:
+        db.close()
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SkillNest account maintenance")
+    parser.add_argument("command", choices=["sweep-orphans", "set-role"])
+    parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    parser.add_argument("--user", type=int, help="set-role: the account")
+    parser.add_argument("--role", choices=["student", "instructor", "admin"], help="set-role: the new role")
+    args = parser.parse_args()
+
+    for bind in user_data_engines():
+        Base.metadata.create_all(bind=bind)
+    if args.command == "set-role":
+        if args.user is None or args.role is None:
+            parser.error("set-role needs --user and --role")
+        if not set_role(args.user, args.role):
+            sys.exit(f"No active user {args.user}")
+    else:
+        for bind in user_data_engines():
+            sweep_orphans(args.batch_size, bind)
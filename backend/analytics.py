@@ -0,0 +1,211 @@
+"""Course completion funnel rollups and time-range activity queries.
+
+A user has "reached" video index i of a course once they have watched any
+video at index >= i. course_user_furthest keeps each user's furthest index
+per course and course_funnel keeps the per-index user counts, so serving a
+funnel is a single indexed range read.
+
+    python analytics.py rebuild      # recompute both rollups from raw progress
+
+Rollups are per shard (they count the shard's own users); the endpoints
+sum them with merge_counts/merge_series, and rebuild runs on every shard.
+"""
+import datetime
+import sys
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, select, update
+
+from database import SessionLocal, engine, Base, user_data_engines
+
+from py_models.signin_models import User
+from py_models.quiz_models import Quiz, QuizArchiveDaily
+from py_models.progress_models import CourseVideoProgress
+from py_models.analytics_models import CourseUserFurthest, CourseFunnel
+
+from jobs import job_queue
+
+
+@job_queue.register("analytics.record_video")
+def record_video(db, user_id, course_id, video_index):
+    """Advance the rollups for one mark_video write; caller commits."""
+    if user_id is None or video_index is None or video_index < 0:
+        return
+    # A job queued before delete_user must not count the user again after
+    # the purge; the row lock orders it before or after the soft delete
+    if db.scalar(select(User.user_id).where(
+        User.user_id == user_id, User.user_deleted_at.is_(None)
+    ).with_for_update()) is None:
+        return
+    furthest = db.get(CourseUserFurthest, (user_id, course_id), with_for_update=True)
+    if furthest is None:
+        previous = -1
+        db.add(CourseUserFurthest(user_id=user_id, course_id=course_id, furthest_index=video_index))
+    elif video_index > furthest.furthest_index:
+        previous = furthest.furthest_index
+        furthest.furthest_index = video_index
+    else:
+        return
+
+    # The user newly reached every index in (previous, video_index]
+    low = previous + 1
+    db.execute(
+        update(CourseFunnel)
+        .where(
+            CourseFunnel.course_id == course_id,
+            CourseFunnel.video_index.between(low, video_index),
+        )
+        .values(users_reached=CourseFunnel.users_reached + 1)
+    )
+    existing = set(db.scalars(
+        select(CourseFunnel.video_index).where(
+            CourseFunnel.course_id == course_id,
+            CourseFunnel.video_index.between(low, video_index),
+        )
+    ))
+    missing = [
+        {"course_id": course_id, "video_index": i, "users_reached": 1}
+        for i in range(low, video_index + 1)
+        if i not in existing
+    ]
+    if missing:
+        db.execute(insert(CourseFunnel), missing)
+
+
+def funnel_counts(db, course_id):
+    """{video_index: users_reached} from one database's rollup."""
+    return dict(db.execute(
+        select(CourseFunnel.video_index, CourseFunnel.users_reached)
+        .where(CourseFunnel.course_id == course_id)
+    ).all())
+
+
+def format_funnel(counts):
+    indexes = sorted(counts)
+    started = counts[indexes[0]] if indexes else 0
+    return [
+        {
+            "video_index": index,
+            "users_reached": counts[index],
+            "percent_of_start": round(100 * counts[index] / started, 1) if started else 0,
+        }
+        for index in indexes
+    ]
+
+
+def course_funnel(db, course_id):
+    return format_funnel(funnel_counts(db, course_id))
+
+
+def merge_counts(results):
+    """Sum {key: count} dicts from several shards."""
+    total = defaultdict(int)
+    for counts in results:
+        for key, count in counts.items():
+            total[key] += count
+    return dict(total)
+
+
+def merge_series(results, key, value):
+    """Sum [{key: k, value: n}, ...] series from several shards, ordered by key."""
+    total = merge_counts({row[key]: row[value] for row in rows} for rows in results)
+    return [{key: k, value: total[k]} for k in sorted(total)]
+
+
+def rebuild(db):
+    db.execute(delete(CourseFunnel))
+    db.execute(delete(CourseUserFurthest))
+    db.execute(
+        insert(CourseUserFurthest).from_select(
+            ["user_id", "course_id", "furthest_index"],
+            select(
+                CourseVideoProgress.user_id,
+                CourseVideoProgress.course_id,
+                func.max(CourseVideoProgress.video_index),
+            )
+            .where(
+                CourseVideoProgress.user_id.isnot(None),
+                CourseVideoProgress.course_id.isnot(None),
+                CourseVideoProgress.video_index >= 0,
+            )
+            .group_by(CourseVideoProgress.user_id, CourseVideoProgress.course_id)
+        )
+    )
+
+    # Users whose furthest index is exactly i, turned into "reached >= i"
+    ending_at = defaultdict(dict)
+    for course_id, index, users in db.execute(
+        select(CourseUserFurthest.course_id, CourseUserFurthest.furthest_index, func.count())
+        .group_by(CourseUserFurthest.course_id, CourseUserFurthest.furthest_index)
+    ):
+        ending_at[course_id][index] = users
+
+    rows = []
+    for course_id, counts in ending_at.items():
+        reached = 0
+        for index in range(max(counts), -1, -1):
+            reached += counts.get(index, 0)
+            rows.append({"course_id": course_id, "video_index": index, "users_reached": reached})
+    if rows:
+        db.execute(insert(CourseFunnel), rows)
+    db.commit()
+    return len(rows)
+
+
+def _day_range(start, end):
+    # Half-open [start, end + 1 day) so the indexed column is compared directly
+    return (
+        datetime.datetime.combine(start, datetime.time.min),
+        datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min),
+    )
+
+
+def attempts_per_day(db, start, end, quiz_id=None):
+    low, high = _day_range(start, end)
+    day = func.date(Quiz.attempted_at)
+    live = (
+        select(day.label("day"), func.count().label("attempts"))
+        .where(Quiz.attempted_at >= low, Quiz.attempted_at < high)
+        .group_by(day)
+    )
+    # Days whose attempts were archived are kept as daily counts
+    archived = select(QuizArchiveDaily.day, QuizArchiveDaily.attempts).where(
+        QuizArchiveDaily.day >= start, QuizArchiveDaily.day <= end
+    )
+    if quiz_id is not None:
+        live = live.where(Quiz.quiz_id == quiz_id)
+        archived = archived.where(QuizArchiveDaily.quiz_id == quiz_id)
+    both = live.union_all(archived).subquery()
+    query = (
+        select(both.c.day, func.sum(both.c.attempts).label("attempts"))
+        .group_by(both.c.day)
+        .order_by(both.c.day)
+    )
+    return [{"day": str(r.day), "attempts": r.attempts} for r in db.execute(query)]
+
+
+def signups_per_month(db, start, end):
+    low, high = _day_range(start, end)
+    if db.bind.dialect.name == "postgresql":
+        month = func.to_char(func.date_trunc("month", User.user_registered_at), "YYYY-MM")
+    else:
+        month = func.strftime("%Y-%m", User.user_registered_at)
+    query = (
+        select(month.label("month"), func.count().label("signups"))
+        .where(User.user_registered_at >= low, User.user_registered_at < high)
+        .group_by(month)
+        .order_by(month)
+    )
+    return [{"month": r.month, "signups": r.signups} for r in db.execute(query)]
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python analytics.py rebuild")
+    for bind in user_data_engines():
+        Base.metadata.create_all(bind=bind)
+        db = SessionLocal(bind=bind)
+        try:
+            print(f"Rebuilt course funnel: {rebuild(db)} rows")
+        finally:
+            db.close()
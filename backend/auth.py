@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+from fastapi import HTTPException, Request
+
+from rate_limit import request_user_id
+from cache_bus import bus
+
+# --------------------------------------------------
+# SIGNED SESSION TOKENS
+# --------------------------------------------------
+# "<base64url(claims)>.<base64url(hmac-sha256)>". Verification is pure CPU:
+# no database lookup, only a check against the in-memory denylist of
+# revoked token ids and of users whose earlier tokens were all revoked
+# (deleted accounts). Without SESSION_SECRET every process signs with its
+# own random key, so tokens stop working across restarts and workers.
+SECRET = os.getenv("SESSION_SECRET", "").encode() or secrets.token_bytes(32)
+TOKEN_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+# Per-user routes need a token. AUTH_REQUIRED=0 opts out (trusted local
+# setups only): requests without a token may then act as any user
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "1") != "0"
+# Roles allowed to see other users' data (cohorts); set with accounts.py set-role
+STAFF_ROLES = ("instructor", "admin")
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+class Denylist:
+    """Revoked token ids and users, kept only until their tokens would have expired anyway."""
+
+    def __init__(self):
+        self._revoked = {}   # jti -> exp
+        self._users = {}     # user_id -> tokens issued at or before this are revoked
+        self._lock = threading.Lock()
+
+    def revoke(self, jti, exp):
+        now = time.time()
+        with self._lock:
+            if len(self._revoked) > 10_000:
+                for key, until in list(self._revoked.items()):
+                    if until <= now:
+                        del self._revoked[key]
+            self._revoked[jti] = exp
+
+    def revoke_user(self, user_id, issued_before):
+        oldest = time.time() - TOKEN_TTL_SECONDS
+        with self._lock:
+            if len(self._users) > 10_000:
+                for key, at in list(self._users.items()):
+                    if at <= oldest:
+                        del self._users[key]
+            self._users[user_id] = issued_before
+
+    def __contains__(self, claims):
+        return claims["jti"] in self._revoked or claims["iat"] <= self._users.get(claims["sub"], -1)
+
+
+denylist = Denylist()
+bus.on("session_denylist", lambda key: denylist.revoke(key["jti"], key["exp"]))
+bus.on("session_user_revoked", lambda key: denylist.revoke_user(key["user_id"], key["issued_before"]))
+
+
+def issue_token(user):
+    now = int(time.time())
+    claims = {
+        "sub": user.user_id,
+        "name": user.user_name,
+        "email": user.user_email,
+        "role": user.user_role or "student",
+        "iat": now,
+        "exp": now + TOKEN_TTL_SECONDS,
+        "jti": secrets.token_urlsafe(12),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_token(token):
+    try:
+        payload, signature = token.split(".", 1)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Malformed token")
+    # Bytes, because compare_digest raises TypeError on non-ASCII str
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    claims = json.loads(_b64decode(payload))
+    if claims["exp"] <= time.time():
+        raise HTTPException(status_code=401, detail="Token expired")
+    if claims in denylist:
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return claims
+
+
+def revoke_token(claims):
+    denylist.revoke(claims["jti"], claims["exp"])
+    bus.broadcast("session_denylist", {"jti": claims["jti"], "exp": claims["exp"]})
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every token issued to user_id so far, e.g. when the account is deleted."""
+    issued_before = int(time.time())   # iat has whole seconds
+    denylist.revoke_user(user_id, issued_before)
+    bus.broadcast("session_user_revoked", {"user_id": user_id, "issued_before": issued_before})
+
+
+def _bearer(request):
+    header = request.headers.get("authorization", "")
+    if header[:7].lower() == "bearer ":
+        return header[7:].strip()
+    # EventSource cannot set headers, so streams pass the token in the query
+    return request.query_params.get("access_token")
+
+
+def current_session(request: Request):
+    token = _bearer(request)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    claims = verify_token(token)
+    if getattr(request.state, "user_id", None) is None:
+        # Lets get_db pick the token owner's shard
+        request.state.user_id = claims["sub"]
+    return claims
+
+
+def optional_session(request: Request):
+    # Claims when a token was sent; None in open mode (AUTH_REQUIRED=0)
+    token = _bearer(request)
+    if token is None:
+        if AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return None
+    return verify_token(token)
+
+
+def staff_session(request: Request):
+    # Claims of an instructor or admin; None in open mode without a token
+    claims = optional_session(request)
+    if claims is not None and claims.get("role") not in STAFF_ROLES:
+        raise HTTPException(status_code=403, detail="Instructors only")
+    return claims
+
+
+async def user_guard(request: Request):
+    # A token may only act on its own user_id (path or JSON body)
+    token = _bearer(request)
+    if token is None:
+        if AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return
+    claims = verify_token(token)
+    user_id = getattr(request.state, "user_id", None)
+    if user_id is None:
+        user_id = await request_user_id(request)
+    if user_id is not None and user_id != claims["sub"]:
+        raise HTTPException(status_code=403, detail="Token does not match user")
+    request.state.session = claims
@@ -0,0 +1,161 @@
+"""Classroom load test: N students taking a quiz at the same time.
+
+Every student saves partial progress after each question, submits the quiz
+and reads their progress back, over keep-alive HTTP connections. Without
+--url the app is started under uvicorn against DATABASE_URL, so the same
+run compares backends:
+
+    DATABASE_URL=sqlite:///bench.db python benchmarks/classroom.py
+    DATABASE_URL=sqlite:///bench.db SQLITE_TUNING=0 python benchmarks/classroom.py
+    DATABASE_URL=postgresql+psycopg2://... python benchmarks/classroom.py
+
+Students log in first and send their session token, as the frontend does.
+Reports throughput, latency percentiles and failed requests by status.
+Single runs on a busy box vary by 10-20%, so alternate the modes over a
+few runs before comparing them.
+"""
+import argparse
+import collections
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+
+class Client:
+    def __init__(self, base_url, token=None):
+        parts = urlsplit(base_url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+        self.token = token
+
+    def request(self, method, path, body=None):
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload else {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, payload, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            data, status = b"", 0
+        return status, data, time.perf_counter() - started
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers):
+    port = _free_port()
+    # Workers must share SESSION_SECRET or tokens only verify on the worker that issued them
+    env = dict(os.environ, RATE_LIMIT_ENABLED="0")
+    env.setdefault("SESSION_SECRET", uuid.uuid4().hex)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if Client(url).request("GET", "/health")[0] == 200:
+                return server, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+def create_students(url, count):
+    """[(user_id, session token)] for `count` new students."""
+    client = Client(url)
+    run = uuid.uuid4().hex[:8]
+    students = []
+    for i in range(count):
+        email = f"{run}-{i}@bench.example"
+        client.request("POST", "/create_user", {
+            "user_name": f"student{i}", "user_email": email, "user_password": "pw",
+            "user_dateofbirth": "2010-01-01", "user_phone": "0", "user_gender": "x",
+        })
+        login = json.loads(client.request("POST", "/login", {"user_email": email, "user_password": "pw"})[1])
+        students.append((login["user"]["user_id"], login["token"]))
+    return students
+
+
+def take_quiz(url, user_id, token, questions, quiz_id, results):
+    client = Client(url, token)
+    for question in range(questions):
+        results.append(("save_partial", *client.request("POST", "/progress/quiz/partial", {
+            "user_id": user_id, "quiz_id": quiz_id, "current_index": question, "score": question // 2,
+        })[::2]))
+    results.append(("submit", *client.request("POST", "/create_quiz", {
+        "user_id": user_id, "quiz_id": quiz_id, "score": questions // 2, "attempt_date": "2026-01-01",
+    })[::2]))
+    results.append(("read_progress", *client.request("GET", f"/progress/quiz/{user_id}")[::2]))
+    results.append(("read_partial", *client.request("GET", f"/progress/quiz/partial/{user_id}")[::2]))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def run(url, students, questions):
+    roster = create_students(url, students)
+    quiz_id = f"bench-{uuid.uuid4().hex[:6]}"
+    results = []
+    threads = [threading.Thread(target=take_quiz, args=(url, user_id, token, questions, quiz_id, results))
+               for user_id, token in roster]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(roster)} students x {questions} questions: {len(results)} requests "
+          f"in {elapsed:.2f}s = {len(results) / elapsed:.0f} req/s")
+    print(f"{'request':<16}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  failures")
+    by_kind = collections.defaultdict(list)
+    for kind, status, seconds in results:
+        by_kind[kind].append((status, seconds))
+    for kind, samples in by_kind.items():
+        latencies = [seconds * 1000 for _, seconds in samples]
+        failures = collections.Counter(status for status, _ in samples if not 200 <= status < 300)
+        print(f"{kind:<16}{len(samples):>7}{percentile(latencies, 50):>9.1f}"
+              f"{percentile(latencies, 95):>9.1f}{percentile(latencies, 99):>9.1f}  {dict(failures) or '-'}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent quiz-takers against the API")
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when starting the app")
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_server(args.workers)
+    try:
+        run(url, args.students, args.questions)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
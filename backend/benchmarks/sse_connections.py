@@ -0,0 +1,83 @@
+"""Concurrent connection capacity of the progress push stream.
+
+Runs the app under uvicorn in this process, opens N Server-Sent Events
+connections spread over U users, then publishes one message per user and
+measures how long it takes for every connection to receive it.
+
+    DATABASE_URL=sqlite:///bench.db python benchmarks/sse_connections.py --connections 2000 --users 500
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+
+from main import app
+from pubsub import hub
+
+
+def start_server(port):
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", limit_concurrency=None)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def listen(client, user_id, ready, received):
+    async with client.stream("GET", f"/progress/stream/{user_id}") as response:
+        ready.release()
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                received.append(time.perf_counter())
+                return
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=None) as client:
+        ready = asyncio.Semaphore(0)
+        received = []
+        started = time.perf_counter()
+        tasks = [
+            asyncio.create_task(listen(client, i % args.users + 1, ready, received))
+            for i in range(args.connections)
+        ]
+        for _ in range(args.connections):
+            await ready.acquire()
+        while hub.connections < args.connections:
+            await asyncio.sleep(0.01)
+        connect_time = time.perf_counter() - started
+
+        published = time.perf_counter()
+        for user_id in range(1, args.users + 1):
+            hub.publish(user_id, {"type": "benchmark", "subject_id": "bench", "position": 0, "score": 0})
+        await asyncio.gather(*tasks)
+        last = max(received) - published
+
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"connections:        {args.connections} ({args.users} users)")
+    print(f"connect all:        {connect_time:.2f}s")
+    print(f"fan-out (last msg): {last * 1000:.1f} ms")
+    print(f"peak RSS:           {rss_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=250)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.connections * 2 + 256)), hard))
+    start_server(args.port)
+    asyncio.run(run(args))
@@ -0,0 +1,89 @@
+"""Hot-path statement registry against the db.query forms it replaced.
+
+Times each registered statement in statements.py next to the equivalent
+db.query(...) call, in CPU microseconds per call, on one session:
+
+    DATABASE_URL=sqlite:// python benchmarks/statement_registry.py [--n 5000] [--url sqlite://]
+
+DATABASE_URL is only needed to import the models; --url is the database
+the paths run against (default: in-memory SQLite).
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from accounts import active_users
+from database import Base
+from statements import statement
+
+from py_models.signin_models import User, email_key
+from py_models.progress_models import QuizPartialProgress
+
+
+def bench_paths(db):
+    """(name, old db.query path, registry path) for each hot statement."""
+    return [
+        (
+            "login",
+            lambda: db.query(User).filter(
+                email_key == "bench@example.com", User.user_password == "secret", active_users()
+            ).first(),
+            lambda: db.scalars(statement(db, "login"), {"email": "bench@example.com", "password": "secret"}).first(),
+        ),
+        (
+            "user_by_id",
+            lambda: db.query(User).filter(User.user_id == 1, active_users()).first(),
+            lambda: db.scalars(statement(db, "user_by_id"), {"user_id": 1}).first(),
+        ),
+        (
+            "partial_progress",
+            lambda: db.query(QuizPartialProgress).filter(QuizPartialProgress.user_id == 1).all(),
+            lambda: db.scalars(statement(db, "partial_progress"), {"user_id": 1}).all(),
+        ),
+        (
+            "partial_progress_row",
+            lambda: db.query(QuizPartialProgress).filter(
+                QuizPartialProgress.user_id == 1, QuizPartialProgress.quiz_id == "python"
+            ).first(),
+            lambda: db.scalars(statement(db, "partial_progress_row"), {"user_id": 1, "quiz_id": "python"}).first(),
+        ),
+    ]
+
+
+def bench(url="sqlite://", n=5000):
+    bench_engine = create_engine(url)
+    Base.metadata.create_all(bind=bench_engine)
+    results = []
+    with Session(bench_engine) as db:
+        if db.get(User, 1) is None:
+            db.add(User(user_id=1, user_name="bench", user_email="bench@example.com", user_password="secret"))
+            db.add(QuizPartialProgress(user_id=1, quiz_id="python", current_index=3, score=2))
+            db.commit()
+        for name, old, new in bench_paths(db):
+            timings = []
+            for path in (old, new):
+                for _ in range(50):
+                    path()
+                started = time.process_time()
+                for _ in range(n):
+                    path()
+                    db.expunge_all()
+                timings.append((time.process_time() - started) / n * 1e6)
+            results.append((name, *timings))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hot-path statement registry")
+    parser.add_argument("--n", type=int, default=5000, help="calls per path")
+    parser.add_argument("--url", default="sqlite://", help="database to run against (default: in-memory SQLite)")
+    args = parser.parse_args()
+    print(f"{'statement':<22}{'db.query us':>14}{'registry us':>14}{'saved':>8}")
+    for name, old, new in bench(args.url, args.n):
+        print(f"{name:<22}{old:>14.1f}{new:>14.1f}{(old - new) / old:>8.0%}")
@@ -0,0 +1,263 @@
+"""Streaming bulk import/export for users and progress tables.
+
+    python bulk_io.py import users cohort.csv
+    python bulk_io.py import course_video_progress progress.ndjson --chunk-size 10000
+    python bulk_io.py export quizz attempts.csv
+    python bulk_io.py export users -            # NDJSON to stdout
+
+Rows are read and written one chunk at a time, so memory stays flat no
+matter how large the file is. Imports commit once per chunk and use COPY
+on Postgres (psycopg2) and executemany everywhere else. Progress and quiz
+rows are appended to learning_events in the same transaction, so `python
+events.py replay` rebuilds them like any other progress. A chunk that hits
+a constraint (a duplicate email, say) is retried row by row and only the
+offending rows are skipped. Rows may carry their own ids (user_id, say); the
+Postgres id sequences are moved past them afterwards. Exports leave out
+user_password.
+
+Run `python analytics.py rebuild` after importing course_video_progress
+so the funnel rollups include the imported rows.
+
+With SHARD_DATABASE_URLS set, exports read every shard in turn. Imports are
+refused: users need ids and directory entries from shards.py first.
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import sys
+
+from sqlalchemy import DateTime, Integer, select, text
+from sqlalchemy.exc import IntegrityError
+
+from database import engine, Base, shard_engines, user_data_engines
+
+from py_models.signin_models import User, normalize_email
+from py_models.quiz_models import Quiz
+from py_models.progress_models import CourseVideoProgress
+from py_models.event_models import LearningEvent
+
+import events
+
+from timestamps import utcnow, parse_attempt_date, parse_month_year
+
+TABLES = {
+    model.__tablename__: model.__table__
+    for model in (User, CourseVideoProgress, Quiz)
+}
+# Never leaves the database through an export
+EXPORT_EXCLUDED = {"users": {"user_password"}}
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return "csv" if path.endswith(".csv") else "ndjson"
+
+
+def read_rows(stream, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def coerce(table, row):
+    # CSV gives strings for everything; unknown keys are dropped
+    out = {}
+    for name, value in row.items():
+        column = table.columns.get(name)
+        if column is None:
+            continue
+        if value == "" or value is None:
+            value = None
+        elif isinstance(column.type, Integer):
+            value = int(value)
+        elif isinstance(column.type, DateTime):
+            value = parse_attempt_date(value)
+        out[name] = value
+    if table.name == "users":
+        out["user_email"] = normalize_email(out.get("user_email"))
+        if not out.get("user_created_at"):
+            out["user_created_at"] = datetime.datetime.now().strftime("%B %Y")
+        if not out.get("user_registered_at"):
+            out["user_registered_at"] = parse_month_year(out["user_created_at"]) or utcnow()
+    if table.name == "quizz" and not out.get("attempted_at"):
+        out["attempted_at"] = parse_attempt_date(out.get("attempt_date"))
+    return out
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def copy_chunk(conn, table, chunk):
+    columns = list(chunk[0].keys())
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in chunk:
+        writer.writerow(["" if row.get(c) is None else row.get(c) for c in columns])
+    buf.seek(0)
+    import psycopg2
+
+    sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buf)
+    except psycopg2.IntegrityError as e:
+        # The raw cursor bypasses SQLAlchemy's wrapping; callers retry row by row on IntegrityError
+        raise IntegrityError(sql, None, e) from e
+    finally:
+        cursor.close()
+
+
+def sync_sequences(table):
+    """Move Postgres id sequences past ids the import supplied itself."""
+    if engine.dialect.name != "postgresql":
+        return   # SQLite picks max(rowid) + 1 by itself
+    for column in table.primary_key.columns:
+        if not column.autoincrement or not isinstance(column.type, Integer):
+            continue
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', '{column.name}'), "
+                f"COALESCE(MAX({column.name}), 0) + 1, false) FROM {table.name}"
+            ))
+
+
+def event_rows(table, rows):
+    """learning_events rows matching imported progress, so replay keeps them."""
+    if table.name == CourseVideoProgress.__tablename__:
+        now = utcnow()
+        return [
+            {"user_id": r.get("user_id"), "event_type": events.VIDEO_WATCHED, "subject_id": r.get("course_id"),
+             "position": r.get("video_index"), "score": None, "occurred_at": now}
+            for r in rows
+        ]
+    if table.name == Quiz.__tablename__:
+        return [
+            {"user_id": r.get("user_id"), "event_type": events.QUIZ_COMPLETED, "subject_id": r.get("quiz_id"),
+             "position": None, "score": r.get("score"), "occurred_at": r.get("attempted_at")}
+            for r in rows
+        ]
+    return []
+
+
+def write_rows(conn, table, rows, use_copy):
+    # COPY needs one column list per statement; group rows by their keys
+    by_columns = {}
+    for row in rows:
+        by_columns.setdefault(tuple(row.keys()), []).append(row)
+    groups = [(table, group) for group in by_columns.values()]
+    logged = event_rows(table, rows)
+    if logged:
+        groups.append((LearningEvent.__table__, logged))
+    for target, group in groups:
+        if use_copy:
+            copy_chunk(conn, target, group)
+        else:
+            conn.execute(target.insert(), group)
+
+
+def write_one_by_one(table, rows):
+    """Write rows in savepoints of their own; returns how many were written."""
+    written = 0
+    with engine.begin() as conn:
+        for row in rows:
+            try:
+                with conn.begin_nested():
+                    write_rows(conn, table, [row], use_copy=False)
+                written += 1
+            except IntegrityError as e:
+                print(f"{table.name}: skipped {row}: {e.orig}", file=sys.stderr)
+    return written
+
+
+def import_rows(table, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+    total = skipped = 0
+    for chunk in chunked((coerce(table, row) for row in rows), chunk_size):
+        try:
+            with engine.begin() as conn:
+                write_rows(conn, table, chunk, use_copy)
+            written = len(chunk)
+        except IntegrityError:
+            written = write_one_by_one(table, chunk)
+        total += written
+        skipped += len(chunk) - written
+        print(f"{table.name}: {total} rows imported, {skipped} skipped", file=sys.stderr)
+    # Otherwise the next signup or attempt is handed an id the import already used
+    sync_sequences(table)
+    return total
+
+
+def export_rows(table, stream, fmt, chunk_size=DEFAULT_CHUNK_SIZE, binds=None):
+    excluded = EXPORT_EXCLUDED.get(table.name, set())
+    selected = [c for c in table.columns if c.name not in excluded]
+    columns = [c.name for c in selected]
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+
+    total = 0
+    for bind in binds or [engine]:
+        with bind.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                select(*selected).order_by(*table.primary_key.columns)
+            )
+            for partition in result.partitions():
+                for row in partition:
+                    if writer is not None:
+                        writer.writerow(row)
+                    else:
+                        stream.write(json.dumps(dict(zip(columns, row)), default=str) + "\n")
+                total += len(partition)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export SkillNest tables")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("path", help="file path, or - for stdin/stdout")
+    parser.add_argument("--format", choices=["csv", "ndjson"])
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    table = TABLES[args.table]
+    fmt = detect_format(args.path, args.format)
+
+    if args.command == "import":
+        if shard_engines:
+            sys.exit("Imports are not supported with SHARD_DATABASE_URLS set")
+        Base.metadata.create_all(bind=engine)
+        if args.path == "-":
+            count = import_rows(table, read_rows(sys.stdin, fmt), args.chunk_size)
+        else:
+            with open(args.path, newline="", encoding="utf-8") as f:
+                count = import_rows(table, read_rows(f, fmt), args.chunk_size)
+        print(f"Imported {count} rows into {table.name}", file=sys.stderr)
+    else:
+        if args.path == "-":
+            count = export_rows(table, sys.stdout, fmt, args.chunk_size, user_data_engines())
+        else:
+            with open(args.path, "w", newline="", encoding="utf-8") as f:
+                count = export_rows(table, f, fmt, args.chunk_size, user_data_engines())
+        print(f"Exported {count} rows from {table.name}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
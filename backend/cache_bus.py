@@ -0,0 +1,199 @@
+import glob
+import json
+import logging
+import os
+import select
+import socket
+import threading
+from collections import defaultdict
+
+# --------------------------------------------------
+# CROSS-PROCESS CACHE INVALIDATION
+# --------------------------------------------------
+# Each worker keeps its own caches (user versions, catalog search index,
+# session denylist). When one worker changes the underlying data it updates
+# its own cache directly and broadcast()s a message; every *other* process
+# runs the handlers registered with on(). CACHE_BUS picks the transport:
+#   local     single process, broadcast is a no-op (default)
+#   unix      datagram sockets in CACHE_BUS_DIR, one per process (one box)
+#   postgres  LISTEN/NOTIFY on the primary database (any number of boxes)
+CACHE_BUS = os.getenv("CACHE_BUS", "local")
+CACHE_BUS_DIR = os.getenv("CACHE_BUS_DIR", "/tmp/skillnest-cache-bus")
+CHANNEL = "skillnest_cache"
+# Backoff between attempts to re-establish a dropped LISTEN connection
+RECONNECT_MIN_SECONDS = 0.5
+RECONNECT_MAX_SECONDS = 30.0
+
+logger = logging.getLogger("skillnest.cache_bus")
+
+
+class CacheBus:
+    def __init__(self):
+        self._handlers = defaultdict(list)
+        self.origin = None
+        self.sent = 0
+        self.received = 0
+
+    def on(self, cache, handler):
+        self._handlers[cache].append(handler)
+
+    def start(self):
+        # Called in each worker after fork, so the origin is the worker's pid
+        self.origin = os.getpid()
+
+    def stop(self):
+        pass
+
+    def broadcast(self, cache, key=None):
+        message = json.dumps({"cache": cache, "key": key, "origin": self.origin or os.getpid()})
+        self.sent += 1
+        self._send(message)
+
+    def _send(self, message):
+        pass
+
+    def _dispatch(self, raw):
+        message = json.loads(raw)
+        if message.get("origin") == self.origin:
+            return
+        self.received += 1
+        for handler in self._handlers.get(message["cache"], ()):
+            try:
+                handler(message.get("key"))
+            except Exception:
+                logger.exception("Cache invalidation handler failed for %s", message["cache"])
+
+    def stats(self):
+        return {"transport": CACHE_BUS, "sent": self.sent, "received": self.received}
+
+
+class UnixSocketBus(CacheBus):
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self._sock = None
+        self._path = None
+
+    def start(self):
+        super().start()
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(self.directory, f"{self.origin}.sock")
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self._path)
+        threading.Thread(target=self._listen, name="cache-bus", daemon=True).start()
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._path and os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def _listen(self):
+        sock = self._sock
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                return
+            self._dispatch(data.decode())
+
+    def _send(self, message):
+        data = message.encode()
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for path in glob.glob(os.path.join(self.directory, "*.sock")):
+                if path == self._path:
+                    continue
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a worker that died without cleaning up
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                except OSError:
+                    logger.warning("Cache bus could not reach %s", path)
+        finally:
+            sender.close()
+
+
+class PostgresBus(CacheBus):
+    def __init__(self, url):
+        super().__init__()
+        # psycopg2 accepts libpq URIs, not SQLAlchemy driver names
+        self._dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self._stop = threading.Event()
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self._dsn)
+        conn.autocommit = True
+        return conn
+
+    def start(self):
+        super().start()
+        self._stop.clear()
+        threading.Thread(target=self._listen, name="cache-bus", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self):
+        # A dedicated connection outside the request pool. A dropped one is
+        # replaced with backoff; the thread only ends on stop()
+        delay, failed = RECONNECT_MIN_SECONDS, False
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                if failed:
+                    # Invalidations sent while it was down were missed
+                    logger.warning("Cache bus LISTEN connection re-established")
+                delay, failed = RECONNECT_MIN_SECONDS, False
+                self._receive(conn)
+            except Exception:
+                failed = True
+                logger.warning("Cache bus LISTEN connection failed; reconnecting in %.1fs", delay, exc_info=True)
+            finally:
+                if conn is not None:
+                    conn.close()
+            if self._stop.wait(delay):
+                return
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    def _receive(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                self._dispatch(conn.notifies.pop(0).payload)
+
+    def _send(self, message):
+        with self._publish_lock:
+            if self._publisher is None or self._publisher.closed:
+                self._publisher = self._connect()
+            with self._publisher.cursor() as cur:
+                cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, message))
+
+
+def _bus_from_env():
+    if CACHE_BUS == "unix":
+        return UnixSocketBus(CACHE_BUS_DIR)
+    if CACHE_BUS == "postgres":
+        from database import engine
+
+        return PostgresBus(engine.url)
+    return CacheBus()
+
+
+bus = _bus_from_env()
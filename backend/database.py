@@ -1,22 +1,215 @@
+import collections
+import math
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
+from tracing import tracer
+
 # Load .env for LOCAL development only (Vercel ignores this)
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read replica; GET requests are served from it when set
+READ_REPLICA_URL = os.getenv("READ_REPLICA_URL")
+# After a user's own write, their reads stay on the primary this long
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# A frontend on another site (CORS_ORIGINS, see main.py) only sends SameSite=None cookies
+CROSS_SITE_COOKIE = bool(os.getenv("CORS_ORIGINS", "").strip())
 
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL not set")
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=1,        # CRITICAL for serverless
-    max_overflow=0,     # CRITICAL for serverless
-)
+# Seconds a request may wait for the pooled connection before it is shed
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "3"))
+# psycopg 3 prepares a statement server-side after it has run this many times
+# on a connection; "none" turns that off (e.g. behind PgBouncer in transaction
+# mode). psycopg2 has no server-side prepared statements.
+_threshold = os.getenv("DB_PREPARE_THRESHOLD", "2")
+PREPARE_THRESHOLD = None if _threshold.lower() == "none" else int(_threshold)
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that counts callers currently blocked waiting for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    def _do_get(self):
+        with self._waiting_lock:
+            self.waiting += 1
+        try:
+            with tracer.span("db.pool.checkout", **{"db.pool.waiting": self.waiting}):
+                return super()._do_get()
+        finally:
+            with self._waiting_lock:
+                self.waiting -= 1
+
+# --------------------------------------------------
+# SQLITE MODE (SINGLE-BOX INSTALLS)
+# --------------------------------------------------
+# A SQLite file runs in WAL mode, so readers never block the writer or each
+# other, with a small pool instead of the serverless single connection.
+# SQLite allows one writer at a time: write transactions begin IMMEDIATE
+# (taking the write lock up front, so they wait in busy_timeout instead of
+# failing with "database is locked" when upgrading a read) and, within a
+# process, wait their turn in a FIFO queue rather than spinning in SQLite's
+# busy handler. GET requests use read-only sessions (plain BEGIN) that skip
+# the queue. SQLITE_TUNING=0 restores the old single-connection behaviour.
+# On by default: in interleaved benchmarks/classroom.py runs it matched or beat
+# the old mode on write throughput and p95 and lowered read p95 under writes.
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "1") != "0"
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+SQLITE_PRAGMAS = [
+    "journal_mode=WAL",
+    f"synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",   # durable at checkpoints in WAL mode
+    f"mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+    f"cache_size={int(os.getenv('SQLITE_CACHE_SIZE', '-65536'))}",   # negative: KiB, i.e. 64 MiB
+    f"busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}",
+    "temp_store=MEMORY",
+]
+
+class WriterQueue:
+    """FIFO lock that admits one write transaction at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._held = False
+        self._waiters = collections.deque()
+        self.transactions = 0
+        self.timeouts = 0
+
+    def acquire(self, timeout):
+        with self._lock:
+            if not self._held and not self._waiters:
+                self._held = True
+                self.transactions += 1
+                return True
+            turn = threading.Event()
+            self._waiters.append(turn)
+        if turn.wait(timeout):
+            return True
+        with self._lock:
+            if turn.is_set():
+                return True  # handed over just as we gave up
+            self._waiters.remove(turn)
+            self.timeouts += 1
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # Ownership passes straight to the next in line
+                self.transactions += 1
+                self._waiters.popleft().set()
+            else:
+                self._held = False
+
+    def stats(self):
+        return {
+            "writing": self._held,
+            "waiting": len(self._waiters),
+            "transactions": self.transactions,
+            "timeouts": self.timeouts,
+        }
+
+sqlite_writers = {}   # engine -> WriterQueue
+_sqlite_readers = {}  # engine -> read-only variant of it
+
+def _is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+def _configure_sqlite(engine):
+    writers = sqlite_writers[engine] = WriterQueue()
+    _sqlite_readers[engine] = engine.execution_options(sqlite_read_only=True)
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        # Transactions are begun below, not implicitly by the sqlite3 module
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        options = conn.get_execution_options()
+        if options.get("isolation_level") == "AUTOCOMMIT":
+            return
+        driver_connection = conn.connection.driver_connection
+        if options.get("sqlite_read_only"):
+            driver_connection.execute("BEGIN")
+            return
+        if not writers.acquire(SQLITE_BUSY_TIMEOUT):
+            raise PoolTimeoutError("Timed out waiting for the SQLite writer queue")
+        conn.info["sqlite_writer"] = True
+        try:
+            driver_connection.execute("BEGIN IMMEDIATE")
+        except Exception:
+            _release(conn.info)
+            raise
+
+    def _release(info):
+        if info.pop("sqlite_writer", False):
+            writers.release()
+
+    # The next writer may queue up for SQLite's lock a moment before this
+    # COMMIT lands; busy_timeout covers that gap
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        _release(conn.info)
+
+    @event.listens_for(engine, "rollback")
+    def _rollback(conn):
+        _release(conn.info)
+
+    # Connections returned or invalidated mid-transaction must not keep the turn
+    @event.listens_for(engine, "reset")
+    def _reset(dbapi_connection, connection_record, reset_state):
+        _release(connection_record.info)
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidate(dbapi_connection, connection_record, exception):
+        _release(connection_record.info)
+
+def read_only_session(factory):
+    """A session from `factory` for requests that only read; on SQLite it skips the writer queue."""
+    reader = _sqlite_readers.get(factory.kw["bind"])
+    return factory(bind=reader) if reader is not None else factory()
+
+def make_engine(url, pool_size=1, pool_timeout=POOL_TIMEOUT):
+    connect_args = {}
+    if make_url(url).drivername == "postgresql+psycopg":
+        connect_args["prepare_threshold"] = PREPARE_THRESHOLD
+    sqlite_file = SQLITE_TUNING and _is_sqlite_file(url)
+    if sqlite_file:
+        connect_args["check_same_thread"] = False
+    new_engine = create_engine(
+        url,
+        connect_args=connect_args,
+        poolclass=MeteredQueuePool,
+        pool_pre_ping=not sqlite_file,   # a local file has no server to drop the connection
+        pool_size=SQLITE_POOL_SIZE if sqlite_file else pool_size,   # 1 is CRITICAL for serverless
+        max_overflow=0,     # CRITICAL for serverless
+        pool_timeout=pool_timeout,
+    )
+    if sqlite_file:
+        _configure_sqlite(new_engine)
+    return new_engine
+
+engine = make_engine(DATABASE_URL)
+replica_engine = make_engine(READ_REPLICA_URL) if READ_REPLICA_URL else None
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -24,10 +217,194 @@ SessionLocal = sessionmaker(
     bind=engine,
 )
 
+ReplicaSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=replica_engine,
+) if replica_engine is not None else None
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# --------------------------------------------------
+# USER SHARDS
+# --------------------------------------------------
+# SHARD_DATABASE_URLS (comma separated, may include DATABASE_URL) spreads
+# per-user rows (users, progress, quiz attempts, events and their jobs)
+# over several databases. The course catalog and user_directory, which maps
+# every user to a shard, stay on DATABASE_URL. Directory entries are cached
+# for SHARD_DIRECTORY_TTL seconds; shards.py moves users with that in mind.
+SHARD_DATABASE_URLS = [u.strip() for u in os.getenv("SHARD_DATABASE_URLS", "").split(",") if u.strip()]
+SHARD_DIRECTORY_TTL = float(os.getenv("SHARD_DIRECTORY_TTL", "5"))
+
+shard_engines = [engine if url == DATABASE_URL else make_engine(url) for url in SHARD_DATABASE_URLS]
+
+ShardSessionLocals = [
+    sessionmaker(autocommit=False, autoflush=False, bind=shard_engine)
+    for shard_engine in shard_engines
+]
+
+# --------------------------------------------------
+# BACKGROUND POOLS
+# --------------------------------------------------
+# Job workers, the job poller, the recommender refresh and the signup filter
+# build use a pool of their own on each server database, so they never hold
+# the one connection requests queue for. SQLite shares the request engine:
+# the writer queue has to see every write to the file.
+BACKGROUND_POOL_SIZE = int(os.getenv("DB_BACKGROUND_POOL_SIZE", str(int(os.getenv("JOB_WORKERS", "2")) + 2)))
+BACKGROUND_POOL_TIMEOUT = float(os.getenv("DB_BACKGROUND_POOL_TIMEOUT", "30"))
+
+def _background_engine(bind, url):
+    if bind.dialect.name == "sqlite":
+        return bind
+    return make_engine(url, pool_size=BACKGROUND_POOL_SIZE, pool_timeout=BACKGROUND_POOL_TIMEOUT)
+
+background_engines = {engine: _background_engine(engine, DATABASE_URL)}   # request engine -> background engine
+for _url, _shard_engine in zip(SHARD_DATABASE_URLS, shard_engines):
+    if _shard_engine not in background_engines:
+        background_engines[_shard_engine] = _background_engine(_shard_engine, _url)
+
+def background_bind(bind):
+    return background_engines.get(bind, bind)
+
+def background_session(factory):
+    """A session from `factory` on the background pool of the same database."""
+    return factory(bind=background_bind(factory.kw["bind"]))
+
+class ShardDirectory:
+    """user_id -> (shard, moving) from user_directory, cached for `ttl` seconds."""
+
+    def __init__(self, bind, ttl=SHARD_DIRECTORY_TTL, max_entries=100_000):
+        self.bind = bind
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, user_id):
+        now = time.monotonic()
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[2] > now:
+            self.hits += 1
+            return cached[0], cached[1]
+        self.misses += 1
+        with self.bind.connect() as conn:
+            row = conn.execute(
+                text("SELECT shard, moving FROM user_directory WHERE user_id = :user_id"),
+                {"user_id": user_id},
+            ).first()
+        if row is None:
+            # Unknown ids are not cached: the user may be created a moment later
+            return 0, False
+        if len(self._cache) >= self.max_entries:
+            self._cache.clear()
+        self._cache[user_id] = (row.shard, bool(row.moving), now + self.ttl)
+        return row.shard, bool(row.moving)
+
+    def forget(self, user_id):
+        self._cache.pop(user_id, None)
+
+    def stats(self):
+        return {
+            "shards": len(shard_engines),
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl_seconds": self.ttl,
+        }
+
+shard_directory = ShardDirectory(engine) if shard_engines else None
+
+def shard_session(user_id):
+    """A session on the shard that holds `user_id`'s rows."""
+    shard, _ = shard_directory.lookup(user_id)
+    return ShardSessionLocals[shard]()
+
+def user_data_engines():
+    """Engines holding per-user rows: every shard, or the primary when unsharded."""
+    return shard_engines or [engine]
+
+def shard_groups(user_ids):
+    """[(session factory, user_ids on it)] for a list of users, in shard order."""
+    if shard_directory is None:
+        return [(SessionLocal, list(user_ids))]
+    groups = {}
+    for user_id in user_ids:
+        groups.setdefault(shard_directory.lookup(user_id)[0], []).append(user_id)
+    return [(ShardSessionLocals[shard], groups[shard]) for shard in sorted(groups)]
+
+# --------------------------------------------------
+# READ-YOUR-WRITES STICKINESS
+# --------------------------------------------------
+# The deadline travels with the client, as a cookie and as a header for
+# clients that do not keep cookies, so whichever worker serves the next read
+# honours it. It is set once the write commits, before the response goes out.
+PRIMARY_UNTIL_COOKIE = "read_primary_until"
+PRIMARY_UNTIL_HEADER = "X-Read-Primary-Until"
+
+def _mark_write(request):
+    def committed(session):
+        request.state.primary_write = True
+    return committed
+
+def reads_primary(request):
+    value = request.cookies.get(PRIMARY_UNTIL_COOKIE) or request.headers.get(PRIMARY_UNTIL_HEADER)
+    try:
+        return value is not None and float(value) > time.time()
+    except ValueError:
+        return False
+
+def stick_to_primary(request, response):
+    """Send the read-your-writes deadline after a committed write on the primary."""
+    if not getattr(request.state, "primary_write", False):
+        return
+    until = f"{time.time() + READ_YOUR_WRITES_SECONDS:.3f}"
+    response.set_cookie(
+        PRIMARY_UNTIL_COOKIE, until,
+        max_age=math.ceil(READ_YOUR_WRITES_SECONDS), httponly=True,
+        samesite="none" if CROSS_SITE_COOKIE else "lax", secure=CROSS_SITE_COOKIE,
+    )
+    response.headers[PRIMARY_UNTIL_HEADER] = until
+
+def _request_user_id(request):
+    user_id = getattr(request.state, "user_id", None)
+    if user_id is None:
+        user_id = request.path_params.get("user_id")
+    try:
+        return int(user_id) if user_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def get_db(request: Request):
+    user_id = _request_user_id(request)
+    read_only = request.method == "GET"
+    if shard_directory is not None and user_id is not None:
+        # Per-user routes go to the user's shard; requests without a user stay on the primary
+        shard, moving = shard_directory.lookup(user_id)
+        if moving and request.method != "GET":
+            raise HTTPException(
+                status_code=503,
+                detail="Account is being moved, retry shortly",
+                headers={"Retry-After": str(max(1, int(SHARD_DIRECTORY_TTL)))},
+            )
+        factory = ShardSessionLocals[shard]
+        db = read_only_session(factory) if read_only else factory()
+        try:
+            yield db
+        finally:
+            db.close()
+        return
+
+    # GETs go to the replica unless this client wrote something moments ago
+    use_replica = (
+        ReplicaSessionLocal is not None
+        and read_only
+        and not reads_primary(request)
+    )
+    factory = ReplicaSessionLocal if use_replica else SessionLocal
+    db = read_only_session(factory) if read_only else factory()
+    if ReplicaSessionLocal is not None and not read_only:
+        event.listen(db, "after_commit", _mark_write(request))
     try:
         yield db
     finally:
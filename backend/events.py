@@ -0,0 +1,280 @@
+"""Append-only learning event log and the progress projections built from it.
+
+Every progress write is appended to learning_events and then applied to
+the read models (course_video_progress, quiz_partial_progress, quizz and
+the funnel rollups). The read models can be thrown away and rebuilt from
+the log at any time. Attempts archived by partitions.py stay out of quizz
+on replay; their counts live on in the archive summaries.
+
+    python events.py seed      # one-off: turn pre-log progress rows into events
+    python events.py replay    # rebuild every projection from the log
+
+Replay runs in one transaction that locks the log, so progress writes wait
+for it to finish while reads keep seeing the old projections. With
+SHARD_DATABASE_URLS set both commands run on every shard in turn.
+"""
+import argparse
+import datetime
+import sys
+
+from sqlalchemy import bindparam, delete, event as sa_event, func, insert, literal, select, text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, engine, Base, user_data_engines
+
+from py_models.quiz_models import Quiz
+from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+from py_models.event_models import LearningEvent
+
+import analytics
+import migrations
+import partitions
+from jobs import job_queue
+from timestamps import naive_utc, utcnow
+from pubsub import hub
+from statements import statement
+
+VIDEO_WATCHED = "video_watched"
+QUIZ_PROGRESS_SAVED = "quiz_progress_saved"
+QUIZ_PROGRESS_CLEARED = "quiz_progress_cleared"
+QUIZ_COMPLETED = "quiz_completed"
+EVENT_TYPES = {VIDEO_WATCHED, QUIZ_PROGRESS_SAVED, QUIZ_PROGRESS_CLEARED, QUIZ_COMPLETED}
+
+EVENT_COLUMNS = ("user_id", "event_type", "subject_id", "position", "score", "occurred_at")
+MAX_BATCH = 500
+
+
+def _attempt_date(event):
+    # Live writes keep the client's string; replayed ones are rebuilt from occurred_at
+    if event.get("attempt_date"):
+        return event["attempt_date"]
+    occurred = event.get("occurred_at")
+    return occurred.isoformat() + "Z" if occurred else None
+
+
+def project_appends(db, events):
+    """Apply the append-only events of a batch: one INSERT per read model."""
+    videos = [e for e in events if e["event_type"] == VIDEO_WATCHED]
+    quizzes = [e for e in events if e["event_type"] == QUIZ_COMPLETED]
+    if videos:
+        db.execute(insert(CourseVideoProgress), [
+            {"user_id": e["user_id"], "course_id": e["subject_id"], "video_index": e["position"]}
+            for e in videos
+        ])
+        # Rollups catch up after commit so the write stays at commit latency
+        job_queue.enqueue_many(db, "analytics.record_video", [
+            {"user_id": e["user_id"], "course_id": e["subject_id"], "video_index": e["position"]}
+            for e in videos
+        ])
+    if quizzes:
+        db.execute(insert(Quiz).execution_options(render_nulls=True), [
+            {"user_id": e["user_id"], "quiz_id": e["subject_id"], "score": e["score"],
+             "attempt_date": _attempt_date(e), "attempted_at": e["occurred_at"]}
+            for e in quizzes
+        ])
+
+
+def project(db, event):
+    """Apply one partial-progress event to its read model; caller commits."""
+    kind = event["event_type"]
+    user_id, subject = event["user_id"], event["subject_id"]
+
+    if kind == QUIZ_PROGRESS_SAVED:
+        upsert = statement(db, "upsert_partial_progress")
+        # ON CONFLICT needs the unique index, which only `migrations.py upgrade` creates
+        if upsert is not None and migrations.index_ready(db.connection(), migrations.PARTIAL_PROGRESS_INDEX):
+            # One statement, no read-then-write race between concurrent saves
+            db.execute(upsert, {
+                "user_id": user_id, "quiz_id": subject,
+                "current_index": event["position"], "score": event["score"],
+            })
+            return
+        existing = db.scalars(
+            statement(db, "partial_progress_row"), {"user_id": user_id, "quiz_id": subject}
+        ).first()
+        if existing:
+            existing.current_index = event["position"]
+            existing.score = event["score"]
+        else:
+            db.add(QuizPartialProgress(
+                user_id=user_id, quiz_id=subject,
+                current_index=event["position"], score=event["score"]
+            ))
+        # Sessions don't autoflush; later events in the same batch must see this row
+        db.flush()
+    elif kind == QUIZ_PROGRESS_CLEARED:
+        db.flush()
+        db.execute(statement(db, "clear_partial_progress"), {"user_id": user_id, "quiz_id": subject})
+    else:
+        raise ValueError(f"Not a partial-progress event: {kind}")
+
+
+def record(db, events):
+    """Append events with one multi-row INSERT, then update the projections."""
+    for event in events:
+        if event["event_type"] not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type: {event['event_type']}")
+        # Clients may send offsets; stored times are naive UTC like utcnow()
+        event["occurred_at"] = naive_utc(event.get("occurred_at")) or utcnow()
+    # render_nulls keeps mixed batches in one statement (the ORM otherwise
+    # groups rows by which columns are None)
+    db.execute(
+        insert(LearningEvent).execution_options(render_nulls=True),
+        [{k: e.get(k) for k in EVENT_COLUMNS} for e in events],
+    )
+    project_appends(db, events)
+    for event in events:
+        if event["event_type"] in (QUIZ_PROGRESS_SAVED, QUIZ_PROGRESS_CLEARED):
+            project(db, event)
+    db.info.setdefault("pending_push", []).extend(events)
+
+
+# Open tabs only hear about progress that actually committed
+@sa_event.listens_for(Session, "after_commit")
+def _push_committed(session):
+    for e in session.info.pop("pending_push", ()):
+        hub.publish(e["user_id"], {
+            "type": e["event_type"],
+            "subject_id": e["subject_id"],
+            "position": e.get("position"),
+            "score": e.get("score"),
+        })
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop("pending_push", None)
+
+
+def _is_archived(event, archived):
+    if event.occurred_at is None:
+        return False
+    month = datetime.datetime(event.occurred_at.year, event.occurred_at.month, 1)
+    through = archived.get(month)
+    return through is not None and event.event_id <= through
+
+
+def _apply_chunk(conn, chunk, archived=None):
+    videos, quizzes, partial = [], [], {}
+    for e in chunk:
+        if e.event_type == VIDEO_WATCHED:
+            videos.append({"user_id": e.user_id, "course_id": e.subject_id, "video_index": e.position})
+        elif e.event_type == QUIZ_COMPLETED:
+            if archived and _is_archived(e, archived):
+                continue
+            quizzes.append({
+                "user_id": e.user_id, "quiz_id": e.subject_id, "score": e.score,
+                "attempt_date": _attempt_date(e._asdict()), "attempted_at": e.occurred_at,
+            })
+        elif e.event_type == QUIZ_PROGRESS_SAVED:
+            partial[(e.user_id, e.subject_id)] = (e.position, e.score)
+        elif e.event_type == QUIZ_PROGRESS_CLEARED:
+            partial[(e.user_id, e.subject_id)] = None
+
+    if videos:
+        conn.execute(insert(CourseVideoProgress), videos)
+    if quizzes:
+        conn.execute(insert(Quiz), quizzes)
+    if partial:
+        # Only the last state of each (user, quiz) in the chunk matters
+        conn.execute(
+            delete(QuizPartialProgress).where(
+                QuizPartialProgress.user_id == bindparam("u"),
+                QuizPartialProgress.quiz_id == bindparam("q"),
+            ),
+            [{"u": u, "q": q} for u, q in partial],
+        )
+        rows = [
+            {"user_id": u, "quiz_id": q, "current_index": state[0], "score": state[1]}
+            for (u, q), state in partial.items()
+            if state is not None
+        ]
+        if rows:
+            conn.execute(insert(QuizPartialProgress), rows)
+
+
+def _lock_log(conn):
+    # Held until replay commits: event writes wait, reads of the old projections go on
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("LOCK TABLE learning_events IN EXCLUSIVE MODE"))
+    # SQLite: the DELETEs below take the database write lock before any event is read
+
+
+def replay(chunk_size=5000, bind=engine):
+    """Rebuild the projections from the log in one transaction.
+
+    Events written meanwhile wait for the lock, so none is projected twice or
+    lost, and readers see the old projections until the new ones commit.
+    """
+    last_id, total = 0, 0
+    columns = [getattr(LearningEvent, c) for c in ("event_id",) + EVENT_COLUMNS]
+    with bind.begin() as conn:
+        _lock_log(conn)
+        for model in (CourseVideoProgress, QuizPartialProgress, Quiz):
+            conn.execute(delete(model))
+        archived = partitions.archived_months(conn)
+
+        # Keyset pagination keeps one chunk in memory at a time
+        while True:
+            chunk = conn.execute(
+                select(*columns)
+                .where(LearningEvent.event_id > last_id)
+                .order_by(LearningEvent.event_id)
+                .limit(chunk_size)
+            ).all()
+            if not chunk:
+                break
+            _apply_chunk(conn, chunk, archived)
+            last_id = chunk[-1].event_id
+            total += len(chunk)
+            print(f"Replayed {total} events", file=sys.stderr)
+
+        # Joins the transaction; its commit() leaves the outer one open
+        db = SessionLocal(bind=conn)
+        try:
+            analytics.rebuild(db)
+        finally:
+            db.close()
+    return total
+
+
+def seed(bind=engine):
+    """Convert progress rows written before the log existed into events."""
+    with bind.begin() as conn:
+        if conn.execute(select(func.count()).select_from(LearningEvent)).scalar():
+            raise RuntimeError("learning_events is not empty; seed only runs once")
+        target = insert(LearningEvent)
+        conn.execute(target.from_select(
+            ["user_id", "event_type", "subject_id", "position"],
+            select(
+                CourseVideoProgress.user_id, literal(VIDEO_WATCHED),
+                CourseVideoProgress.course_id, CourseVideoProgress.video_index,
+            ).order_by(CourseVideoProgress.id),
+        ))
+        conn.execute(target.from_select(
+            ["user_id", "event_type", "subject_id", "score", "occurred_at"],
+            select(
+                Quiz.user_id, literal(QUIZ_COMPLETED), Quiz.quiz_id, Quiz.score, Quiz.attempted_at,
+            ).order_by(Quiz.result_id),
+        ))
+        conn.execute(target.from_select(
+            ["user_id", "event_type", "subject_id", "position", "score"],
+            select(
+                QuizPartialProgress.user_id, literal(QUIZ_PROGRESS_SAVED), QuizPartialProgress.quiz_id,
+                QuizPartialProgress.current_index, QuizPartialProgress.score,
+            ).order_by(QuizPartialProgress.id),
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Learning event log maintenance")
+    parser.add_argument("command", choices=["seed", "replay"])
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    for bind in user_data_engines():
+        Base.metadata.create_all(bind=bind)
+        if args.command == "seed":
+            seed(bind)
+        else:
+            print(f"Replayed {replay(args.chunk_size, bind)} events into projections on {bind.url!r}")
@@ -0,0 +1,249 @@
+import datetime
+import logging
+import os
+import queue
+import threading
+
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, ShardSessionLocals, background_bind, background_session, engine
+
+from py_models.job_models import BackgroundJob
+
+from timestamps import utcnow
+
+# --------------------------------------------------
+# BACKGROUND JOBS FOR DERIVED DATA
+# --------------------------------------------------
+# enqueue() writes the job row in the caller's transaction, so a job exists
+# exactly when the write that caused it committed. After the commit its id
+# is handed to the in-memory queue for low latency; anything that misses
+# the queue (full, other process, crash, retry backoff) is picked up by the
+# poller from the table. Finished jobs are deleted, exhausted ones kept as
+# "failed" for inspection. With user shards every shard has its own job
+# table (jobs commit with the user's rows); queue entries are
+# (database index, job_id) and the poller visits each database.
+WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+MAX_QUEUED = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+# A "running" job whose lease expired belonged to a worker that died
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+
+logger = logging.getLogger("skillnest.jobs")
+
+
+class JobQueue:
+    def __init__(self, session_factory, workers=WORKERS, max_queued=MAX_QUEUED,
+                 max_attempts=MAX_ATTEMPTS, retry_base=RETRY_BASE_SECONDS,
+                 poll_interval=POLL_SECONDS, lease=LEASE_SECONDS, shards=()):
+        self.session_factory = session_factory
+        self.databases = [session_factory, *shards]
+        # Jobs are enqueued from requests and, through handlers, from the background pools
+        self._database_of = {}
+        for i, factory in enumerate(self.databases):
+            bind = factory.kw.get("bind")
+            self._database_of[bind] = self._database_of[background_bind(bind)] = i
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.handlers = {}
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def register(self, name):
+        def decorator(func):
+            self.handlers[name] = func
+            return func
+        return decorator
+
+    def enqueue(self, db, name, **payload):
+        """Add a job to the caller's transaction; it runs once that commits."""
+        self.enqueue_many(db, name, [payload])
+
+    def enqueue_many(self, db, name, payloads):
+        """Like enqueue() for a batch, with a single multi-row INSERT."""
+        if name not in self.handlers:
+            raise ValueError(f"Unknown job: {name}")
+        now = utcnow()
+        job_ids = db.scalars(
+            insert(BackgroundJob).returning(BackgroundJob.job_id),
+            [{"name": name, "payload": payload, "status": "pending", "attempts": 0,
+              "run_after": now, "created_at": now} for payload in payloads],
+        ).all()
+        database = self._database_of.get(db.get_bind(), 0)
+        db.info.setdefault("pending_jobs", []).extend((database, job_id) for job_id in job_ids)
+
+    def submit(self, job_id, database=0):
+        key = (database, job_id)
+        with self._lock:
+            if key in self._queued:
+                return
+            try:
+                self._queue.put_nowait(key)
+            except queue.Full:
+                return  # still pending in the table; the poller will get it
+            self._queued.add(key)
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            self._spawn(self._work, f"job-worker-{i}")
+        self._spawn(self._poll, "job-poller")
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def drain(self, timeout=10.0):
+        """Stop polling, let workers finish what is queued, then stop them."""
+        self._stop.set()
+        deadline = datetime.datetime.now() + datetime.timedelta(seconds=timeout)
+        for thread in self._threads:
+            remaining = (deadline - datetime.datetime.now()).total_seconds()
+            thread.join(max(0.0, remaining))
+        self._threads = []
+
+    def _work(self):
+        while True:
+            try:
+                database, job_id = key = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            try:
+                self.run(job_id, database)
+            except Exception:
+                logger.exception("Job %s crashed the worker loop", job_id)
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
+                self._queue.task_done()
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            for database in range(len(self.databases)):
+                try:
+                    for job_id in self.due_jobs(self._queue.maxsize - self._queue.qsize(), database):
+                        self.submit(job_id, database)
+                except Exception:
+                    logger.exception("Job poller failed")
+
+    def due_jobs(self, limit, database=0):
+        if limit <= 0:
+            return []
+        now = utcnow()
+        stale = now - datetime.timedelta(seconds=self.lease)
+        db = background_session(self.databases[database])
+        try:
+            return list(db.scalars(
+                select(BackgroundJob.job_id)
+                .where(or_(
+                    (BackgroundJob.status == "pending") & (BackgroundJob.run_after <= now),
+                    (BackgroundJob.status == "running") & (BackgroundJob.locked_at < stale),
+                ))
+                .order_by(BackgroundJob.job_id)
+                .limit(limit)
+            ))
+        finally:
+            db.close()
+
+    def run(self, job_id, database=0):
+        db = background_session(self.databases[database])
+        try:
+            now = utcnow()
+            stale = now - datetime.timedelta(seconds=self.lease)
+            # The conditional UPDATE is the claim, so two processes never run one job
+            claimed = db.execute(
+                update(BackgroundJob)
+                .where(
+                    BackgroundJob.job_id == job_id,
+                    or_(
+                        (BackgroundJob.status == "pending") & (BackgroundJob.run_after <= now),
+                        (BackgroundJob.status == "running") & (BackgroundJob.locked_at < stale),
+                    ),
+                )
+                .values(status="running", locked_at=now, attempts=BackgroundJob.attempts + 1)
+            ).rowcount
+            db.commit()
+            if not claimed:
+                return
+
+            job = db.get(BackgroundJob, job_id)
+            try:
+                self.handlers[job.name](db, **(job.payload or {}))
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                self._retry_or_fail(db, job_id, exc)
+                return
+
+            db.execute(delete(BackgroundJob).where(BackgroundJob.job_id == job_id))
+            db.commit()
+            self.completed += 1
+        finally:
+            db.close()
+
+    def _retry_or_fail(self, db, job_id, exc):
+        job = db.get(BackgroundJob, job_id)
+        job.last_error = f"{type(exc).__name__}: {exc}"[:500]
+        job.locked_at = None
+        if job.attempts >= self.max_attempts:
+            job.status = "failed"
+            self.failed += 1
+            logger.error("Job %s (%s) failed permanently: %s", job_id, job.name, job.last_error)
+        else:
+            job.status = "pending"
+            delay = self.retry_base * 2 ** (job.attempts - 1)
+            job.run_after = utcnow() + datetime.timedelta(seconds=delay)
+            self.retried += 1
+        db.commit()
+
+    def stats(self):
+        by_status = {}
+        for factory in self.databases:
+            db = background_session(factory)
+            try:
+                for status, count in db.execute(
+                    select(BackgroundJob.status, func.count()).group_by(BackgroundJob.status)
+                ):
+                    by_status[status] = by_status.get(status, 0) + count
+            finally:
+                db.close()
+        return {
+            "queued": self._queue.qsize(),
+            "workers": len(self._threads),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "table": by_status,
+        }
+
+
+job_queue = JobQueue(SessionLocal, shards=[f for f in ShardSessionLocals if f.kw["bind"] is not engine])
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _submit_committed(session):
+    for database, job_id in session.info.pop("pending_jobs", ()):
+        job_queue.submit(job_id, database)
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session):
+    session.info.pop("pending_jobs", None)
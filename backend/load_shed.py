@@ -0,0 +1,64 @@
+import os
+
+from fastapi.responses import JSONResponse
+
+# --------------------------------------------------
+# LOAD SHEDDING (BOUNDED IN-FLIGHT REQUESTS + POOL WAIT)
+# --------------------------------------------------
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "32"))
+RETRY_AFTER_SECONDS = int(os.getenv("SHED_RETRY_AFTER", "1"))
+
+# Cheap endpoints that must keep answering while the instance is saturated
+EXEMPT_PATHS = {"/", "/health", "/diagnostics/load"}
+# Long-lived push streams would otherwise pin in-flight slots forever
+EXEMPT_PREFIXES = ("/progress/stream/",)
+
+
+class LoadShedder:
+    def __init__(self, max_in_flight, retry_after):
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.shed_in_flight = 0
+        self.shed_pool_timeout = 0
+
+    # The middleware runs on the event loop, so these counters need no lock
+    def try_enter(self):
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self.shed_in_flight += 1
+            return False
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return True
+
+    def leave(self):
+        self.in_flight -= 1
+
+    def record_pool_timeout(self):
+        self.shed_pool_timeout += 1
+
+    def overloaded(self, reason, cors=None):
+        # Sheds from middleware outside CORSMiddleware pass their own CORS headers
+        return JSONResponse(
+            status_code=503,
+            content={"status": "error", "message": "Service overloaded, retry shortly", "reason": reason},
+            headers={
+                "Retry-After": str(self.retry_after),
+                **(cors if cors is not None else {"Access-Control-Allow-Origin": "*"}),
+            },
+        )
+
+    def stats(self, pool):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "pool_checked_out": pool.checkedout(),
+            "pool_waiting": getattr(pool, "waiting", 0),
+            "shed_in_flight": self.shed_in_flight,
+            "shed_pool_timeout": self.shed_pool_timeout,
+        }
+
+
+shedder = LoadShedder(MAX_IN_FLIGHT, RETRY_AFTER_SECONDS)
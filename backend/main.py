@@ -1,16 +1,53 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeoutError
 import datetime
-
-from database import engine, get_db, Base
-
-from py_models.signin_models import User
+import logging
+import os
+from typing import Optional
+
+from database import (
+    engine, replica_engine, get_db, Base, SessionLocal, ReplicaSessionLocal, PREPARE_THRESHOLD,
+    shard_engines, ShardSessionLocals, shard_directory, shard_groups, read_only_session,
+    stick_to_primary, PRIMARY_UNTIL_HEADER, background_bind,
+)
+from rate_limit import rate_limit
+from load_shed import shedder, EXEMPT_PATHS, EXEMPT_PREFIXES
+from pubsub import hub, event_stream
+from auth import (
+    issue_token, current_session, staff_session, revoke_token, revoke_user_tokens, user_guard, AUTH_REQUIRED,
+)
+from user_cache import user_versions, user_etag, etag_matches
+from search import search_courses, catalog_index
+from recommend import recommender
+from cache_bus import bus
+from single_flight import single_flight, flights
+from signup_filter import signup_filter
+from tracing import tracer, TracedRoute
+import profiling
+import analytics
+import events
+from jobs import job_queue
+import migrations
+import partitions
+import progress
+import shards
+import statements
+from statements import statement
+from accounts import active_users
+from timestamps import utcnow, parse_attempt_date
+
+from py_models.signin_models import User, normalize_email
 from py_models.course_models import Course
 from py_models.quiz_models import Quiz
 from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+from py_models.analytics_models import CourseUserFurthest, CourseFunnel
+from py_models.event_models import LearningEvent
+from py_models.job_models import BackgroundJob
+from py_models.cohort_models import Cohort, CohortMember
 
 from py_schemas.signin_schemas import (
     CreateUser,
@@ -24,17 +61,103 @@ from py_schemas.progress_schemas import (
     QuizPartialProgressCreate,
     QuizResultCreate
 )
+from py_schemas.event_schemas import LearningEventBatch
+from py_schemas.cohort_schemas import CreateCohort, CohortProgressRequest
+
+logger = logging.getLogger("skillnest.app")
 
 app = FastAPI(title="SkillNest API")
+# Must be set before any route is declared
+app.router.route_class = TracedRoute
+
+# Listed origins may send credentials, so the read-your-writes cookie reaches
+# a cross-origin API; everyone else gets "*" and echoes the header instead
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
+
+def cors_headers(request):
+    """CORS headers for responses built outside CORSMiddleware."""
+    if not CORS_ORIGINS:
+        return {"Access-Control-Allow-Origin": "*"}
+    origin = request.headers.get("origin")
+    if origin not in CORS_ORIGINS:
+        return {}
+    return {"Access-Control-Allow-Origin": origin, "Access-Control-Allow-Credentials": "true", "Vary": "Origin"}
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=False,
+    allow_origins=CORS_ORIGINS or ["*"],
+    allow_credentials=bool(CORS_ORIGINS),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["traceparent", PRIMARY_UNTIL_HEADER],
 )
 
+# --------------------------------------------------
+# READ-YOUR-WRITES (ONLY INSTALLED WITH A READ REPLICA)
+# --------------------------------------------------
+if ReplicaSessionLocal is not None:
+    @app.middleware("http")
+    async def read_your_writes(request: Request, call_next):
+        response = await call_next(request)
+        stick_to_primary(request, response)
+        return response
+
+# --------------------------------------------------
+# LOAD SHEDDING (FAIL FAST INSTEAD OF QUEUEING)
+# --------------------------------------------------
+@app.middleware("http")
+async def shed_load(request: Request, call_next):
+    path = request.url.path
+    if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return await call_next(request)
+    with tracer.span("middleware.load_shed"):
+        admitted = shedder.try_enter()
+    if not admitted:
+        return shedder.overloaded("too many requests in flight", cors_headers(request))
+    try:
+        return await call_next(request)
+    finally:
+        shedder.leave()
+
+# --------------------------------------------------
+# TRACING (OUTERMOST, SO IT ALSO TIMES LOAD SHEDDING)
+# --------------------------------------------------
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    started = tracer.start_request(
+        "http.request",
+        request.headers.get("traceparent"),
+        **{"http.method": request.method, "url.path": request.url.path},
+    )
+    if started is None:
+        return await call_next(request)
+    span = started[0]
+    try:
+        response = await call_next(request)
+    except BaseException as exc:
+        tracer.end_request(started, exc)
+        raise
+    route = request.scope.get("route")
+    span.set(**{
+        "http.route": getattr(route, "path", None),
+        "http.status_code": response.status_code,
+        "enduser.id": getattr(request.state, "user_id", None),
+    })
+    response.headers["traceparent"] = span.traceparent()
+    tracer.end_request(started)
+    return response
+
+# --------------------------------------------------
+# ON-DEMAND PROFILING (ONLY INSTALLED WHEN PROFILE_SECRET IS SET)
+# --------------------------------------------------
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfileMiddleware)
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    shedder.record_pool_timeout()
+    return shedder.overloaded("database connection unavailable")
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(
@@ -44,7 +167,7 @@ async def global_exception_handler(request: Request, exc: Exception):
             "message": str(exc),
             "type": type(exc).__name__
         },
-        headers={"Access-Control-Allow-Origin": "*"}
+        headers=cors_headers(request)
     )
 
 # --------------------------------------------------
@@ -56,7 +179,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
-        headers={"Access-Control-Allow-Origin": "*"}
+        headers={**(exc.headers or {}), **cors_headers(request)}
     )
 
 # --------------------------------------------------
@@ -70,169 +193,371 @@ def root():
 def health():
     return {"status": "ok", "service": "SkillNest API"}
 
+@app.get("/diagnostics/load")
+def load_stats():
+    return shedder.stats(engine.pool)
+
+@app.get("/diagnostics/push")
+def push_stats():
+    return hub.stats()
+
+@app.get("/diagnostics/jobs")
+def job_stats():
+    return job_queue.stats()
+
+@app.get("/diagnostics/cache_bus")
+def cache_bus_stats():
+    return bus.stats()
+
+@app.get("/diagnostics/tracing")
+def tracing_stats():
+    return tracer.stats()
+
+@app.get("/diagnostics/profiles")
+def profile_list():
+    return {"enabled": profiling.ENABLED, "directory": profiling.PROFILE_DIR, "profiles": profiling.list_profiles()}
+
+@app.get("/diagnostics/statements")
+def statement_stats():
+    server_side = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg"
+    return {**statements.registry.stats(), "prepare_threshold": PREPARE_THRESHOLD if server_side else None}
+
+@app.get("/diagnostics/shards")
+def shard_stats():
+    if shard_directory is None:
+        return {"enabled": False}
+    return {"enabled": True, **shard_directory.stats(), "users": shards.counts()}
+
+@app.get("/diagnostics/signup_filter")
+def signup_filter_stats():
+    return signup_filter.stats()
+
+@app.get("/diagnostics/single_flight")
+def single_flight_stats():
+    return flights.stats()
+
 # --------------------------------------------------
 # SERVERLESS-SAFE DB INIT
 # --------------------------------------------------
+def prepare_schema():
+    """Idempotent DDL only; data-changing migrations run via `python migrations.py upgrade`."""
+    binds = [engine] + [e for e in shard_engines if e is not engine]
+    for bind in binds:
+        try:
+            Base.metadata.create_all(bind=bind)
+            migrations.upgrade_schema(bind)
+            partitions.ensure_partitions(bind)
+        except Exception:
+            logger.exception("Schema upgrade failed on %r", bind.url)
+    # Real replicas are read-only; this only matters for local two-database setups
+    if replica_engine is not None:
+        try:
+            Base.metadata.create_all(bind=replica_engine)
+        except Exception:
+            logger.exception("Creating tables on the replica failed")
+
 @app.on_event("startup")
 def on_startup():
-    try:
-        Base.metadata.create_all(bind=engine)
-    except Exception as e:
-        pass
+    # serve.py prepares the schema once in the master instead of in every worker
+    if os.getenv("SKILLNEST_SCHEMA_PREPARED") != "1":
+        prepare_schema()
+    # Background threads start here, in each worker, never in a pre-fork parent
+    bus.start()
+    hub.start()
+    job_queue.start()
+    signup_filter.start([background_bind(e) for e in shard_engines or [engine]])
+    recommender.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Finish queued derived-data jobs; anything left stays pending in the table
+    job_queue.drain()
+    hub.stop()
+    bus.stop()
 
 # --------------------------------------------------
 # USER APIs
 # --------------------------------------------------
 @app.get("/users")
 def get_users(db: Session = Depends(get_db)):
-    return db.query(User).all()
-
-@app.get("/user/{user_id}")
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.user_id == user_id).first()
+    if not shard_engines:
+        return db.query(User).filter(active_users()).all()
+    users = []
+    for factory in ShardSessionLocals:
+        with factory() as shard_db:
+            users.extend(shard_db.scalars(select(User).where(active_users())).all())
+    return sorted(users, key=lambda u: u.user_id)
+
+@app.get("/user/{user_id}", dependencies=[Depends(user_guard)])
+def get_user(user_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    # Revalidation: answer from the version cache or a version-only lookup
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        version = user_versions.get(user_id)
+        if version is None:
+            row = db.execute(statement(db, "user_version"), {"user_id": user_id}).first()
+            if row is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            version = row[0] or 0
+            user_versions.set(user_id, version)
+        etag = user_etag(user_id, version)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+    user = db.scalars(statement(db, "user_by_id"), {"user_id": user_id}).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    user_versions.set(user_id, user.user_version)
+    response.headers["ETag"] = user_etag(user_id, user.user_version)
+    response.headers["Cache-Control"] = "private, no-cache"
     return user
 
-@app.post("/create_user")
+@app.post("/create_user", dependencies=[Depends(rate_limit("account"))])
 def create_user(user: CreateUser, db: Session = Depends(get_db)):
+    user.user_email = normalize_email(user.user_email)
+    # Most new emails are ruled out by the filter without a query, but only
+    # where the unique index backs a miss: not before `migrations.py upgrade`
+    # and not across shards, where a moved user's email sits on another shard
+    may_skip = not shard_engines and migrations.index_ready(db.connection(), migrations.USER_EMAIL_INDEX)
+    if signup_filter.exists(user.user_email, lambda email: _email_taken(db, email), may_skip=may_skip):
+        raise HTTPException(status_code=409, detail="Email already registered")
+    user_id = None
+    if shard_engines:
+        # The directory hands out the id and picks the shard the account lives on
+        user_id, shard = shards.allocate_user(user.user_email)
+        with ShardSessionLocals[shard]() as shard_db:
+            created = _add_user(shard_db, user, user_id)
+        if not created:
+            shards.release_user(user_id)
+    else:
+        created = _add_user(db, user, user_id)
+    if not created:
+        raise HTTPException(status_code=409, detail="Email already registered")
+    signup_filter.add(user.user_email)
+    return {"status": "success", "message": "User created"}
+
+def _email_taken(db, email):
+    if not shard_engines:
+        return db.execute(statement(db, "email_taken"), {"email": email}).first() is not None
+    # A moved user keeps their email on another shard than place() picks
+    for factory in ShardSessionLocals:
+        with factory() as shard_db:
+            if shard_db.execute(statement(shard_db, "email_taken"), {"email": email}).first() is not None:
+                return True
+    return False
+
+def _add_user(db, user, user_id):
     new_user = User(
+        user_id=user_id,
         user_name=user.user_name,
         user_email=user.user_email,
         user_password=user.user_password,
         user_dateofbirth=user.user_dateofbirth,
         user_phone=user.user_phone,
         user_gender=user.user_gender,
-        user_created_at=datetime.datetime.now().strftime("%B %Y")
+        user_created_at=datetime.datetime.now().strftime("%B %Y"),
+        user_registered_at=utcnow()
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return {"status": "success", "message": "User created"}
-
-@app.post("/login")
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent signup, or one this process's filter has not heard of yet
+        db.rollback()
+        if _email_taken(db, user.user_email):
+            return False
+        raise   # not the email (e.g. an id already in use) and not the client's fault
+    return True
+
+@app.post("/login", dependencies=[Depends(rate_limit("account"))])
 def login(user: LoginRequest, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(
-        User.user_email == user.user_email,
-        User.user_password == user.user_password
-    ).first()
+    params = {"email": normalize_email(user.user_email), "password": user.user_password}
+    if not shard_engines:
+        db_user = db.scalars(statement(db, "login"), params).first()
+    else:
+        # Only the email is known, so ask every shard
+        db_user = None
+        for factory in ShardSessionLocals:
+            with factory() as shard_db:
+                db_user = shard_db.scalars(statement(shard_db, "login"), params).first()
+            if db_user is not None:
+                break
 
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    return {"status": "success", "user": db_user}
+    return {"status": "success", "user": db_user, "token": issue_token(db_user)}
+
+@app.get("/session")
+def get_session(session: dict = Depends(current_session)):
+    # Answers "who am I / is my login still valid" without touching the DB
+    return {"status": "success", "session": session}
+
+@app.post("/session/refresh")
+def refresh_session(session: dict = Depends(current_session), db: Session = Depends(get_db)):
+    # Refresh is the one place that re-reads the row, so deleted users can't renew
+    user = db.scalars(statement(db, "user_by_id"), {"user_id": session["sub"]}).first()
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    revoke_token(session)
+    return {"status": "success", "token": issue_token(user)}
+
+@app.post("/logout")
+def logout(session: dict = Depends(current_session)):
+    revoke_token(session)
+    return {"status": "success"}
 
-@app.put("/user/{user_id}")
+@app.put("/user/{user_id}", dependencies=[Depends(rate_limit("account")), Depends(user_guard)])
 def update_user(user_id: int, data: UpdateUser, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.user_id == user_id).first()
+    user = db.scalars(statement(db, "user_by_id"), {"user_id": user_id}).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    if data.user_email is not None:
+        data.user_email = normalize_email(data.user_email)
     for k, v in data.dict(exclude_unset=True).items():
         setattr(user, k, v)
+    user.user_version = (user.user_version or 0) + 1
+    user.user_updated_at = utcnow()
 
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Email already registered")
     db.refresh(user)
+    if data.user_email is not None:
+        signup_filter.add(data.user_email)
+    user_versions.set(user_id, user.user_version)
+    bus.broadcast("user_versions", user_id)
     return {"status": "success", "user": user}
 
-@app.post("/delete_user/{user_id}")
+@app.post("/delete_user/{user_id}", dependencies=[Depends(rate_limit("account")), Depends(user_guard)])
 def delete_user(user_id: int, req: DeleteUserRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.user_id == user_id).first()
+    user = db.scalars(statement(db, "user_by_id"), {"user_id": user_id}).first()
     if not user or user.user_password != req.password:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    db.delete(user)
+    # Soft delete answers at once; the job purges progress rows in small batches
+    user.user_deleted_at = utcnow()
+    user.user_version = (user.user_version or 0) + 1
+    job_queue.enqueue(db, "accounts.purge_user", user_id=user_id)
     db.commit()
+    revoke_user_tokens(user_id)
+    user_versions.invalidate(user_id)
+    bus.broadcast("user_versions", user_id)
     return {"status": "success"}
 
 # --------------------------------------------------
 # COURSE APIs
 # --------------------------------------------------
-@app.post("/create_course")
+@app.post("/create_course", dependencies=[Depends(rate_limit("course"))])
 def create_course(course: Create_course, db: Session = Depends(get_db)):
-    db_course = Course(**course.dict())
+    # The schema says created_by, the column is create_by
+    db_course = Course(**course.dict(exclude={"created_by"}), create_by=course.created_by)
     db.add(db_course)
     db.commit()
+    catalog_index.invalidate()
+    bus.broadcast("catalog")
     return {"status": "course created"}
 
 @app.get("/course")
+@single_flight("course_list")
 def get_courses(db: Session = Depends(get_db)):
     return db.query(Course).all()
 
+@app.get("/course/search")
+def search_course_catalog(
+    q: str = "",
+    level: Optional[str] = None,
+    category: Optional[str] = None,
+    page: int = 1,
+    page_size: int = 20,
+    db: Session = Depends(get_db),
+):
+    return search_courses(db, q, level, category, page, page_size)
+
 # --------------------------------------------------
 # QUIZ APIs
 # --------------------------------------------------
-@app.post("/create_quiz")
+@app.post("/create_quiz", dependencies=[Depends(rate_limit("quiz")), Depends(user_guard)])
 def create_quiz(data: QuizResultCreate, db: Session = Depends(get_db)):
-    quiz = Quiz(**data.dict())
-    db.add(quiz)
+    events.record(db, [{
+        "event_type": events.QUIZ_COMPLETED,
+        "user_id": data.user_id,
+        "subject_id": data.quiz_id,
+        "score": data.score,
+        "occurred_at": parse_attempt_date(data.attempt_date) or utcnow(),
+        "attempt_date": data.attempt_date,
+    }])
     db.commit()
     return {"status": "quiz saved"}
 
 # --------------------------------------------------
 # PROGRESS APIs
 # --------------------------------------------------
-@app.post("/progress/course/video")
+@app.post("/progress/course/video", dependencies=[Depends(rate_limit("progress")), Depends(user_guard)])
 def mark_video(data: VideoProgressCreate, db: Session = Depends(get_db)):
-    db.add(CourseVideoProgress(**data.dict()))
+    events.record(db, [{
+        "event_type": events.VIDEO_WATCHED,
+        "user_id": data.user_id,
+        "subject_id": data.course_id,
+        "position": data.video_index,
+    }])
     db.commit()
     return {"status": "saved"}
 
-@app.post("/progress/quiz/partial")
+@app.post("/progress/quiz/partial", dependencies=[Depends(rate_limit("quiz")), Depends(user_guard)])
 def save_partial(data: QuizPartialProgressCreate, db: Session = Depends(get_db)):
-    # Check if exists, update or create
-    existing = db.query(QuizPartialProgress).filter(
-        QuizPartialProgress.user_id == data.user_id,
-        QuizPartialProgress.quiz_id == data.quiz_id
-    ).first()
-
-    if existing:
-        existing.current_index = data.current_index
-        existing.score = data.score
-    else:
-        db.add(QuizPartialProgress(**data.dict()))
-    
+    # The projection updates the existing row or creates it
+    events.record(db, [{
+        "event_type": events.QUIZ_PROGRESS_SAVED,
+        "user_id": data.user_id,
+        "subject_id": data.quiz_id,
+        "position": data.current_index,
+        "score": data.score,
+    }])
     db.commit()
     return {"status": "saved"}
 
-@app.get("/progress/course/{user_id}")
+@app.post("/events", dependencies=[Depends(rate_limit("progress")), Depends(user_guard)])
+def ingest_events(batch: LearningEventBatch, db: Session = Depends(get_db)):
+    if len(batch.events) > events.MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {events.MAX_BATCH} events per batch")
+    try:
+        events.record(db, [dict(e.dict(), user_id=batch.user_id) for e in batch.events])
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=422, detail=str(e))
+    db.commit()
+    return {"status": "saved", "count": len(batch.events)}
+
+@app.get("/progress/stream/{user_id}", dependencies=[Depends(user_guard)])
+async def stream_progress(user_id: int, request: Request):
+    # Replaces polling: every committed progress event for this user is pushed
+    queue = hub.subscribe(user_id)
+    if queue is None:
+        return shedder.overloaded("too many live connections")
+    return StreamingResponse(
+        event_stream(request, user_id, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/progress/course/{user_id}", dependencies=[Depends(user_guard)])
+@single_flight("course_progress")
 def get_course_progress(user_id: int, db: Session = Depends(get_db)):
-    # Fetch all video progress for user
-    records = db.query(CourseVideoProgress).filter(CourseVideoProgress.user_id == user_id).all()
-    
-    # Aggregate by course_id -> [video_index, ...]
-    result = {}
-    for r in records:
-        if r.course_id not in result:
-            result[r.course_id] = []
-        if r.video_index not in result[r.course_id]:
-            result[r.course_id].append(r.video_index)
-            
-    return result
+    # { "html": [0, 1, 2], ... }
+    return progress.course_progress(db, [user_id])[user_id]
 
-@app.get("/progress/quiz/{user_id}")
+@app.get("/progress/quiz/{user_id}", dependencies=[Depends(user_guard)])
 def get_quiz_progress(user_id: int, db: Session = Depends(get_db)):
-    # Fetch all quiz attempts
-    records = db.query(Quiz).filter(Quiz.user_id == user_id).all()
-    
-    # Aggregate: { "python": { "attempts": 2, "bestScore": 90 } }
-    temp = {}
-    for r in records:
-        if r.quiz_id not in temp:
-            temp[r.quiz_id] = []
-        temp[r.quiz_id].append(r.score)
-        
-    result = {}
-    for q_id, scores in temp.items():
-        result[q_id] = {
-            "attempts": len(scores),
-            "bestScore": max(scores) if scores else 0
-        }
-    return result
+    # { "python": { "attempts": 2, "bestScore": 90 } }, archived months included
+    return progress.quiz_progress(db, [user_id])[user_id]
 
-@app.get("/progress/quiz/partial/{user_id}")
+@app.get("/progress/quiz/partial/{user_id}", dependencies=[Depends(user_guard)])
 def get_partial_quiz_progress(user_id: int, db: Session = Depends(get_db)):
-    records = db.query(QuizPartialProgress).filter(QuizPartialProgress.user_id == user_id).all()
+    records = db.scalars(statement(db, "partial_progress"), {"user_id": user_id}).all()
     
     # Format: { "python": { "currentIndex": 5, "score": 4 } }
     result = {}
@@ -243,13 +568,107 @@ def get_partial_quiz_progress(user_id: int, db: Session = Depends(get_db)):
         }
     return result
 
-@app.delete("/progress/quiz/partial/{user_id}/{quiz_id}")
+@app.delete("/progress/quiz/partial/{user_id}/{quiz_id}", dependencies=[Depends(rate_limit("quiz")), Depends(user_guard)])
 def delete_partial_quiz_progress(user_id: int, quiz_id: str, db: Session = Depends(get_db)):
-    db.query(QuizPartialProgress).filter(
-        QuizPartialProgress.user_id == user_id,
-        QuizPartialProgress.quiz_id == quiz_id
-    ).delete()
+    events.record(db, [{
+        "event_type": events.QUIZ_PROGRESS_CLEARED,
+        "user_id": user_id,
+        "subject_id": quiz_id,
+    }])
     db.commit()
     return {"status": "deleted"}
 
+# --------------------------------------------------
+# COHORT APIs (INSTRUCTORS)
+# --------------------------------------------------
+@app.post("/cohorts", dependencies=[Depends(rate_limit("course"))])
+def create_cohort(data: CreateCohort, session: Optional[dict] = Depends(staff_session), db: Session = Depends(get_db)):
+    if len(data.user_ids) > progress.MAX_COHORT_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {progress.MAX_COHORT_SIZE} members")
+    members = []
+    if data.user_ids and not shard_engines:
+        members = _active_user_ids(db, set(data.user_ids))
+    elif data.user_ids:
+        # Each member is checked on the shard that holds their users row
+        for factory, user_ids in shard_groups(set(data.user_ids)):
+            with factory() as shard_db:
+                members.extend(_active_user_ids(shard_db, user_ids))
+    cohort = Cohort(name=data.name, created_by=session["sub"] if session else None, created_at=utcnow())
+    db.add(cohort)
+    db.flush()
+    if members:
+        db.execute(insert(CohortMember), [{"cohort_id": cohort.cohort_id, "user_id": m} for m in members])
+    db.commit()
+    return {"status": "success", "cohort_id": cohort.cohort_id, "members": len(members)}
+
+def _active_user_ids(db, user_ids):
+    return db.scalars(
+        select(User.user_id).where(progress.user_filter(db, User.user_id, user_ids), active_users())
+    ).all()
+
+@app.post("/progress/cohort")
+def get_cohort_progress(req: CohortProgressRequest, session: Optional[dict] = Depends(staff_session), db: Session = Depends(get_db)):
+    if req.cohort_id is not None:
+        cohort = db.get(Cohort, req.cohort_id)
+        if cohort is None:
+            raise HTTPException(status_code=404, detail="Cohort not found")
+        # Instructors read their own cohorts; cohorts made in open mode have no
+        # owner and, like everyone else's, are for admins only
+        if session is not None and session["role"] != "admin" and (
+            cohort.created_by is None or cohort.created_by != session["sub"]
+        ):
+            raise HTTPException(status_code=403, detail="Not your cohort")
+        user_ids = list(db.scalars(
+            select(CohortMember.user_id)
+            .where(CohortMember.cohort_id == req.cohort_id)
+            .order_by(CohortMember.user_id)
+        ))
+    elif req.user_ids is not None:
+        # Ad-hoc lists would bypass the per-user guard, so they need open mode
+        if AUTH_REQUIRED:
+            raise HTTPException(status_code=403, detail="Use a cohort_id")
+        user_ids = list(dict.fromkeys(req.user_ids))
+    else:
+        raise HTTPException(status_code=422, detail="Pass user_ids or cohort_id")
+    if len(user_ids) > progress.MAX_COHORT_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {progress.MAX_COHORT_SIZE} users")
+
+    # The stream outlives this request's session and opens its own per chunk;
+    # hand the pooled connection back first or the stream would wait on it
+    db.close()
+    return StreamingResponse(
+        progress.stream_cohort(ReplicaSessionLocal or SessionLocal, user_ids, route=shard_groups if shard_engines else None),
+        media_type="application/json",
+    )
+
+@app.get("/recommendations/{user_id}", dependencies=[Depends(user_guard)])
+def get_recommendations(user_id: int, k: int = 3):
+    return recommender.recommend(user_id, max(1, min(k, 20)))
 
+# --------------------------------------------------
+# ANALYTICS APIs
+# --------------------------------------------------
+def _on_every_shard(db, fn, *args):
+    """[fn(session, *args)] for every shard, or just for `db` when unsharded."""
+    if not shard_engines:
+        return [fn(db, *args)]
+    results = []
+    for factory in ShardSessionLocals:
+        with read_only_session(factory) as shard_db:
+            results.append(fn(shard_db, *args))
+    return results
+
+@app.get("/analytics/course/{course_id}/funnel")
+def get_course_funnel(course_id: str, db: Session = Depends(get_db)):
+    counts = analytics.merge_counts(_on_every_shard(db, analytics.funnel_counts, course_id))
+    return {"course_id": course_id, "funnel": analytics.format_funnel(counts)}
+
+@app.get("/analytics/quiz/attempts_per_day")
+def get_attempts_per_day(start: datetime.date, end: datetime.date, quiz_id: Optional[str] = None, db: Session = Depends(get_db)):
+    results = _on_every_shard(db, analytics.attempts_per_day, start, end, quiz_id)
+    return results[0] if len(results) == 1 else analytics.merge_series(results, "day", "attempts")
+
+@app.get("/analytics/users/signups_per_month")
+def get_signups_per_month(start: datetime.date, end: datetime.date, db: Session = Depends(get_db)):
+    results = _on_every_shard(db, analytics.signups_per_month, start, end)
+    return results[0] if len(results) == 1 else analytics.merge_series(results, "month", "signups")
@@ -0,0 +1,292 @@
+"""Idempotent schema upgrades for databases created by older releases.
+
+create_all() only creates missing tables, so columns and indexes added to
+existing tables are applied here. upgrade_schema() only adds missing columns
+and indexes, is idempotent and runs at app startup. upgrade() also runs the
+steps that change data or rewrite constraints (duplicate removal before a
+unique index, foreign key swaps) and is a deploy step of its own. Backfills
+are separate commands that run in small batches while the app keeps
+serving traffic.
+
+    python migrations.py upgrade
+    python migrations.py backfill-timestamps [--batch-size 1000]
+
+Both commands run on the primary and on every shard in SHARD_DATABASE_URLS.
+"""
+import argparse
+import logging
+import sys
+import time
+
+from sqlalchemy import bindparam, delete, func, inspect, select, text, update
+from sqlalchemy.schema import CreateIndex
+
+from database import engine, Base, user_data_engines
+
+from py_models.signin_models import User, email_key
+from py_models.quiz_models import Quiz
+from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+from py_models.event_models import LearningEvent
+
+from timestamps import parse_attempt_date, parse_month_year, utcnow
+from search import SEARCH_INDEX_DDL
+
+logger = logging.getLogger("skillnest.migrations")
+
+# Columns added after the first release, in the order they were introduced
+ADDED_COLUMNS = [
+    Quiz.__table__.c.attempted_at,
+    User.__table__.c.user_registered_at,
+    User.__table__.c.user_version,
+    User.__table__.c.user_updated_at,
+    User.__table__.c.user_deleted_at,
+    User.__table__.c.user_role,
+]
+
+# Existing tables whose indexes were added after the first release
+INDEXED_TABLES = [
+    Quiz.__table__,
+    CourseVideoProgress.__table__,
+    QuizPartialProgress.__table__,
+]
+
+# Unique indexes added after the first release: (index, surrogate key); older
+# databases may hold duplicates, of which the newest row is kept
+PARTIAL_PROGRESS_INDEX = next(i for i in QuizPartialProgress.__table__.indexes if i.unique)
+UNIQUE_INDEXES = [
+    (PARTIAL_PROGRESS_INDEX, QuizPartialProgress.__table__.c.id),
+]
+
+# Partial unique index on live users' normalized emails; older databases may
+# hold duplicate accounts, of which the oldest keeps the email
+USER_EMAIL_INDEX = next(i for i in User.__table__.indexes if i.unique)
+# Replaced indexes, dropped once their successors exist
+DROPPED_INDEXES = [("users", "uq_users_email_active")]  # was case-sensitive
+
+# Tables whose user_id foreign key became ON DELETE CASCADE
+CASCADE_TABLES = [
+    Quiz.__table__,
+    CourseVideoProgress.__table__,
+    QuizPartialProgress.__table__,
+    LearningEvent.__table__,
+]
+
+
+def add_missing_columns(bind, columns):
+    inspector = inspect(bind)
+    existing = {}
+    for column in columns:
+        table = column.table.name
+        if table not in existing:
+            existing[table] = {c["name"] for c in inspector.get_columns(table)}
+        if column.name in existing[table]:
+            continue
+        # Nullable columns without defaults are a catalog-only change
+        ddl_type = column.type.compile(dialect=bind.dialect)
+        with bind.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {ddl_type}"))
+        existing[table].add(column.name)
+
+
+def index_names(bind, table):
+    """Index names on `table`; bind is an engine or a connection."""
+    if bind.dialect.name == "sqlite":
+        # The inspector leaves out expression indexes on SQLite
+        query = text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t")
+        if hasattr(bind, "connect"):
+            with bind.connect() as conn:
+                return set(conn.scalars(query, {"t": table}))
+        return set(bind.scalars(query, {"t": table}))
+    return {i["name"] for i in inspect(bind).get_indexes(table)}
+
+
+def ensure_indexes(bind, tables, skip=()):
+    for table in tables:
+        for index in table.indexes:
+            if index.name in skip:
+                continue
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=bind.dialect))
+            if bind.dialect.name == "postgresql":
+                # CONCURRENTLY keeps writes flowing but cannot run in a transaction
+                with bind.connect() as conn:
+                    conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(
+                        ddl.replace(" INDEX ", " INDEX CONCURRENTLY ", 1)
+                    ))
+            else:
+                with bind.begin() as conn:
+                    conn.execute(text(ddl))
+
+
+def drop_indexes(bind, indexes):
+    for table, name in indexes:
+        if name in index_names(bind, table):
+            with bind.begin() as conn:
+                conn.execute(text(f"DROP INDEX {name}"))
+
+
+def drop_duplicates(bind, unique_indexes):
+    for index, pk in unique_indexes:
+        table = index.table
+        if index.name in index_names(bind, table.name):
+            continue
+        columns = list(index.columns)
+        newest = select(func.max(pk)).where(*[c.is_not(None) for c in columns]).group_by(*columns)
+        with bind.begin() as conn:
+            removed = conn.execute(
+                delete(table).where(pk.not_in(newest), *[c.is_not(None) for c in columns])
+            ).rowcount
+        if removed:
+            print(f"Removed {removed} duplicate rows from {table.name}", file=sys.stderr)
+
+
+def retire_duplicate_accounts(bind, index=USER_EMAIL_INDEX):
+    # Accounts are soft-deleted, not removed: the purge job or sweep-orphans
+    # then clears their rows like any other deleted account
+    if index.name in index_names(bind, index.table.name):
+        return
+    users = index.table
+    live = [users.c.user_email.is_not(None), users.c.user_deleted_at.is_(None)]
+    oldest = select(func.min(users.c.user_id)).where(*live).group_by(email_key)
+    with bind.begin() as conn:
+        retired = conn.execute(
+            update(users).where(users.c.user_id.not_in(oldest), *live).values(user_deleted_at=utcnow())
+        ).rowcount
+    if retired:
+        print(f"Soft-deleted {retired} duplicate accounts", file=sys.stderr)
+
+
+def ensure_search_index(bind):
+    # Expression GIN index for course full-text search; other dialects search in memory
+    if bind.dialect.name != "postgresql":
+        return
+    with bind.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(SEARCH_INDEX_DDL))
+
+
+def ensure_cascade_foreign_keys(bind, tables):
+    # SQLite cannot alter constraints; there the purge job does the cleanup
+    if bind.dialect.name != "postgresql":
+        return
+    inspector = inspect(bind)
+    for table in tables:
+        for fk in inspector.get_foreign_keys(table.name):
+            if fk["referred_table"] != "users" or (fk["options"].get("ondelete") or "").upper() == "CASCADE":
+                continue
+            name, columns = fk["name"], ", ".join(fk["constrained_columns"])
+            with bind.begin() as conn:
+                # Partitioned tables don't support NOT VALID; the swap is then validated in place
+                partitioned = conn.execute(text(
+                    "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"
+                ), {"t": table.name}).first() is not None
+                conn.execute(text(f"ALTER TABLE {table.name} DROP CONSTRAINT {name}"))
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD CONSTRAINT {name} FOREIGN KEY ({columns}) "
+                    f"REFERENCES users (user_id) ON DELETE CASCADE{'' if partitioned else ' NOT VALID'}"
+                ))
+            if not partitioned:
+                # Validation scans the table without blocking writes
+                with bind.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} VALIDATE CONSTRAINT {name}"))
+
+
+# Created by upgrade() only, once the duplicates they would reject are gone
+DEDUPED_INDEXES = [index for index, _ in UNIQUE_INDEXES] + [USER_EMAIL_INDEX]
+
+
+def upgrade_schema(bind=engine):
+    """Missing columns and indexes only; safe to run from every worker at startup."""
+    add_missing_columns(bind, ADDED_COLUMNS)
+    ensure_indexes(
+        bind,
+        {column.table for column in ADDED_COLUMNS} | set(INDEXED_TABLES),
+        skip={index.name for index in DEDUPED_INDEXES},
+    )
+    ensure_search_index(bind)
+    missing = [index.name for index in DEDUPED_INDEXES if not index_ready(bind, index)]
+    if missing:
+        logger.warning(
+            "%r lacks %s; run `python migrations.py upgrade`. Until then the app "
+            "uses its slower paths that do not rely on them.", bind.url, ", ".join(missing),
+        )
+
+
+# --------------------------------------------------
+# DEDUPED INDEXES AT RUNTIME
+# --------------------------------------------------
+# A database that has not been through upgrade() lacks DEDUPED_INDEXES, so
+# code that relies on one (ON CONFLICT, skipping a duplicate check) asks
+# first. A present index is remembered for good; a missing one is looked
+# up again after INDEX_RECHECK_SECONDS, so the app notices the upgrade.
+INDEX_RECHECK_SECONDS = 60
+_index_checks = {}   # (engine, index name) -> (present, checked at)
+
+
+def index_ready(bind, index):
+    """Whether `index` exists; bind is an engine or a connection (e.g. db.connection())."""
+    key = (getattr(bind, "engine", bind), index.name)
+    checked = _index_checks.get(key)
+    if checked is not None and (checked[0] or time.monotonic() - checked[1] < INDEX_RECHECK_SECONDS):
+        return checked[0]
+    present = index.name in index_names(bind, index.table.name)
+    _index_checks[key] = (present, time.monotonic())
+    return present
+
+
+def upgrade(bind=engine):
+    """upgrade_schema() plus the steps that change data; run once per deploy."""
+    upgrade_schema(bind)
+    drop_duplicates(bind, UNIQUE_INDEXES)
+    retire_duplicate_accounts(bind)
+    ensure_indexes(bind, {index.table for index in DEDUPED_INDEXES})
+    _index_checks.clear()
+    drop_indexes(bind, DROPPED_INDEXES)
+    ensure_cascade_foreign_keys(bind, CASCADE_TABLES)
+
+
+def backfill(bind, pk, source, target, parse, batch_size=1000):
+    """Fill target from source for rows where target is NULL, one batch per transaction."""
+    table = pk.table
+    stmt = (
+        update(table)
+        .where(pk == bindparam("_pk"))
+        .values({target.name: bindparam("_value")})
+    )
+    last_pk, done = None, 0
+    while True:
+        query = select(pk, source).where(target.is_(None)).order_by(pk).limit(batch_size)
+        if last_pk is not None:
+            query = query.where(pk > last_pk)
+        with bind.begin() as conn:
+            rows = conn.execute(query).all()
+            if not rows:
+                return done
+            params = [
+                {"_pk": row[0], "_value": value}
+                for row in rows
+                if (value := parse(row[1])) is not None
+            ]
+            if params:
+                conn.execute(stmt, params)
+        last_pk = rows[-1][0]
+        done += len(params)
+        print(f"{table.name}.{target.name}: {done} rows backfilled", file=sys.stderr)
+
+
+def backfill_timestamps(bind=engine, batch_size=1000):
+    quiz, users = Quiz.__table__.c, User.__table__.c
+    backfill(bind, quiz.result_id, quiz.attempt_date, quiz.attempted_at, parse_attempt_date, batch_size)
+    backfill(bind, users.user_id, users.user_created_at, users.user_registered_at, parse_month_year, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SkillNest schema migrations")
+    parser.add_argument("command", choices=["upgrade", "backfill-timestamps"])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    # The primary keeps the catalog; each shard has its own users and attempts
+    for bind in dict.fromkeys([engine, *user_data_engines()]):
+        Base.metadata.create_all(bind=bind)
+        upgrade(bind)
+        if args.command == "backfill-timestamps":
+            backfill_timestamps(bind, batch_size=args.batch_size)
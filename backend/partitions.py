@@ -0,0 +1,298 @@
+"""Monthly partitions for quiz attempts and archival of old months.
+
+On Postgres quizz is range-partitioned by attempted_at, one partition per
+month, so each month's indexes stay small and old months can be dropped
+without a bulk DELETE (and the vacuum that follows). Elsewhere quizz stays
+a plain table and archival deletes the archived rows.
+
+    python partitions.py partition                 # one-off: convert quizz (Postgres)
+    python partitions.py ensure [--ahead 3]        # create upcoming monthly partitions
+    python partitions.py archive --older-than 12 [--dir archive]
+
+`partition` renames the existing table to quizz_legacy and attaches it as
+the DEFAULT partition, so no rows are copied. New months get their own
+partitions from then on; ensure() also runs at startup.
+
+With SHARD_DATABASE_URLS set every command runs on each shard, and
+archive files go to one subdirectory per shard.
+
+`archive` writes every attempt older than N months to a gzip CSV per month
+and folds them into quizz_archive_summary (per user and quiz, read by the
+progress endpoint) and quizz_archive_daily (per day and quiz, read by the
+attempts-per-day report) before removing them. The month and the last
+event id at that point go to quizz_archive_months, so `events.py replay`
+leaves those attempts out of quizz. Attempts without an
+attempted_at are never archived; run `python migrations.py
+backfill-timestamps` first.
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import os
+import sys
+from collections import defaultdict
+
+from sqlalchemy import delete, func, inspect, select, text, update
+
+from database import engine, Base, user_data_engines
+
+from py_models.quiz_models import Quiz, QuizArchiveSummary, QuizArchiveDaily, QuizArchiveMonth
+from py_models.event_models import LearningEvent
+
+from timestamps import utcnow
+
+TABLE = Quiz.__table__.name
+ARCHIVE_DIR = os.getenv("QUIZ_ARCHIVE_DIR", "archive")
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def is_partitioned(conn):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"
+    ), {"t": TABLE}).first() is not None
+
+
+def partition_table(bind=engine):
+    """Convert the plain quizz table into a partitioned one (Postgres only)."""
+    if bind.dialect.name != "postgresql":
+        print("Partitioning needs Postgres; quizz stays a plain table", file=sys.stderr)
+        return False
+    with bind.begin() as conn:
+        if is_partitioned(conn):
+            return False
+        legacy = f"{TABLE}_legacy"
+        sequence = conn.scalar(text("SELECT pg_get_serial_sequence(:t, 'result_id')"), {"t": TABLE})
+        for index in inspect(conn).get_indexes(TABLE):
+            conn.execute(text(f"ALTER INDEX {index['name']} RENAME TO {index['name']}_legacy"))
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+        conn.execute(text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {TABLE}_pkey TO {legacy}_pkey"))
+
+        conn.execute(text(
+            f"CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (attempted_at)"
+        ))
+        if sequence:
+            # The legacy table may be dropped once archived; the ids must survive it
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.result_id"))
+        # Unique keys on a partitioned table must include the partition key
+        conn.execute(text(f"CREATE UNIQUE INDEX {TABLE}_result_key ON {TABLE} (result_id, attempted_at)"))
+        for index in Quiz.__table__.indexes:
+            columns = ", ".join(c.name for c in index.columns)
+            conn.execute(text(f"CREATE INDEX {index.name} ON {TABLE} ({columns})"))
+        conn.execute(text(
+            f"ALTER TABLE {TABLE} ADD FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE"
+        ))
+        # Existing rows stay where they are: the old table becomes the catch-all
+        conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {legacy} DEFAULT"))
+    ensure_partitions(bind)
+    return True
+
+
+def ensure_partitions(bind=engine, ahead=3):
+    """Create monthly partitions from this month up to `ahead` months out."""
+    if bind.dialect.name != "postgresql":
+        return []
+    created = []
+    with bind.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        default = conn.scalar(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_partitioned_table p ON p.partrelid = i.inhparent "
+            "WHERE i.inhparent = to_regclass(:t) AND p.partdefid = c.oid"
+        ), {"t": TABLE})
+        this_month = month_start(utcnow())
+        for offset in range(ahead + 1):
+            low, high = add_months(this_month, offset), add_months(this_month, offset + 1)
+            name = partition_name(low)
+            if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar() is not None:
+                continue
+            # A month that already has rows in the default partition stays there
+            if default and conn.execute(text(
+                f"SELECT 1 FROM {default} WHERE attempted_at >= :low AND attempted_at < :high LIMIT 1"
+            ), {"low": low, "high": high}).first():
+                continue
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{low:%Y-%m-%d}') TO ('{high:%Y-%m-%d}')"
+            ))
+            created.append(name)
+    return created
+
+
+def _merge_summaries(conn, per_user, per_day):
+    """Add archived counts to the summary tables (single writer: the archive command)."""
+    for (user_id, quiz_id), (attempts, best) in per_user.items():
+        updated = conn.execute(
+            update(QuizArchiveSummary)
+            .where(QuizArchiveSummary.user_id == user_id, QuizArchiveSummary.quiz_id == quiz_id)
+            .values(attempts=QuizArchiveSummary.attempts + attempts)
+        ).rowcount
+        if not updated:
+            conn.execute(QuizArchiveSummary.__table__.insert().values(
+                user_id=user_id, quiz_id=quiz_id, attempts=attempts, best_score=best
+            ))
+        elif best is not None:
+            conn.execute(
+                update(QuizArchiveSummary)
+                .where(
+                    QuizArchiveSummary.user_id == user_id,
+                    QuizArchiveSummary.quiz_id == quiz_id,
+                    QuizArchiveSummary.best_score.is_(None) | (QuizArchiveSummary.best_score < best),
+                )
+                .values(best_score=best)
+            )
+    for (day, quiz_id), attempts in per_day.items():
+        updated = conn.execute(
+            update(QuizArchiveDaily)
+            .where(QuizArchiveDaily.day == day, QuizArchiveDaily.quiz_id == quiz_id)
+            .values(attempts=QuizArchiveDaily.attempts + attempts)
+        ).rowcount
+        if not updated:
+            conn.execute(QuizArchiveDaily.__table__.insert().values(day=day, quiz_id=quiz_id, attempts=attempts))
+
+
+def _record_month(conn, month, through_event_id):
+    values = {"through_event_id": through_event_id, "archived_at": utcnow()}
+    updated = conn.execute(
+        update(QuizArchiveMonth).where(QuizArchiveMonth.month == month).values(**values)
+    ).rowcount
+    if not updated:
+        conn.execute(QuizArchiveMonth.__table__.insert().values(month=month, **values))
+
+
+def archived_months(conn):
+    """{month start: last quiz_completed event id already in the summaries}."""
+    return dict(conn.execute(select(QuizArchiveMonth.month, QuizArchiveMonth.through_event_id)).all())
+
+
+def archive_month(month, directory=ARCHIVE_DIR, bind=engine, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Move one month of attempts to a gzip CSV file; returns (path, rows)."""
+    low, high = month, add_months(month, 1)
+    table = Quiz.__table__
+    columns = [c.name for c in table.columns]
+    os.makedirs(directory, exist_ok=True)
+    # A fresh file per run, so a failed run never leaves a half-written month behind
+    path = os.path.join(directory, f"{TABLE}-{month:%Y-%m}.{utcnow():%Y%m%dT%H%M%S}.csv.gz")
+
+    per_user = {}
+    per_day = defaultdict(int)
+    archived_ids = []
+    in_range = (table.c.attempted_at >= low) & (table.c.attempted_at < high)
+
+    with bind.begin() as conn:
+        own_partition = None
+        if is_partitioned(conn):
+            name = partition_name(month)
+            if conn.execute(text("SELECT to_regclass(:n)"), {"n": name}).scalar() is not None:
+                own_partition = name
+                # Late writes into this month wait until it is gone
+                conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+
+        # Taken with the rows below in one transaction: the month's attempts
+        # projected so far are exactly those whose events are at or below it
+        through_event_id = conn.scalar(select(func.max(LearningEvent.event_id))) or 0
+        # Per statement: Connection.execution_options() would switch every
+        # later statement in this transaction to a server-side cursor too
+        result = conn.execute(
+            select(table).where(in_range).order_by(table.c.result_id),
+            execution_options={"stream_results": True, "yield_per": chunk_size},
+        )
+        with gzip.open(path, "wt", newline="") as stream:
+            writer = csv.writer(stream)
+            writer.writerow(columns)
+            for partition in result.partitions():
+                for row in partition:
+                    writer.writerow(row)
+                    key = (row.user_id, row.quiz_id)
+                    attempts, best = per_user.get(key, (0, None))
+                    if row.score is not None and (best is None or row.score > best):
+                        best = row.score
+                    per_user[key] = (attempts + 1, best)
+                    per_day[(row.attempted_at.date(), row.quiz_id)] += 1
+                    archived_ids.append(row.result_id)
+
+        if not archived_ids:
+            os.unlink(path)
+            return None, 0
+
+        try:
+            _merge_summaries(conn, per_user, per_day)
+            _record_month(conn, month, through_event_id)
+            if own_partition:
+                conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {own_partition}"))
+                conn.execute(text(f"DROP TABLE {own_partition}"))
+            else:
+                for start in range(0, len(archived_ids), chunk_size):
+                    conn.execute(delete(table).where(
+                        table.c.result_id.in_(archived_ids[start:start + chunk_size])
+                    ))
+        except Exception:
+            os.unlink(path)
+            raise
+    return path, len(archived_ids)
+
+
+def archive(older_than, directory=ARCHIVE_DIR, bind=engine, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Archive every month that ended more than `older_than` months ago."""
+    cutoff = add_months(month_start(utcnow()), -older_than)
+    with bind.connect() as conn:
+        oldest = conn.scalar(select(Quiz.attempted_at).where(Quiz.attempted_at < cutoff)
+                             .order_by(Quiz.attempted_at).limit(1))
+    if oldest is None:
+        return []
+    results = []
+    month = month_start(oldest)
+    while month < cutoff:
+        path, rows = archive_month(month, directory, bind, chunk_size)
+        if rows:
+            print(f"{month:%Y-%m}: {rows} attempts -> {path}", file=sys.stderr)
+            results.append((path, rows))
+        month = add_months(month, 1)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partition and archive quiz attempts")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("partition", help="convert quizz to monthly partitions (Postgres)")
+    ensure = sub.add_parser("ensure", help="create upcoming monthly partitions")
+    ensure.add_argument("--ahead", type=int, default=3)
+    arch = sub.add_parser("archive", help="move old months to compressed files")
+    arch.add_argument("--older-than", type=int, required=True, metavar="MONTHS")
+    arch.add_argument("--dir", default=ARCHIVE_DIR)
+    arch.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    binds = user_data_engines()
+    for number, bind in enumerate(binds):
+        Base.metadata.create_all(bind=bind)
+        if args.command == "partition":
+            done = partition_table(bind)
+            print("Converted quizz to monthly partitions" if done else "Nothing to do", file=sys.stderr)
+        elif args.command == "ensure":
+            print(f"Created {ensure_partitions(bind, ahead=args.ahead)}", file=sys.stderr)
+        else:
+            directory = os.path.join(args.dir, f"shard-{number}") if len(binds) > 1 else args.dir
+            results = archive(args.older_than, directory, bind, chunk_size=args.chunk_size)
+            print(f"Archived {sum(rows for _, rows in results)} attempts", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""On-demand profiling of single production requests.
+
+A request carrying a valid admin token in the X-Profile header (or the
+`profile` query parameter) runs under a sampling profiler and tracemalloc.
+The result is written to PROFILE_DIR as
+
+    <id>.folded     collapsed stacks, one "frame;frame;frame count" per line
+                    (flamegraph.pl, speedscope, inferno)
+    <id>.alloc.txt  the top allocation sites while the request ran
+
+and listed at GET /diagnostics/profiles. Tokens are HMACs over an expiry
+time made with PROFILE_SECRET; without that secret the middleware is not
+installed at all, and requests without a token pass straight through.
+
+    python profiling.py token [--ttl 600]
+"""
+import argparse
+import collections
+import contextvars
+import hashlib
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+SECRET = os.getenv("PROFILE_SECRET", "").encode()
+ENABLED = bool(SECRET)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "1")) / 1000
+TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "25"))
+HEADER = b"x-profile"
+
+_active = contextvars.ContextVar("active_profile", default=None)
+_one_at_a_time = threading.Lock()   # tracemalloc is process-wide
+
+
+def make_token(ttl=600, now=None):
+    expires = int((now or time.time()) + ttl)
+    signature = hmac.new(SECRET, f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify_token(token, now=None):
+    try:
+        expires, signature = token.split(".", 1)
+        expires = int(expires)
+    except ValueError:
+        return False
+    expected = hmac.new(SECRET, f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+    # Bytes, because compare_digest raises TypeError on non-ASCII str
+    return hmac.compare_digest(signature.encode(), expected.encode()) and expires > (now or time.time())
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfile:
+    """Samples the stacks of the threads currently working on one request."""
+
+    def __init__(self, name, interval=SAMPLE_INTERVAL):
+        self.name = name
+        self.interval = interval
+        # The event loop thread runs middleware, async handlers and serialization
+        self.threads = {threading.get_ident()}
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+
+    def thread(self):
+        """Context manager a worker thread enters while it runs this request's code."""
+        return _ProfiledThread(self)
+
+    def start(self):
+        tracemalloc.start(25)
+        self.started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.elapsed = time.perf_counter() - self.started
+        self.snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, directory=None):
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{self.name}.folded"), "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        stats = self.snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]).statistics("lineno")
+        with open(os.path.join(directory, f"{self.name}.alloc.txt"), "w") as f:
+            f.write(f"# {self.name}: {self.elapsed * 1000:.1f} ms, {self.samples} samples\n")
+            f.write(f"# allocated while profiling: {sum(s.size for s in stats) / 1024:.1f} KiB\n")
+            for stat in stats[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+
+
+class _ProfiledThread:
+    __slots__ = ("profile", "ident")
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def __enter__(self):
+        self.ident = threading.get_ident()
+        self.profile.threads.add(self.ident)
+
+    def __exit__(self, *exc):
+        self.profile.threads.discard(self.ident)
+        return False
+
+
+def current():
+    """The profile of the request running in this context, if any."""
+    return _active.get()
+
+
+def _requested_token(scope):
+    for name, value in scope["headers"]:
+        if name == HEADER:
+            return value.decode("latin-1")
+    if b"profile=" in scope.get("query_string", b""):
+        values = parse_qs(scope["query_string"].decode("latin-1")).get("profile")
+        return values[0] if values else None
+    return None
+
+
+def _profile_name(scope):
+    path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{scope['method']}-{path}"
+
+
+class ProfileMiddleware:
+    """Pure ASGI middleware: untagged requests cost one header scan."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _requested_token(scope)
+        if token is None:
+            return await self.app(scope, receive, send)
+        if not verify_token(token):
+            return await JSONResponse({"detail": "Invalid profile token"}, status_code=403)(scope, receive, send)
+        if not _one_at_a_time.acquire(blocking=False):
+            # Another profile is running; serve this one normally
+            return await self.app(scope, receive, send)
+
+        try:
+            profile = RequestProfile(_profile_name(scope))
+
+            async def send_with_id(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-profile-id", profile.name.encode())
+                    ]
+                await send(message)
+
+            context_token = _active.set(profile)
+            profile.start()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profile.stop()
+                _active.reset(context_token)
+            await run_in_threadpool(profile.write)
+        finally:
+            _one_at_a_time.release()
+
+
+def list_profiles(directory=None):
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    profiles = {}
+    for entry in os.scandir(directory):
+        name, _, kind = entry.name.partition(".")
+        if kind not in ("folded", "alloc.txt"):
+            continue
+        item = profiles.setdefault(name, {"id": name, "files": {}})
+        item["files"][kind] = {"file": entry.name, "bytes": entry.stat().st_size}
+        item["created"] = entry.stat().st_mtime
+    return sorted(profiles.values(), key=lambda p: p["created"], reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Request profiling tokens")
+    parser.add_argument("command", choices=["token"])
+    parser.add_argument("--ttl", type=int, default=600, help="seconds the token stays valid")
+    args = parser.parse_args()
+    if not ENABLED:
+        sys.exit("PROFILE_SECRET is not set")
+    print(make_token(args.ttl))
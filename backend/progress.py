@@ -0,0 +1,72 @@
+import json
+import os
+
+from sqlalchemy import ARRAY, Integer, any_, bindparam
+
+from statements import statement
+
+# --------------------------------------------------
+# PROGRESS READ MODELS FOR ONE OR MANY USERS
+# --------------------------------------------------
+# Each function answers for a whole list of users with one set-based query,
+# so a class of 200 costs the same number of round trips as one student.
+# Cohort responses are streamed in chunks; every chunk opens and closes its
+# own session, so a slow client never holds the pooled connection.
+COHORT_CHUNK_SIZE = int(os.getenv("COHORT_CHUNK_SIZE", "500"))
+MAX_COHORT_SIZE = int(os.getenv("MAX_COHORT_SIZE", "5000"))
+
+
+def user_filter(db, column, user_ids):
+    if db.get_bind().dialect.name == "postgresql":
+        # One array parameter keeps a single cached plan for every list size
+        return column == any_(bindparam("user_ids", list(user_ids), type_=ARRAY(Integer)))
+    return column.in_(user_ids)
+
+
+def course_progress(db, user_ids):
+    """{user_id: {course_id: [video_index, ...]}} in the order videos were watched."""
+    result = {user_id: {} for user_id in user_ids}
+    seen = set()
+    rows = db.execute(statement(db, "course_progress"), {"user_ids": list(user_ids)})
+    for user_id, course_id, video_index in rows:
+        if (user_id, course_id, video_index) in seen:
+            continue
+        seen.add((user_id, course_id, video_index))
+        result[user_id].setdefault(course_id, []).append(video_index)
+    return result
+
+
+def quiz_progress(db, user_ids):
+    """{user_id: {quiz_id: {"attempts": n, "bestScore": s}}}, archived months included."""
+    rows = db.execute(statement(db, "quiz_progress"), {"user_ids": list(user_ids)})
+    result = {user_id: {} for user_id in user_ids}
+    for user_id, quiz_id, attempts, best in rows:
+        result[user_id][quiz_id] = {"attempts": attempts, "bestScore": best or 0}
+    return result
+
+
+def stream_cohort(session_factory, user_ids, chunk_size=COHORT_CHUNK_SIZE, route=None):
+    """Yield {"users": {user_id: {"course": ..., "quiz": ...}}} as JSON, chunk by chunk.
+
+    route(user_ids) -> [(session factory, user_ids)] splits a chunk by shard;
+    without it the whole chunk is read through session_factory.
+    """
+    yield '{"users": {'
+    separator = ""
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        courses, quizzes = {}, {}
+        for factory, ids in (route(chunk) if route else [(session_factory, chunk)]):
+            db = factory()
+            try:
+                courses.update(course_progress(db, ids))
+                quizzes.update(quiz_progress(db, ids))
+            finally:
+                db.close()
+        parts = []
+        for user_id in chunk:
+            body = json.dumps({"course": courses[user_id], "quiz": quizzes[user_id]})
+            parts.append(f'{separator}"{user_id}": {body}')
+            separator = ", "
+        yield "".join(parts)
+    yield "}}"
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import threading
+
+# --------------------------------------------------
+# PROGRESS PUSH (IN-PROCESS FAN-OUT + PLUGGABLE BACKEND)
+# --------------------------------------------------
+# Handlers publish from threadpool threads; subscribers are asyncio queues
+# owned by the event loop, so delivery is handed over with
+# call_soon_threadsafe. The backend decides how a message reaches the
+# hubs: LocalBackend delivers in this process only, RedisBackend fans out
+# to every worker that subscribed to the same Redis.
+QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", "100"))
+MAX_CONNECTIONS = int(os.getenv("PUSH_MAX_CONNECTIONS", "5000"))
+HEARTBEAT_SECONDS = float(os.getenv("PUSH_HEARTBEAT_SECONDS", "15"))
+
+
+class LocalBackend:
+    def attach(self, deliver):
+        self._deliver = deliver
+
+    def start(self):
+        pass
+
+    def publish(self, user_id, message):
+        self._deliver(user_id, message)
+
+    def close(self):
+        pass
+
+
+class RedisBackend:
+    CHANNEL_PREFIX = "progress:"
+
+    def __init__(self, url):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+
+    def attach(self, deliver):
+        self._deliver = deliver
+
+    def start(self):
+        # Listener threads are started per worker, never in a pre-fork parent
+        self._pubsub.psubscribe(**{f"{self.CHANNEL_PREFIX}*": self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _on_message(self, item):
+        user_id = int(item["channel"].decode()[len(self.CHANNEL_PREFIX):])
+        self._deliver(user_id, json.loads(item["data"]))
+
+    def publish(self, user_id, message):
+        self._client.publish(f"{self.CHANNEL_PREFIX}{user_id}", json.dumps(message))
+
+    def close(self):
+        if getattr(self, "_thread", None) is not None:
+            self._thread.stop()
+
+
+class ProgressHub:
+    def __init__(self, backend, queue_size=QUEUE_SIZE, max_connections=MAX_CONNECTIONS):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.max_connections = max_connections
+        self._subscribers = {}   # user_id -> set of asyncio.Queue
+        self._loop = None
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        backend.attach(self._deliver_threadsafe)
+
+    def start(self):
+        self.backend.start()
+
+    def stop(self):
+        self.backend.close()
+
+    def subscribe(self, user_id):
+        # Called on the event loop; returns None when the process is full
+        if self.connections >= self.max_connections:
+            return None
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(queue)
+            self.connections += 1
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues and queue in queues:
+                queues.discard(queue)
+                self.connections -= 1
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, message):
+        self.published += 1
+        self.backend.publish(user_id, message)
+
+    def _deliver_threadsafe(self, user_id, message):
+        # Most writes come from users with no open tabs; skip the loop hop
+        if user_id not in self._subscribers or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._deliver, user_id, message)
+
+    def _deliver(self, user_id, message):
+        for queue in list(self._subscribers.get(user_id, ())):
+            if queue.full():
+                # A stalled tab loses its oldest update rather than blocking the rest
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+            self.delivered += 1
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "users": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+def _backend_from_env():
+    url = os.getenv("PUSH_REDIS_URL")
+    return RedisBackend(url) if url else LocalBackend()
+
+
+hub = ProgressHub(_backend_from_env())
+
+
+async def event_stream(request, user_id, queue):
+    # Server-Sent Events; heartbeats keep proxies from closing idle streams
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: progress\ndata: {json.dumps(message)}\n\n"
+    finally:
+        hub.unsubscribe(user_id, queue)
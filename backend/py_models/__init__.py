@@ -0,0 +1,3 @@
+# Every user_id foreign key targets users, so importing any model module
+# registers that table too and create_all() can resolve the references.
+from py_models import signin_models  # noqa: F401
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String
+from database import Base
+
+class CourseUserFurthest(Base):
+    __tablename__ = "course_user_furthest"
+
+    user_id = Column(Integer, primary_key=True)
+    course_id = Column(String, primary_key=True)
+    furthest_index = Column(Integer)
+
+class CourseFunnel(Base):
+    __tablename__ = "course_funnel"
+
+    course_id = Column(String, primary_key=True)
+    video_index = Column(Integer, primary_key=True)
+    users_reached = Column(Integer, default=0)
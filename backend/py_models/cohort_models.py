@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from database import Base
+
+class Cohort(Base):
+    __tablename__ = "cohorts"
+
+    cohort_id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    created_by = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), index=True)
+    created_at = Column(DateTime)
+
+class CohortMember(Base):
+    __tablename__ = "cohort_members"
+
+    cohort_id = Column(Integer, ForeignKey("cohorts.cohort_id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True, index=True)
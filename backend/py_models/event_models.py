@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from database import Base
+
+class LearningEvent(Base):
+    __tablename__ = "learning_events"
+
+    event_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), index=True)
+    event_type = Column(String)  # see events.EVENT_TYPES
+    subject_id = Column(String)  # course_id or quiz_id: 'html', 'css', ...
+    position = Column(Integer)   # video_index / current question index
+    score = Column(Integer)
+    occurred_at = Column(DateTime)
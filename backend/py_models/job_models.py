@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from database import Base
+
+class BackgroundJob(Base):
+    __tablename__ = "background_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    payload = Column(JSON)
+    status = Column(String, default="pending", index=True)  # pending / running / failed
+    attempts = Column(Integer, default=0)
+    run_after = Column(DateTime, index=True)
+    locked_at = Column(DateTime)
+    last_error = Column(String)
+    created_at = Column(DateTime)
@@ -1,11 +1,11 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
 from database import Base
 
 class CourseVideoProgress(Base):
     __tablename__ = "course_video_progress"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"))
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), index=True)
     course_id = Column(String)  # 'html', 'css', 'fastapi', etc.
     video_index = Column(Integer)
 
@@ -13,7 +13,12 @@ class QuizPartialProgress(Base):
     __tablename__ = "quiz_partial_progress"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"))
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), index=True)
     quiz_id = Column(String)    # 'html', 'css', 'fastapi', etc.
     current_index = Column(Integer)
     score = Column(Integer)
+
+    # One row per user and quiz; saves upsert against it
+    __table_args__ = (
+        Index("uq_quiz_partial_progress_user_quiz", "user_id", "quiz_id", unique=True),
+    )
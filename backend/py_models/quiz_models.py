@@ -1,5 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey
 from database import Base
 
 class Quiz(Base):
@@ -7,6 +6,32 @@ class Quiz(Base):
 
     result_id = Column(Integer, primary_key=True, index=True)
     quiz_id = Column(String)
-    user_id = Column(Integer, ForeignKey("users.user_id"))
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), index=True)
     score = Column(Integer)
-    attempt_date = Column(String) 
+    attempt_date = Column(String)
+    attempted_at = Column(DateTime, index=True)
+
+# Aggregates left behind when old attempts are archived (partitions.py)
+class QuizArchiveSummary(Base):
+    __tablename__ = "quizz_archive_summary"
+
+    user_id = Column(Integer, primary_key=True)
+    quiz_id = Column(String, primary_key=True)
+    attempts = Column(Integer, default=0)
+    best_score = Column(Integer)
+
+class QuizArchiveDaily(Base):
+    __tablename__ = "quizz_archive_daily"
+
+    day = Column(Date, primary_key=True)
+    quiz_id = Column(String, primary_key=True)
+    attempts = Column(Integer, default=0)
+
+# One row per archived month: quiz_completed events up to through_event_id
+# are in the summaries above, so events.py replay must not project them again
+class QuizArchiveMonth(Base):
+    __tablename__ = "quizz_archive_months"
+
+    month = Column(DateTime, primary_key=True)
+    through_event_id = Column(Integer)
+    archived_at = Column(DateTime)
@@ -0,0 +1,10 @@
+from sqlalchemy import Boolean, Column, Integer
+from database import Base
+
+class UserDirectory(Base):
+    __tablename__ = "user_directory"
+
+    # Also hands out user ids once users live on several databases
+    user_id = Column(Integer, primary_key=True)
+    shard = Column(Integer, nullable=False, index=True)
+    moving = Column(Boolean, nullable=False, default=False)
@@ -1,6 +1,10 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, DateTime, Index, func, text
 from database import Base
 
+def normalize_email(email):
+    """The form emails are stored and looked up in; matches the unique index."""
+    return email.strip().lower() if email is not None else None
+
 class User(Base):
     __tablename__ = "users"
 
@@ -12,3 +16,20 @@ class User(Base):
     user_phone = Column(String)
     user_gender = Column(String)
     user_created_at = Column(String, default="January 2024")
+    user_registered_at = Column(DateTime, index=True)
+    user_version = Column(Integer, default=1)  # bumped by every profile update
+    user_updated_at = Column(DateTime)
+    user_deleted_at = Column(DateTime)  # set on account deletion; the purge job removes the row
+    user_role = Column(String)  # None or "student"; "instructor" and "admin" manage cohorts
+
+# Lookups compare the same expression so rows stored before emails were
+# normalized still match
+email_key = func.lower(func.trim(User.user_email))
+
+# One live account per email, whatever its case; a deleted account's email
+# can sign up again
+Index(
+    "uq_users_email_lower_active", email_key, unique=True,
+    sqlite_where=text("user_deleted_at IS NULL"),
+    postgresql_where=text("user_deleted_at IS NULL"),
+)
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class CreateCohort(BaseModel):
+    name: str
+    user_ids: List[int]
+
+class CohortProgressRequest(BaseModel):
+    user_ids: Optional[List[int]] = None
+    cohort_id: Optional[int] = None
@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+from typing import List, Optional
+import datetime
+
+class LearningEventItem(BaseModel):
+    event_type: str
+    subject_id: str
+    position: Optional[int] = None
+    score: Optional[int] = None
+    occurred_at: Optional[datetime.datetime] = None
+
+class LearningEventBatch(BaseModel):
+    user_id: int
+    events: List[LearningEventItem]
@@ -0,0 +1,180 @@
+import math
+import os
+import threading
+import time
+
+from fastapi import HTTPException, Request
+
+# --------------------------------------------------
+# TOKEN-BUCKET ADMISSION CONTROL FOR WRITE ROUTES
+# --------------------------------------------------
+# Limits are "<burst>/<tokens per second>" and can be overridden per
+# route group with RATE_LIMIT_<GROUP>, e.g. RATE_LIMIT_QUIZ="40/4".
+# Login and signup are keyed on the submitted email, so a classroom behind
+# one NAT address is not throttled as one client; "<group>_ip" still caps
+# what a single address may try across many emails.
+DEFAULT_LIMITS = {
+    "account": "5/0.5",
+    "account_ip": "100/2",
+    "course": "10/1",
+    "quiz": "20/2",
+    "progress": "30/5",
+}
+
+
+def parse_limit(value):
+    burst, rate = value.split("/", 1)
+    return float(burst), float(rate)
+
+
+class MemoryBucketStore:
+    """Per-process buckets kept in a dict: {key: [tokens, last_refill]}."""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, rate):
+        # Returns 0 when a token was taken, else seconds until one is available
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict_idle(now, rate, burst)
+                bucket = self._buckets[key] = [burst, now]
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate if rate > 0 else 60.0
+
+    def _evict_idle(self, now, rate, burst):
+        # A bucket that would have refilled completely carries no state
+        idle_after = burst / rate if rate > 0 else 3600
+        for key, (_, last) in list(self._buckets.items()):
+            if now - last >= idle_after:
+                del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    """Buckets shared by every worker/instance through Redis (optional dependency)."""
+
+    SCRIPT = """
+local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+elseif rate > 0 then
+    wait = (1 - tokens) / rate
+else
+    wait = 60
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / math.max(rate, 0.001)) + 1)
+return tostring(wait)
+"""
+
+    def __init__(self, url):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take(self, key, burst, rate):
+        return float(self._take(keys=[f"ratelimit:{key}"], args=[burst, rate, time.time()]))
+
+
+class RateLimiter:
+    def __init__(self, store, limits, enabled=True):
+        self.store = store
+        self.limits = limits
+        self.enabled = enabled
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls):
+        limits = {
+            group: parse_limit(os.getenv(f"RATE_LIMIT_{group.upper()}", default))
+            for group, default in DEFAULT_LIMITS.items()
+        }
+        redis_url = os.getenv("RATE_LIMIT_REDIS_URL")
+        store = RedisBucketStore(redis_url) if redis_url else MemoryBucketStore()
+        enabled = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+        return cls(store, limits, enabled)
+
+    def check(self, group, identity):
+        if not self.enabled:
+            return
+        burst, rate = self.limits[group]
+        wait = self.store.take(f"{group}:{identity}", burst, rate)
+        if wait > 0:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+
+limiter = RateLimiter.from_env()
+
+
+async def _json_body(request):
+    # The body is already buffered by FastAPI
+    if request.method not in ("POST", "PUT", "PATCH"):
+        return None
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+async def request_user_id(request: Request):
+    # user_id comes from the path (/user/{user_id}) or the JSON body of the
+    # progress/quiz writes
+    user_id = request.path_params.get("user_id")
+    if user_id is None:
+        user_id = (await _json_body(request) or {}).get("user_id")
+    try:
+        return int(user_id) if user_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def request_email(request: Request):
+    # Login and signup name their account by email instead
+    email = (await _json_body(request) or {}).get("user_email")
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def rate_limit(group):
+    async def dependency(request: Request):
+        user_id = await request_user_id(request)
+        request.state.user_id = user_id
+        ip = f"ip:{request.client.host if request.client else 'unknown'}"
+        if user_id is not None:
+            limiter.check(group, f"user:{user_id}")
+            return
+        email = await request_email(request)
+        if email is None:
+            limiter.check(group, ip)
+            return
+        limiter.check(group, f"email:{email}")
+        if f"{group}_ip" in limiter.limits:
+            limiter.check(f"{group}_ip", ip)
+
+    return dependency
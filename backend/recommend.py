@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import func, select
+
+from database import SessionLocal, ShardSessionLocals, background_session
+
+from py_models.quiz_models import Quiz, QuizArchiveSummary
+from py_models.progress_models import CourseVideoProgress
+
+logger = logging.getLogger("skillnest.recommend")
+
+# --------------------------------------------------
+# "WHAT TO LEARN NEXT" (ITEM-ITEM CO-COMPLETION)
+# --------------------------------------------------
+# Items are the learning tracks used as course_id / quiz_id ('html',
+# 'python', ...). A user x item matrix marks every track a user has
+# completed: every video of a course marked complete, or a quiz submitted.
+# Item-item cosine similarity comes from one matrix product, and users'
+# scores for every item from a second. Requests only read a cached row and
+# take its top K.
+#
+# The model is built in the background at startup and rebuilt every
+# RECOMMEND_REFRESH_SECONDS, so new completions show up within that
+# interval. Until the first build finishes requests do not wait for it:
+# they get no recommendations and ready: false.
+REFRESH_SECONDS = float(os.getenv("RECOMMEND_REFRESH_SECONDS", "600"))
+# Videos in each course; every track in frontend/video_pages has ten
+COURSE_VIDEOS = int(os.getenv("COURSE_VIDEOS", "10"))
+
+
+class RecommendationModel:
+    def __init__(self, items, user_rows, scores, popularity):
+        self.items = items              # column index -> item key
+        self.user_rows = user_rows      # user_id -> row index
+        self.scores = scores            # users x items, float32
+        self.popularity = popularity    # items, for users with no history
+        self.built_at = time.time()
+
+    @classmethod
+    def build(cls, pairs):
+        users = sorted({u for u, _ in pairs})
+        items = sorted({i for _, i in pairs})
+        user_rows = {u: n for n, u in enumerate(users)}
+        item_cols = {i: n for n, i in enumerate(items)}
+
+        matrix = np.zeros((len(users), len(items)), dtype=np.float32)
+        if pairs:
+            rows = np.fromiter((user_rows[u] for u, _ in pairs), dtype=np.int64, count=len(pairs))
+            cols = np.fromiter((item_cols[i] for _, i in pairs), dtype=np.int64, count=len(pairs))
+            matrix[rows, cols] = 1.0
+
+        co_counts = matrix.T @ matrix
+        norms = np.sqrt(np.diag(co_counts))
+        norms[norms == 0] = 1.0
+        similarity = co_counts / np.outer(norms, norms)
+        np.fill_diagonal(similarity, 0.0)
+
+        scores = matrix @ similarity
+        scores[matrix > 0] = -np.inf   # never recommend what the user already did
+        return cls(items, user_rows, scores, matrix.sum(axis=0))
+
+    def recommend(self, user_id, k):
+        row = self.user_rows.get(user_id)
+        if row is None:
+            scores = self.popularity.astype(np.float32)
+        else:
+            scores = self.scores[row]
+        k = min(k, len(self.items))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"item": self.items[i], "score": round(float(scores[i]), 4)}
+            for i in top
+            if np.isfinite(scores[i]) and scores[i] > 0
+        ]
+
+
+def load_pairs(db):
+    pairs = set()
+    # A course counts once all of its videos are marked, not from the first one
+    for user_id, item in db.execute(
+        select(CourseVideoProgress.user_id, CourseVideoProgress.course_id)
+        .where(CourseVideoProgress.video_index.between(0, COURSE_VIDEOS - 1))
+        .group_by(CourseVideoProgress.user_id, CourseVideoProgress.course_id)
+        .having(func.count(CourseVideoProgress.video_index.distinct()) >= COURSE_VIDEOS)
+    ):
+        if user_id is not None and item:
+            pairs.add((user_id, item))
+    # Submitted results only; saved partial progress is not a completion
+    for user_id, item in db.execute(select(Quiz.user_id, Quiz.quiz_id).distinct()):
+        if user_id is not None and item:
+            pairs.add((user_id, item))
+    # Users whose attempts were all archived still took those quizzes
+    for user_id, item in db.execute(select(QuizArchiveSummary.user_id, QuizArchiveSummary.quiz_id)):
+        pairs.add((user_id, item))
+    return list(pairs)
+
+
+class Recommender:
+    def __init__(self, session_factories, refresh_seconds=REFRESH_SECONDS):
+        self.session_factories = session_factories   # every shard's, or just the primary's
+        self.refresh_seconds = refresh_seconds
+        self._model = None
+        self._refreshing = threading.Lock()
+
+    def refresh(self):
+        pairs = []
+        for factory in self.session_factories:
+            db = background_session(factory)
+            try:
+                pairs.extend(load_pairs(db))
+            finally:
+                db.close()
+        self._model = RecommendationModel.build(pairs)
+        return self._model
+
+    def start(self):
+        """Build the first model off the request path."""
+        self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        if not self._refreshing.acquire(blocking=False):
+            return
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Recommendation model build failed")
+            finally:
+                self._refreshing.release()
+        threading.Thread(target=run, name="recommend-refresh", daemon=True).start()
+
+    def model(self):
+        model = self._model
+        if model is None:
+            # Not built yet: no request waits for it
+            self._refresh_in_background()
+            return None
+        if time.time() - model.built_at > self.refresh_seconds:
+            # Serve the stale model while a fresh one is computed
+            self._refresh_in_background()
+        return model
+
+    def recommend(self, user_id, k=3):
+        model = self.model()
+        if model is None:
+            return {"user_id": user_id, "ready": False, "built_at": None, "recommendations": []}
+        return {"user_id": user_id, "ready": True, "built_at": model.built_at, "recommendations": model.recommend(user_id, k)}
+
+
+recommender = Recommender(ShardSessionLocals or [SessionLocal])
@@ -0,0 +1,140 @@
+import re
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import func, literal_column, select
+
+from py_models.course_models import Course
+
+from cache_bus import bus
+
+# --------------------------------------------------
+# COURSE SEARCH (POSTGRES FULL TEXT / IN-MEMORY INDEX)
+# --------------------------------------------------
+# On Postgres the catalog is matched with a tsvector expression backed by a
+# GIN index (created in migrations.upgrade). Other databases (SQLite in
+# tests and small installs) use an inverted index held in memory, rebuilt
+# lazily after create_course marks it stale.
+SEARCH_DOCUMENT = (
+    "coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || coalesce(category, '')"
+)
+SEARCH_VECTOR = f"to_tsvector('english', {SEARCH_DOCUMENT})"
+SEARCH_INDEX_DDL = (
+    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_course_search ON course USING GIN ({SEARCH_VECTOR})"
+)
+FACETS = ("level", "category")
+MAX_PAGE_SIZE = 100
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(value):
+    return _TOKEN.findall((value or "").lower())
+
+
+def _course_dict(course):
+    return {
+        "course_id": course.course_id,
+        "title": course.title,
+        "description": course.description,
+        "category": course.category,
+        "level": course.level,
+        "create_by": course.create_by,
+        "created_at": course.created_at,
+    }
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._postings = {}   # term -> {course_id: term frequency}
+        self._courses = {}    # course_id -> course dict
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._stale = True
+
+    def _rebuild(self, db):
+        postings = defaultdict(Counter)
+        courses = {}
+        for course in db.query(Course).all():
+            courses[course.course_id] = _course_dict(course)
+            for term in tokenize(f"{course.title} {course.description} {course.category}"):
+                postings[term][course.course_id] += 1
+        self._postings, self._courses = dict(postings), courses
+        self._stale = False
+
+    def search(self, db, q, filters):
+        with self._lock:
+            if self._stale:
+                self._rebuild(db)
+            postings, courses = self._postings, self._courses
+
+        terms = tokenize(q)
+        if terms:
+            # Every term must match (AND); score is the summed term frequency
+            scores = Counter(postings.get(terms[0], {}))
+            for term in terms[1:]:
+                matches = postings.get(term, {})
+                scores = Counter({cid: s + matches[cid] for cid, s in scores.items() if cid in matches})
+            ranked = sorted(scores, key=lambda cid: (-scores[cid], cid))
+        else:
+            ranked = sorted(courses)
+
+        facets = {name: Counter(courses[cid][name] for cid in ranked) for name in FACETS}
+        hits = [
+            courses[cid] for cid in ranked
+            if all(courses[cid][name] == value for name, value in filters.items())
+        ]
+        return hits, facets
+
+
+catalog_index = InvertedIndex()
+bus.on("catalog", lambda key: catalog_index.invalidate())
+
+
+def _postgres_search(db, q, filters, offset, limit):
+    # Must match the indexed expression verbatim for the planner to use the GIN index
+    document = literal_column(SEARCH_VECTOR)
+    matched = select(Course)
+    rank = None
+    if q.strip():
+        query = func.plainto_tsquery(literal_column("'english'"), q)
+        matched = matched.where(document.op("@@")(query))
+        rank = func.ts_rank(document, query)
+
+    # Facet counts ignore the facet filters so clients can offer the alternatives
+    facets = {}
+    for name in FACETS:
+        column = getattr(Course, name)
+        rows = db.execute(matched.with_only_columns(column, func.count()).group_by(column))
+        facets[name] = dict(rows.all())
+
+    filtered = matched
+    for name, value in filters.items():
+        filtered = filtered.where(getattr(Course, name) == value)
+    total = db.scalar(select(func.count()).select_from(filtered.subquery()))
+    ordering = [rank.desc(), Course.course_id] if rank is not None else [Course.course_id]
+    courses = db.scalars(filtered.order_by(*ordering).offset(offset).limit(limit)).all()
+    return [_course_dict(c) for c in courses], total, facets
+
+
+def search_courses(db, q="", level=None, category=None, page=1, page_size=20):
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    offset = (page - 1) * page_size
+    filters = {name: value for name, value in (("level", level), ("category", category)) if value}
+
+    if db.bind.dialect.name == "postgresql":
+        results, total, facets = _postgres_search(db, q, filters, offset, page_size)
+    else:
+        hits, facets = catalog_index.search(db, q, filters)
+        results, total = hits[offset:offset + page_size], len(hits)
+
+    return {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "results": results,
+        "facets": {name: dict(counts) for name, counts in facets.items()},
+    }
@@ -0,0 +1,128 @@
+"""Pre-forking production server for running SkillNest on our own boxes.
+
+    python serve.py --workers 8 --port 8000
+
+The parent imports the app once (so workers share its memory pages), binds
+the listening socket and forks N uvicorn workers that all accept on it.
+Idempotent schema changes run once in the parent before forking; data
+migrations are a separate `python migrations.py upgrade` step.
+SIGTERM/SIGINT are forwarded to the workers, which finish in-flight
+requests and drain background jobs; stragglers are killed after
+--graceful-timeout. Workers that die unexpectedly are replaced.
+
+In-process caches are kept coherent through cache_bus; with more than one
+worker the Unix-socket transport is used unless CACHE_BUS is set.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the SkillNest API with N worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--backlog", type=int, default=2048)
+    return parser.parse_args(argv)
+
+
+class Master:
+    def __init__(self, args):
+        self.args = args
+        self.workers = {}   # pid -> worker number
+        self.stopping = False
+
+    def bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.args.host, self.args.port))
+        sock.listen(self.args.backlog)
+        sock.set_inheritable(True)
+        self.sock = sock
+
+    def preload(self):
+        import uvicorn
+        from main import app, prepare_schema
+        from database import engine, replica_engine, shard_engines, background_engines
+
+        # Once here rather than racing in every worker's startup
+        prepare_schema()
+        os.environ["SKILLNEST_SCHEMA_PREPARED"] = "1"
+
+        self.uvicorn = uvicorn
+        self.app = app
+        # A shard may be the primary itself; dispose each engine once
+        self.engines = list(dict.fromkeys(
+            e for e in (engine, replica_engine, *shard_engines, *background_engines.values()) if e is not None
+        ))
+
+    def spawn(self, number):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = number
+            return
+        # Child: default signal handling so uvicorn can install its own
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        for engine in self.engines:
+            # Never reuse a pooled connection that was opened in the parent
+            engine.dispose(close=False)
+        config = self.uvicorn.Config(self.app, log_level="info", timeout_graceful_shutdown=self.args.graceful_timeout)
+        server = self.uvicorn.Server(config)
+        try:
+            server.run(sockets=[self.sock])
+        finally:
+            os._exit(0)
+
+    def stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        self.bind()
+        self.preload()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for number in range(self.args.workers):
+            self.spawn(number)
+        print(f"SkillNest master {os.getpid()} serving on {self.args.host}:{self.args.port} "
+              f"with {self.args.workers} workers", file=sys.stderr)
+
+        deadline = None
+        while self.workers:
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + self.args.graceful_timeout
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if deadline is not None and time.monotonic() > deadline:
+                    for straggler in list(self.workers):
+                        os.kill(straggler, signal.SIGKILL)
+                time.sleep(0.2)
+                continue
+            number = self.workers.pop(pid, None)
+            if not self.stopping and number is not None:
+                print(f"Worker {pid} exited with status {status}; restarting", file=sys.stderr)
+                self.spawn(number)
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.workers > 1:
+        # Must be set before the app (and cache_bus) are imported
+        os.environ.setdefault("CACHE_BUS", "unix")
+    Master(args).run()
@@ -0,0 +1,294 @@
+"""User shards: id allocation, directory maintenance and moving users.
+
+With SHARD_DATABASE_URLS set (see database.py) every user lives on one
+shard, recorded in user_directory on the primary database:
+
+    python shards.py init                       # once, when turning sharding on
+    python shards.py status
+    python shards.py move --user 42 --to 1
+    python shards.py rebalance [--dry-run]
+
+`init` creates the schema on every shard and registers the existing users
+(all on the first shard) in the directory, so user ids keep increasing from
+there. On Postgres it also drops the primary's cohort foreign keys to users,
+since cohort members may live on any shard. New users get their id from the directory and a shard picked from
+their email.
+
+A move marks the user as moving, waits out the routers' directory cache so
+every process refuses the user's writes (503 + Retry-After), copies the
+rows, points the directory at the new shard, waits again so reads follow,
+and only then purges the old copy. Reads are never interrupted.
+"""
+import argparse
+import sys
+import time
+import zlib
+
+from sqlalchemy import delete, func, inspect, insert, select, text, update
+
+from database import (
+    Base, SessionLocal, engine, shard_engines, ShardSessionLocals, SHARD_DIRECTORY_TTL,
+)
+
+from py_models.signin_models import User
+from py_models.quiz_models import QuizArchiveSummary
+from py_models.event_models import LearningEvent
+from py_models.analytics_models import CourseUserFurthest
+from py_models.shard_models import UserDirectory
+
+import accounts
+import analytics
+import events
+import migrations
+import partitions
+
+COPY_CHUNK_SIZE = 1000
+
+# Tables copied verbatim on a move; the rest is rebuilt or belongs to the primary
+COPY_TABLES = [User.__table__] + [table for table, _ in accounts.PURGE_TABLES] + [QuizArchiveSummary.__table__]
+
+
+def shard_count():
+    return len(shard_engines)
+
+
+def place(email):
+    """Shard for a new account: stable for an email, spread evenly."""
+    return zlib.crc32((email or "").strip().lower().encode()) % shard_count()
+
+
+def allocate_user(email):
+    """Reserve a user id on the primary; returns (user_id, shard)."""
+    shard = place(email)
+    db = SessionLocal()
+    try:
+        user_id = db.scalar(insert(UserDirectory).values(shard=shard, moving=False).returning(UserDirectory.user_id))
+        db.commit()
+    finally:
+        db.close()
+    return user_id, shard
+
+
+def release_user(user_id):
+    """Give back an id from allocate_user whose account was never created."""
+    db = SessionLocal()
+    try:
+        db.execute(delete(UserDirectory).where(UserDirectory.user_id == user_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def init():
+    """Create the schema on every shard and register pre-sharding users."""
+    Base.metadata.create_all(bind=engine)
+    for shard_engine in shard_engines:
+        if shard_engine is not engine:
+            Base.metadata.create_all(bind=shard_engine)
+            migrations.upgrade(shard_engine)
+    # One session at a time: the first shard may be the primary itself
+    with ShardSessionLocals[0]() as first:
+        existing = first.scalars(select(User.user_id)).all()
+    db = SessionLocal()
+    try:
+        known = set(db.scalars(select(UserDirectory.user_id)))
+        rows = [{"user_id": user_id, "shard": 0, "moving": False} for user_id in existing if user_id not in known]
+        for start in range(0, len(rows), COPY_CHUNK_SIZE):
+            db.execute(insert(UserDirectory), rows[start:start + COPY_CHUNK_SIZE])
+        if engine.dialect.name == "postgresql":
+            # Explicit ids don't advance the sequence
+            db.execute(text(
+                "SELECT setval(pg_get_serial_sequence('user_directory', 'user_id'), "
+                "GREATEST((SELECT MAX(user_id) FROM user_directory), 1))"
+            ))
+        db.commit()
+    finally:
+        db.close()
+    if engine.dialect.name == "postgresql":
+        # Cohorts stay on the primary but their creators and members may live on any shard
+        for table in ("cohorts", "cohort_members"):
+            for fk in inspect(engine).get_foreign_keys(table):
+                if fk["referred_table"] == "users":
+                    with engine.begin() as conn:
+                        conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {fk['name']}"))
+    return len(rows)
+
+
+def counts():
+    db = SessionLocal()
+    try:
+        found = dict(db.execute(select(UserDirectory.shard, func.count()).group_by(UserDirectory.shard)).all())
+    finally:
+        db.close()
+    return [found.get(shard, 0) for shard in range(shard_count())]
+
+
+def _set_directory(user_id, **values):
+    db = SessionLocal()
+    try:
+        db.execute(update(UserDirectory).where(UserDirectory.user_id == user_id).values(**values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _copy_rows(source, target, user_id):
+    copied = 0
+    for table in COPY_TABLES:
+        # Surrogate keys are per database; the target assigns its own
+        skip = table.autoincrement_column if table is not User.__table__ else None
+        columns = [c for c in table.columns if c is not skip]
+        result = source.execute(
+            select(*columns).where(table.c.user_id == user_id).order_by(*table.primary_key.columns)
+        ).mappings()
+        for chunk in result.partitions(COPY_CHUNK_SIZE):
+            target.execute(insert(table), [dict(row) for row in chunk])
+            copied += len(chunk)
+    # Rollups are per shard: count the user's furthest videos into the target's funnel
+    for course_id, furthest in source.execute(
+        select(CourseUserFurthest.course_id, CourseUserFurthest.furthest_index)
+        .where(CourseUserFurthest.user_id == user_id)
+    ).all():
+        analytics.record_video(target, user_id, course_id, furthest)
+    _carry_archive_marks(source, target, user_id)
+    return copied
+
+
+def _carry_archive_marks(source, target, user_id):
+    """Keep the user's archived attempts archived under their new event ids.
+
+    Event ids are per shard, so the copies land above the target's archive
+    watermarks and a replay would count them next to their summaries. Each
+    month's watermark is raised over them, but only when no other event of
+    that month would be swept in with them.
+    """
+    archived = partitions.archived_months(source)
+    if not archived:
+        return
+    completed = (LearningEvent.user_id == user_id) & (LearningEvent.event_type == events.QUIZ_COMPLETED)
+    columns = (LearningEvent.event_id, LearningEvent.occurred_at)
+    old = source.execute(select(*columns).where(completed).order_by(LearningEvent.event_id)).all()
+    # Copied in event id order, so the nth copy is the nth original
+    new = target.execute(select(*columns).where(completed).order_by(LearningEvent.event_id)).all()
+    moved = {}
+    for before, after in zip(old, new):
+        if events._is_archived(before, archived):
+            moved.setdefault(partitions.month_start(before.occurred_at), set()).add(after.event_id)
+
+    marks = partitions.archived_months(target)
+    for month, ids in moved.items():
+        through = max(ids)
+        swept = target.scalars(select(LearningEvent.event_id).where(
+            LearningEvent.event_type == events.QUIZ_COMPLETED,
+            LearningEvent.occurred_at >= month,
+            LearningEvent.occurred_at < partitions.add_months(month, 1),
+            LearningEvent.event_id > marks.get(month, 0),
+            LearningEvent.event_id <= through,
+        )).all()
+        if set(swept) - ids:
+            raise RuntimeError(
+                f"Shard has unarchived attempts for {month:%Y-%m}; archive it there before moving user {user_id}"
+            )
+        if through > marks.get(month, 0):
+            partitions._record_month(target, month, through)
+
+
+def move_user(user_id, target, wait=SHARD_DIRECTORY_TTL):
+    """Move one user's rows to shard `target`; returns the number of rows copied."""
+    db = SessionLocal()
+    try:
+        entry = db.get(UserDirectory, user_id)
+        source = entry.shard if entry is not None else None
+    finally:
+        db.close()
+    if source is None:
+        raise ValueError(f"User {user_id} is not in the directory; run init first")
+    if not 0 <= target < shard_count():
+        raise ValueError(f"No shard {target}")
+    if source == target:
+        return 0
+
+    _set_directory(user_id, moving=True)
+    time.sleep(wait)  # every router has now seen the flag and refuses writes
+    # Sessions are closed before the directory is touched: a shard may be the primary
+    try:
+        with ShardSessionLocals[source]() as source_db, ShardSessionLocals[target]() as target_db:
+            copied = _copy_rows(source_db, target_db, user_id)
+            target_db.commit()
+    except Exception:
+        _set_directory(user_id, moving=False)
+        raise
+    _set_directory(user_id, shard=target, moving=False)
+    time.sleep(wait)  # reads have followed to the target
+
+    with ShardSessionLocals[source]() as source_db:
+        # Cohort memberships belong to the primary's cohorts, not to the shard
+        accounts.purge_rows(source_db, user_id, memberships=False)
+        source_db.execute(User.__table__.delete().where(User.user_id == user_id))
+        source_db.commit()
+    return copied
+
+
+def plan_rebalance(current):
+    """[(from_shard, to_shard, users)] that evens out the per-shard user counts."""
+    current = list(current)
+    moves = []
+    while True:
+        heaviest = max(range(len(current)), key=current.__getitem__)
+        lightest = min(range(len(current)), key=current.__getitem__)
+        users = (current[heaviest] - current[lightest]) // 2
+        if users <= 0:
+            return moves
+        moves.append((heaviest, lightest, users))
+        current[heaviest] -= users
+        current[lightest] += users
+
+
+def rebalance(dry_run=False, wait=SHARD_DIRECTORY_TTL):
+    moves = plan_rebalance(counts())
+    moved = 0
+    for source, target, users in moves:
+        print(f"shard {source} -> shard {target}: {users} users", file=sys.stderr)
+        if dry_run:
+            continue
+        db = SessionLocal()
+        try:
+            # Most recently created users first; they have the least history to copy
+            user_ids = db.scalars(
+                select(UserDirectory.user_id).where(UserDirectory.shard == source)
+                .order_by(UserDirectory.user_id.desc()).limit(users)
+            ).all()
+        finally:
+            db.close()
+        for user_id in user_ids:
+            move_user(user_id, target, wait)
+            moved += 1
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SkillNest user shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("init", help="create shard schemas and register existing users")
+    sub.add_parser("status", help="users per shard")
+    move = sub.add_parser("move", help="move one user to another shard")
+    move.add_argument("--user", type=int, required=True)
+    move.add_argument("--to", type=int, required=True)
+    move.add_argument("--wait", type=float, default=SHARD_DIRECTORY_TTL,
+                      help="seconds for routers to notice directory changes")
+    balance = sub.add_parser("rebalance", help="even out users per shard")
+    balance.add_argument("--dry-run", action="store_true")
+    balance.add_argument("--wait", type=float, default=SHARD_DIRECTORY_TTL)
+    args = parser.parse_args()
+
+    if not shard_engines:
+        sys.exit("SHARD_DATABASE_URLS is not set")
+    if args.command == "init":
+        print(f"Registered {init()} existing users on shard 0", file=sys.stderr)
+    elif args.command == "status":
+        for shard, users in enumerate(counts()):
+            print(f"shard {shard}: {users} users")
+    elif args.command == "move":
+        print(f"Copied {move_user(args.user, args.to, args.wait)} rows", file=sys.stderr)
+    else:
+        print(f"Moved {rebalance(args.dry_run, args.wait)} users", file=sys.stderr)
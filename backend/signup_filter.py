@@ -0,0 +1,175 @@
+"""Bloom filter over registered emails for the signup duplicate check.
+
+Emails are stored normalized (trimmed, lower case), and once `python
+migrations.py upgrade` has created the unique index on lower(trim(user_email))
+no duplicate live account can be stored; fingerprints use the same normal
+form. The filter only saves the lookup that turns a duplicate into a clean
+409: an email the filter has never seen is definitely new and create_user
+inserts it straight away, and only probable hits (real duplicates plus
+SIGNUP_FILTER_FP_RATE of new emails) query the database. Without that index,
+or with shards (a moved user's email lives on another shard than the one a
+new account is placed on), nothing would catch a miss, so every signup is
+looked up.
+
+The filter is built in the background at startup by streaming the email
+column of every shard; until it is ready every signup is checked. Each
+process keeps its own filter: new emails are added locally and broadcast on
+the cache bus as a hash. A process that has not heard of an email yet lets
+the insert run into the unique index, which also answers 409.
+
+    SIGNUP_FILTER_CAPACITY   emails sized for (default 1M, or twice the
+                             registered users if that is more)
+    SIGNUP_FILTER_FP_RATE    target false-positive rate (default 0.01)
+    SIGNUP_FILTER_MAX_BYTES  memory cap; a capped filter has a higher rate
+    SIGNUP_FILTER=0          disables it: every signup is checked
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+
+from sqlalchemy import func, select
+
+from cache_bus import bus
+
+from py_models.signin_models import User, normalize_email
+
+ENABLED = os.getenv("SIGNUP_FILTER", "1") != "0"
+CAPACITY = int(os.getenv("SIGNUP_FILTER_CAPACITY", "1000000"))
+FALSE_POSITIVE_RATE = float(os.getenv("SIGNUP_FILTER_FP_RATE", "0.01"))
+MAX_BYTES = int(os.getenv("SIGNUP_FILTER_MAX_BYTES", str(16 * 1024 * 1024)))
+BUILD_CHUNK_SIZE = 10000
+
+logger = logging.getLogger("skillnest.signup_filter")
+
+
+def fingerprint(email):
+    # Case variants of one address share a fingerprint, as they share the index entry
+    return hashlib.blake2b((normalize_email(email) or "").encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    def __init__(self, capacity, fp_rate=FALSE_POSITIVE_RATE, max_bytes=MAX_BYTES):
+        bits = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+        self.size = max(64, min(bits, max_bytes * 8))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        first = int.from_bytes(key[:8], "little")
+        step = int.from_bytes(key[8:], "little") | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def false_positive_rate(self):
+        """Expected rate at the current fill."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    @property
+    def bytes(self):
+        return len(self._bits)
+
+
+class SignupFilter:
+    def __init__(self):
+        self.bloom = None
+        self.ready = False
+        self._lock = threading.Lock()   # bit updates are read-modify-write
+        self.checks = 0
+        self.skipped = 0
+        self.lookups = 0
+        self.false_positives = 0
+
+    def build(self, engines):
+        """Stream the live emails of every engine into a fresh filter."""
+        registered = 0
+        for bind in engines:
+            with bind.connect() as conn:
+                registered += conn.execute(
+                    select(func.count()).select_from(User).where(User.user_deleted_at.is_(None))
+                ).scalar()
+        bloom = BloomFilter(max(CAPACITY, 2 * registered))
+        with self._lock:
+            # Emails created from here on are added as they commit
+            self.bloom, self.ready = bloom, False
+        for bind in engines:
+            with bind.connect() as conn:
+                result = conn.execution_options(yield_per=BUILD_CHUNK_SIZE).execute(
+                    select(User.user_email).where(User.user_deleted_at.is_(None), User.user_email.is_not(None))
+                )
+                for chunk in result.partitions():
+                    with self._lock:
+                        for (email,) in chunk:
+                            bloom.add(fingerprint(email))
+        self.ready = True
+        return bloom.count
+
+    def start(self, engines):
+        if not ENABLED:
+            return
+
+        def run():
+            try:
+                self.build(engines)
+            except Exception:
+                logger.exception("Signup filter build failed; signups are checked in the database")
+
+        threading.Thread(target=run, name="signup-filter", daemon=True).start()
+
+    def exists(self, email, lookup, may_skip=True):
+        """Whether `email` is registered; lookup(email) asks the database on probable hits only.
+
+        may_skip=False looks every email up: nothing behind the filter would catch a miss.
+        """
+        self.checks += 1
+        probable = not self.ready or fingerprint(email) in self.bloom
+        if not probable and may_skip:
+            self.skipped += 1
+            return False
+        self.lookups += 1
+        found = lookup(email)
+        if not found and probable and self.ready:
+            self.false_positives += 1
+        return found
+
+    def add(self, email):
+        key = fingerprint(email)
+        self._add(key)
+        bus.broadcast("signup_emails", key.hex())
+
+    def _add(self, key):
+        with self._lock:
+            if self.bloom is not None:
+                self.bloom.add(key)
+
+    def stats(self):
+        bloom = self.bloom
+        return {
+            "enabled": ENABLED,
+            "ready": self.ready,
+            "emails": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else None,
+            "bytes": bloom.bytes if bloom else 0,
+            "hashes": bloom.hashes if bloom else None,
+            "expected_fp_rate": round(bloom.false_positive_rate(), 6) if bloom else None,
+            "checks": self.checks,
+            "skipped_lookups": self.skipped,
+            "lookups": self.lookups,
+            "false_positives": self.false_positives,
+        }
+
+
+signup_filter = SignupFilter()
+# Another worker registered an email
+bus.on("signup_emails", lambda key: signup_filter._add(bytes.fromhex(key)))
@@ -0,0 +1,101 @@
+import functools
+import os
+import threading
+
+from sqlalchemy.orm import Session
+
+# --------------------------------------------------
+# SINGLE-FLIGHT COALESCING FOR HOT READS
+# --------------------------------------------------
+# Concurrent identical reads share one execution: the first request for a
+# key runs the endpoint, the ones that arrive while it is in flight wait
+# and receive the same result (or exception). Nothing is cached once the
+# leader finishes, so results are never staler than the query itself.
+# Waiting requests never check out a connection; only the leader does.
+ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") != "0"
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.by_group = {}   # group -> [executed, coalesced]
+
+    def do(self, key, fn):
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+            counts = self.by_group.setdefault(key[0], [0, 0])
+            counts[0 if leader else 1] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+            groups = {g: {"executed": e, "coalesced": c} for g, (e, c) in self.by_group.items()}
+        return {
+            "enabled": self.enabled,
+            "in_flight": in_flight,
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "groups": groups,
+        }
+
+
+flights = SingleFlight()
+
+
+def default_key(**params):
+    # Scalar parameters (path and query values) identify the request
+    return tuple(sorted(
+        (name, value) for name, value in params.items()
+        if isinstance(value, (str, int, float, bool, type(None)))
+    ))
+
+
+def single_flight(group, key=default_key):
+    """Decorator for sync read endpoints; key(**endpoint_kwargs) -> hashable."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(**kwargs):
+            db = next((v for v in kwargs.values() if isinstance(v, Session)), None)
+            # Primary and replica reads are never merged, so read-your-writes holds
+            bind = db.get_bind().url.render_as_string() if db is not None else None
+            return flights.do((group, bind, key(**kwargs)), lambda: func(**kwargs))
+        return wrapper
+    return decorator
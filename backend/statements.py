@@ -0,0 +1,165 @@
+"""Pre-built statements for the hot request paths.
+
+db.query(User).filter(...) builds a new statement object on every call and
+SQLAlchemy then has to derive its cache key before it can find the compiled
+SQL. The statements here are built once per dialect with bound parameters,
+so a request only binds values: the compiled form comes straight from the
+engine's compiled cache, and on psycopg 3 (postgresql+psycopg:// URLs) the
+driver prepares it server-side once it has run DB_PREPARE_THRESHOLD times
+on a connection (see database.make_engine).
+
+benchmarks/statement_registry.py times each registered path against the
+db.query form it replaced.
+"""
+import collections
+
+from sqlalchemy import ARRAY, Integer, any_, bindparam, cast, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from py_models.signin_models import User, email_key
+from py_models.quiz_models import Quiz, QuizArchiveSummary
+from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+
+
+class StatementRegistry:
+    def __init__(self):
+        self._builders = {}
+        self._built = {}
+        self._served = collections.Counter()   # name -> get() calls, for diagnostics
+
+    def register(self, name):
+        """Decorator for a builder taking the dialect name."""
+        def decorator(builder):
+            self._builders[name] = builder
+            return builder
+        return decorator
+
+    def get(self, name, dialect):
+        key = (name, dialect)
+        self._served[name] += 1
+        try:
+            return self._built[key]
+        except KeyError:
+            statement = self._built[key] = self._builders[name](dialect)
+            return statement
+
+    def stats(self):
+        return {
+            "registered": sorted(self._builders),
+            "built": sorted(f"{name}:{dialect}" for name, dialect in self._built),
+            "served": dict(self._served),
+        }
+
+
+registry = StatementRegistry()
+
+
+def statement(db, name):
+    """The registered statement `name` for the dialect `db` is bound to."""
+    return registry.get(name, db.get_bind().dialect.name)
+
+
+def _active_users():
+    # accounts.active_users(), inlined to keep this module free of app imports
+    return User.user_deleted_at.is_(None)
+
+
+def _users_filter(column, dialect):
+    if dialect == "postgresql":
+        # One array parameter keeps a single prepared plan for every list size
+        return column == any_(bindparam("user_ids", type_=ARRAY(Integer)))
+    return column.in_(bindparam("user_ids", expanding=True))
+
+
+@registry.register("login")
+def _login(dialect):
+    # Callers pass normalize_email(); the expression matches the unique index
+    return select(User).where(
+        email_key == bindparam("email"),
+        User.user_password == bindparam("password"),
+        _active_users(),
+    ).limit(1)
+
+
+@registry.register("user_by_id")
+def _user_by_id(dialect):
+    return select(User).where(User.user_id == bindparam("user_id"), _active_users()).limit(1)
+
+
+@registry.register("email_taken")
+def _email_taken(dialect):
+    return select(User.user_id).where(email_key == bindparam("email"), _active_users()).limit(1)
+
+
+@registry.register("user_version")
+def _user_version(dialect):
+    return select(User.user_version).where(User.user_id == bindparam("user_id"), _active_users())
+
+
+@registry.register("partial_progress")
+def _partial_progress(dialect):
+    return select(QuizPartialProgress).where(QuizPartialProgress.user_id == bindparam("user_id"))
+
+
+@registry.register("partial_progress_row")
+def _partial_progress_row(dialect):
+    return select(QuizPartialProgress).where(
+        QuizPartialProgress.user_id == bindparam("user_id"),
+        QuizPartialProgress.quiz_id == bindparam("quiz_id"),
+    ).limit(1)
+
+
+@registry.register("upsert_partial_progress")
+def _upsert_partial_progress(dialect):
+    """INSERT .. ON CONFLICT DO UPDATE where the dialect has it, else None."""
+    dialect_insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}.get(dialect)
+    if dialect_insert is None:
+        return None
+    statement = dialect_insert(QuizPartialProgress).values(
+        user_id=bindparam("user_id"),
+        quiz_id=bindparam("quiz_id"),
+        current_index=bindparam("current_index"),
+        score=bindparam("score"),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[QuizPartialProgress.user_id, QuizPartialProgress.quiz_id],
+        set_={"current_index": statement.excluded.current_index, "score": statement.excluded.score},
+    )
+
+
+@registry.register("clear_partial_progress")
+def _clear_partial_progress(dialect):
+    return delete(QuizPartialProgress).where(
+        QuizPartialProgress.user_id == bindparam("user_id"),
+        QuizPartialProgress.quiz_id == bindparam("quiz_id"),
+    )
+
+
+@registry.register("course_progress")
+def _course_progress(dialect):
+    return (
+        select(CourseVideoProgress.user_id, CourseVideoProgress.course_id, CourseVideoProgress.video_index)
+        .where(_users_filter(CourseVideoProgress.user_id, dialect))
+        .order_by(CourseVideoProgress.id)
+    )
+
+
+@registry.register("quiz_progress")
+def _quiz_progress(dialect):
+    live = (
+        select(Quiz.user_id, Quiz.quiz_id, func.count().label("attempts"), func.max(Quiz.score).label("best"))
+        .where(_users_filter(Quiz.user_id, dialect))
+        .group_by(Quiz.user_id, Quiz.quiz_id)
+    )
+    archived = select(
+        QuizArchiveSummary.user_id,
+        QuizArchiveSummary.quiz_id,
+        QuizArchiveSummary.attempts.label("attempts"),
+        QuizArchiveSummary.best_score.label("best"),
+    ).where(_users_filter(QuizArchiveSummary.user_id, dialect))
+    both = live.union_all(archived).subquery()
+    # Postgres sums integers as numeric, which json.dumps cannot write
+    return (
+        select(both.c.user_id, both.c.quiz_id, cast(func.sum(both.c.attempts), Integer), func.max(both.c.best))
+        .group_by(both.c.user_id, both.c.quiz_id)
+    )
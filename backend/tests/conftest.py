@@ -0,0 +1,141 @@
+"""Test harness: the real app against a throwaway SQLite database.
+
+    cd backend && python -m pytest tests
+
+database.py reads DATABASE_URL at import time, so the environment is set
+here before anything from the app is imported. Set TEST_DATABASE_URL to
+run the same tests against a disposable Postgres instead.
+"""
+import os
+import sys
+import tempfile
+
+_tmpdir = tempfile.mkdtemp(prefix="skillnest-tests-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{_tmpdir}/test.db")
+os.environ.pop("READ_REPLICA_URL", None)
+os.environ.pop("SHARD_DATABASE_URLS", None)
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+os.environ["CACHE_BUS"] = "local"
+# Jobs stay pending in the table; tests that need them call job_queue.run()
+os.environ["JOB_WORKERS"] = "0"
+# Most tests call the endpoints without logging in; test_accounts turns auth back on
+os.environ["AUTH_REQUIRED"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+from database import Base, engine
+from main import app
+from user_cache import user_versions
+from search import catalog_index
+from recommend import recommender
+from auth import denylist
+from signup_filter import signup_filter
+
+from py_models.signin_models import User
+
+
+class QueryCounter:
+    """Records every SQL statement sent to the primary engine while active."""
+
+    def __init__(self, bind):
+        self.bind = bind
+        self.statements = []
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.bind, "before_cursor_execute", self._before)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.bind, "before_cursor_execute", self._before)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class SQLiteSteps:
+    """Counts SQLite virtual machine instructions run while active.
+
+    The count grows with the rows the statements read, and unlike timings it
+    is the same on every run and on a loaded machine.
+    """
+
+    def __init__(self, bind):
+        self.bind = bind
+        self.steps = 0
+
+    def _tick(self):
+        self.steps += 1
+        return 0
+
+    def _checkout(self, dbapi_connection, record, proxy):
+        dbapi_connection.set_progress_handler(self._tick, 1)
+
+    def _checkin(self, dbapi_connection, record):
+        if dbapi_connection is not None:
+            dbapi_connection.set_progress_handler(None, 0)
+
+    def __enter__(self):
+        self.steps = 0
+        event.listen(self.bind, "checkout", self._checkout)
+        event.listen(self.bind, "checkin", self._checkin)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.bind, "checkout", self._checkout)
+        event.remove(self.bind, "checkin", self._checkin)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def queries():
+    return QueryCounter(engine)
+
+
+@pytest.fixture
+def steps():
+    if engine.dialect.name != "sqlite":
+        pytest.skip("counts SQLite VM instructions")
+    return SQLiteSteps(engine)
+
+
+@pytest.fixture(autouse=True)
+def clean_db(client):
+    yield
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    user_versions._entries.clear()
+    catalog_index.invalidate()
+    recommender._model = None
+    denylist._users.clear()   # deleted accounts' revocations outlive the rows
+    signup_filter.build([engine])
+
+
+def seed_users(count, start=1):
+    rows = [
+        {"user_id": i, "user_name": f"user{i}", "user_email": f"user{i}@example.com",
+         "user_password": "pw", "user_version": 1}
+        for i in range(start, start + count)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(User), rows)
+    return [r["user_id"] for r in rows]
+
+
+def seed_rows(model, rows):
+    with engine.begin() as conn:
+        conn.execute(insert(model), rows)
@@ -0,0 +1,146 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import func, select, update
+
+from conftest import seed_rows, seed_users
+from database import SessionLocal, engine
+from jobs import job_queue
+from accounts import PURGE_TABLES, purge_rows, sweep_orphans
+from timestamps import utcnow
+
+from py_models.signin_models import User
+from py_models.quiz_models import Quiz
+from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+from py_models.job_models import BackgroundJob
+from py_models.analytics_models import CourseFunnel, CourseUserFurthest
+
+
+def _rows(user_id):
+    with engine.connect() as conn:
+        return sum(
+            conn.scalar(select(func.count()).select_from(table).where(table.c.user_id == user_id))
+            for table, _ in PURGE_TABLES
+        )
+
+
+def _seed_progress(user_id, n=25):
+    seed_rows(Quiz, [{"user_id": user_id, "quiz_id": "python", "score": i} for i in range(n)])
+    seed_rows(CourseVideoProgress, [{"user_id": user_id, "course_id": "html", "video_index": i} for i in range(n)])
+    seed_rows(QuizPartialProgress, [{"user_id": user_id, "quiz_id": "python", "current_index": 1, "score": 1}])
+
+
+def test_delete_user_hides_account_and_purges_in_background(client):
+    seed_users(2)
+    _seed_progress(1)
+    _seed_progress(2)
+
+    assert client.post("/delete_user/1", json={"password": "pw"}).status_code == 200
+    assert client.get("/user/1").status_code == 404
+    assert client.post("/login", json={"user_email": "user1@example.com", "user_password": "pw"}).status_code == 401
+    assert _rows(1) > 0
+
+    with engine.connect() as conn:
+        job_id = conn.scalar(select(BackgroundJob.job_id).where(BackgroundJob.name == "accounts.purge_user"))
+    job_queue.run(job_id)
+
+    assert _rows(1) == 0
+    assert _rows(2) == 51
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(User).where(User.user_id == 1)) == 0
+
+
+def test_rollup_jobs_queued_before_a_delete_do_not_resurrect_the_user(client):
+    seed_users(2)
+    for user_id in (1, 2):
+        client.post("/progress/course/video", json={"user_id": user_id, "course_id": "html", "video_index": 3})
+    client.post("/delete_user/1", json={"password": "pw"}).raise_for_status()
+    with engine.connect() as conn:
+        jobs = dict(conn.execute(select(BackgroundJob.job_id, BackgroundJob.name).order_by(BackgroundJob.job_id)).all())
+    purge = next(job_id for job_id, name in jobs.items() if name == "accounts.purge_user")
+
+    # The purge wins the race; the user's queued rollup runs afterwards
+    job_queue.run(purge)
+    for job_id, name in jobs.items():
+        if name == "analytics.record_video":
+            job_queue.run(job_id)
+
+    with engine.connect() as conn:
+        assert conn.scalars(select(CourseUserFurthest.user_id)).all() == [2]
+        assert set(conn.scalars(select(CourseFunnel.users_reached))) == {1}
+        assert conn.scalar(select(func.count()).select_from(BackgroundJob)) == 0
+
+
+def test_delete_user_revokes_outstanding_tokens(client):
+    seed_users(2)
+    tokens = [client.post("/login", json={"user_email": f"user{u}@example.com", "user_password": "pw"}).json()["token"]
+              for u in (1, 2)]
+    client.post("/delete_user/1", json={"password": "pw"}).raise_for_status()
+
+    assert client.get("/session", headers={"Authorization": f"Bearer {tokens[0]}"}).status_code == 401
+    assert client.get("/session", headers={"Authorization": f"Bearer {tokens[1]}"}).status_code == 200
+
+
+def test_non_ascii_signature_is_rejected(client):
+    seed_users(1)
+    token = client.post("/login", json={"user_email": "user1@example.com", "user_password": "pw"}).json()["token"]
+    payload = token.split(".")[0]
+    response = client.get("/session", params={"access_token": f"{payload}.sïgnature"})
+    assert response.status_code == 401
+
+
+def test_auth_is_required_unless_opted_out():
+    env = dict(os.environ)
+    env.pop("AUTH_REQUIRED")
+    check = [sys.executable, "-c", "import auth; print(auth.AUTH_REQUIRED)"]
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run(check, cwd=cwd, env=env, capture_output=True, text=True).stdout.strip() == "True"
+    env["AUTH_REQUIRED"] = "0"
+    assert subprocess.run(check, cwd=cwd, env=env, capture_output=True, text=True).stdout.strip() == "False"
+
+
+def test_per_user_routes_need_a_live_token(client, monkeypatch):
+    import auth
+    import main
+    monkeypatch.setattr(auth, "AUTH_REQUIRED", True)
+    monkeypatch.setattr(main, "AUTH_REQUIRED", True)
+    seed_users(2)
+    token = client.post("/login", json={"user_email": "user1@example.com", "user_password": "pw"}).json()["token"]
+    bearer = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/progress/course/1").status_code == 401
+    assert client.get("/progress/course/1", headers=bearer).status_code == 200
+    assert client.get("/progress/course/2", headers=bearer).status_code == 403
+    assert client.post("/progress/cohort", json={"user_ids": [1, 2]}, headers=bearer).status_code == 403
+
+    client.post("/logout", headers=bearer).raise_for_status()
+    assert client.get("/progress/course/1", headers=bearer).status_code == 401
+
+
+def test_purge_works_in_batches():
+    seed_users(1)
+    _seed_progress(1, n=30)
+    db = SessionLocal()
+    try:
+        assert purge_rows(db, 1, batch_size=7) == 61
+    finally:
+        db.close()
+    assert _rows(1) == 0
+
+
+def test_sweep_removes_orphans():
+    seed_users(2)
+    for user_id in (1, 2):
+        _seed_progress(user_id)
+    # A delete whose purge job never ran
+    with engine.begin() as conn:
+        conn.execute(update(User).where(User.user_id == 2).values(user_deleted_at=utcnow()))
+    if engine.dialect.name == "sqlite":
+        _seed_progress(99)   # no such user: left from before the foreign keys were enforced
+    sweep_orphans(batch_size=10)
+    assert _rows(99) == 0
+    assert _rows(2) == 0
+    assert _rows(1) == 51
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(User)) == 1
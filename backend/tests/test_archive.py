@@ -0,0 +1,104 @@
+import datetime
+import gzip
+
+from sqlalchemy import func, select
+
+import events
+from conftest import seed_rows, seed_users
+from database import SessionLocal, background_bind, engine, read_only_session
+from partitions import archive
+
+from py_models.quiz_models import Quiz
+from py_models.event_models import LearningEvent
+from py_models.progress_models import CourseVideoProgress
+
+OLD = datetime.datetime(2020, 3, 14, 9, 30)
+RECENT = datetime.datetime.now() - datetime.timedelta(days=1)
+
+
+def test_archived_attempts_still_count(client, queries, tmp_path):
+    seed_users(2)
+    seed_rows(Quiz, [
+        {"user_id": 1 + i % 2, "quiz_id": "python", "score": i, "attempted_at": OLD + datetime.timedelta(days=i % 40)}
+        for i in range(30)
+    ] + [
+        {"user_id": 1, "quiz_id": "python", "score": 5, "attempted_at": RECENT},
+        {"user_id": 1, "quiz_id": "html", "score": 8, "attempted_at": RECENT},
+    ])
+    report = "/analytics/quiz/attempts_per_day?start=2020-01-01&end=2030-12-31&quiz_id=python"
+    progress_before = client.get("/progress/quiz/1").json()
+    report_before = client.get(report).json()
+
+    results = archive(older_than=6, directory=str(tmp_path))
+
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(Quiz.__table__)) == 2
+    assert sum(rows for _, rows in results) == 30
+    with gzip.open(results[0][0], "rt") as f:
+        assert f.readline().startswith("result_id,")
+
+    with queries:
+        assert client.get("/progress/quiz/1").json() == progress_before
+    assert queries.count == 1
+    assert client.get(report).json() == report_before
+
+    # Running again finds nothing left to archive
+    assert archive(older_than=6, directory=str(tmp_path)) == []
+
+
+def test_replay_after_archive_does_not_double_count(client, tmp_path):
+    seed_users(1)
+    seed_rows(LearningEvent, [
+        {"user_id": 1, "event_type": events.QUIZ_COMPLETED, "subject_id": "python", "score": i,
+         "occurred_at": OLD + datetime.timedelta(days=i)}
+        for i in range(10)
+    ] + [
+        {"user_id": 1, "event_type": events.QUIZ_COMPLETED, "subject_id": "python", "score": 3, "occurred_at": RECENT},
+    ])
+    events.replay()
+    assert sum(rows for _, rows in archive(older_than=6, directory=str(tmp_path))) == 10
+    report = "/analytics/quiz/attempts_per_day?start=2020-01-01&end=2030-12-31&quiz_id=python"
+    progress_before = client.get("/progress/quiz/1").json()
+    report_before = client.get(report).json()
+
+    events.replay()
+
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(Quiz.__table__)) == 1
+    assert client.get("/progress/quiz/1").json() == progress_before
+    assert client.get(report).json() == report_before
+
+
+def test_readers_keep_the_old_projections_during_replay(client, monkeypatch):
+    seed_users(1)
+    seed_rows(LearningEvent, [
+        {"user_id": 1, "event_type": events.VIDEO_WATCHED, "subject_id": "html", "position": i, "occurred_at": RECENT}
+        for i in range(6)
+    ])
+    events.replay()
+    before = client.get("/progress/course/1").json()
+    seen = []
+    apply_chunk = events._apply_chunk
+
+    def apply_and_look(conn, chunk, archived=None):
+        apply_chunk(conn, chunk, archived)
+        with read_only_session(SessionLocal) as reader:
+            seen.append(sorted(reader.scalars(select(CourseVideoProgress.video_index))))
+
+    monkeypatch.setattr(events, "_apply_chunk", apply_and_look)
+    # As the CLI would, from outside the one-connection request pool
+    assert events.replay(chunk_size=2, bind=background_bind(engine)) == 6
+    assert seen == [list(range(6))] * 3
+    assert client.get("/progress/course/1").json() == before
+
+
+def test_event_times_are_stored_as_naive_utc(client):
+    seed_users(1)
+    response = client.post("/events", json={"user_id": 1, "events": [
+        {"event_type": events.QUIZ_COMPLETED, "subject_id": "python", "score": 4,
+         "occurred_at": "2026-01-05T12:00:00+02:00"},
+    ]})
+    assert response.status_code == 200
+    with engine.connect() as conn:
+        assert conn.scalar(select(LearningEvent.occurred_at)) == datetime.datetime(2026, 1, 5, 10, 0)
+        assert conn.scalar(select(Quiz.attempted_at)) == datetime.datetime(2026, 1, 5, 10, 0)
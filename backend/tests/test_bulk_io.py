@@ -0,0 +1,46 @@
+import io
+import json
+
+from sqlalchemy import func, select
+
+import bulk_io
+import events
+from conftest import seed_users
+from database import engine
+
+from py_models.signin_models import User
+from py_models.quiz_models import Quiz
+
+
+def _count(model):
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(model))
+
+
+def test_duplicate_email_skips_only_that_row():
+    seed_users(1)
+    rows = [
+        {"user_id": str(i), "user_name": f"n{i}", "user_email": f"import{i}@example.com", "user_password": "pw"}
+        for i in range(10, 15)
+    ] + [{"user_id": "20", "user_name": "dup", "user_email": "user1@example.com", "user_password": "pw"}]
+    assert bulk_io.import_rows(User.__table__, rows, chunk_size=4) == 5
+    assert _count(User) == 6
+
+
+def test_imported_attempts_survive_replay():
+    seed_users(2)
+    rows = [
+        {"user_id": "1", "quiz_id": "python", "score": "7", "attempt_date": "2026-01-05T10:00:00Z"},
+        {"user_id": "2", "quiz_id": "html", "score": "4", "attempt_date": "2026-01-06T10:00:00Z"},
+    ]
+    assert bulk_io.import_rows(Quiz.__table__, rows) == 2
+    events.replay()
+    assert _count(Quiz) == 2
+
+
+def test_users_export_leaves_out_passwords():
+    seed_users(2)
+    stream = io.StringIO()
+    assert bulk_io.export_rows(User.__table__, stream, "ndjson") == 2
+    for line in stream.getvalue().splitlines():
+        assert "user_password" not in json.loads(line)
@@ -0,0 +1,128 @@
+import json
+import os
+import socket
+import threading
+
+import cache_bus
+from cache_bus import CacheBus, UnixSocketBus
+
+
+def _worker_bus(monkeypatch, directory, pid):
+    # serve.py forks one bus per worker; here the pids are faked in one process
+    monkeypatch.setattr(cache_bus.os, "getpid", lambda: pid)
+    worker = UnixSocketBus(str(directory))
+    worker.start()
+    return worker
+
+
+def test_broadcasts_reach_the_other_workers_only(monkeypatch, tmp_path):
+    first, second = _worker_bus(monkeypatch, tmp_path, 101), _worker_bus(monkeypatch, tmp_path, 102)
+    # Left behind by a worker that was killed
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stale.bind(str(tmp_path / "103.sock"))
+    stale.close()
+    heard = {101: threading.Event(), 102: threading.Event()}
+    keys = []
+
+    def received(key):
+        keys.append(key)
+        heard[102].set()
+
+    try:
+        first.on("users", lambda key: heard[101].set())
+        second.on("users", received)
+
+        first.broadcast("users", {"user_id": 7})
+        assert heard[102].wait(2)
+        assert keys == [{"user_id": 7}]
+        # The sender already updated its own cache
+        assert not heard[101].wait(0.2)
+        assert not os.path.exists(tmp_path / "103.sock")
+        assert (first.sent, second.received) == (1, 1)
+    finally:
+        first.stop()
+        second.stop()
+    assert os.listdir(tmp_path) == []
+
+
+def test_dispatch_runs_every_handler_for_the_cache():
+    local = CacheBus()
+    local.start()
+    calls = []
+
+    def broken(key):
+        raise RuntimeError("handler bug")
+
+    local.on("catalog", broken)
+    local.on("catalog", lambda key: calls.append(("catalog", key)))
+    local.on("users", lambda key: calls.append(("users", key)))
+
+    local._dispatch(json.dumps({"cache": "catalog", "key": None, "origin": local.origin + 1}))
+    local._dispatch(json.dumps({"cache": "catalog", "key": None, "origin": local.origin}))
+    local._dispatch(json.dumps({"cache": "unknown", "key": 1, "origin": local.origin + 1}))
+    assert calls == [("catalog", None)]
+    assert local.received == 2
+
+
+class _FakeListenConnection:
+    """Stands in for a psycopg2 connection: readable through a socketpair."""
+
+    def __init__(self, payloads=(), drop=False):
+        self._ours, self._theirs = socket.socketpair()
+        self._payloads, self._drop = list(payloads), drop
+        self.notifies = []
+        self._theirs.send(b".")   # something to read right away
+
+    def cursor(self):
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                pass
+
+        return Cursor()
+
+    def fileno(self):
+        return self._ours.fileno()
+
+    def poll(self):
+        self._ours.recv(16)
+        if self._drop:
+            raise OSError("server closed the connection unexpectedly")
+        self.notifies.extend(type("Notify", (), {"payload": p})() for p in self._payloads)
+        self._payloads = []
+
+    def close(self):
+        self._ours.close()
+        self._theirs.close()
+
+
+def test_postgres_bus_reconnects_after_a_dropped_listen(monkeypatch):
+    from sqlalchemy.engine import make_url
+
+    monkeypatch.setattr(cache_bus, "RECONNECT_MIN_SECONDS", 0.01)
+    message = json.dumps({"cache": "catalog", "key": None, "origin": -1})
+    connections = [_FakeListenConnection(drop=True), _FakeListenConnection([message])]
+    attempts = []
+
+    def connect():
+        attempts.append(len(attempts))
+        if len(attempts) == 2:
+            raise OSError("could not connect to server")
+        return connections.pop(0) if connections else _FakeListenConnection()
+
+    pg = cache_bus.PostgresBus(make_url("postgresql://bus@db/skillnest"))
+    monkeypatch.setattr(pg, "_connect", connect)
+    heard = threading.Event()
+    pg.on("catalog", lambda key: heard.set())
+    pg.start()
+    try:
+        # Dropped, failed once to reconnect, then listening again
+        assert heard.wait(2)
+        assert len(attempts) == 3
+    finally:
+        pg.stop()
@@ -0,0 +1,84 @@
+from sqlalchemy import update
+
+from conftest import seed_rows, seed_users
+from database import engine
+
+from py_models.signin_models import User
+from py_models.quiz_models import Quiz
+from py_models.progress_models import CourseVideoProgress
+
+
+def _seed_class(size):
+    ids = seed_users(size)
+    seed_rows(Quiz, [{"user_id": u, "quiz_id": "python", "score": u % 10} for u in ids for _ in range(2)])
+    seed_rows(CourseVideoProgress, [{"user_id": u, "course_id": "html", "video_index": i} for u in ids for i in range(3)])
+    return ids
+
+
+def test_cohort_matches_per_user_endpoints(client):
+    ids = _seed_class(5)
+    body = client.post("/progress/cohort", json={"user_ids": ids}).json()
+    for u in ids:
+        assert body["users"][str(u)] == {
+            "course": client.get(f"/progress/course/{u}").json(),
+            "quiz": client.get(f"/progress/quiz/{u}").json(),
+        }
+
+
+def test_cohort_cost_is_constant(client, queries):
+    ids = _seed_class(200)
+    cohort = client.post("/cohorts", json={"name": "Class of 200", "user_ids": ids}).json()
+    assert cohort["members"] == 200
+
+    with queries:
+        response = client.post("/progress/cohort", json={"cohort_id": cohort["cohort_id"]})
+    assert response.status_code == 200
+    assert len(response.json()["users"]) == 200
+    # cohort lookup + members + course progress + quiz progress
+    assert queries.count <= 4, queries.statements
+
+
+def test_cohort_request_validation(client):
+    assert client.post("/progress/cohort", json={}).status_code == 422
+    assert client.post("/progress/cohort", json={"cohort_id": 12345}).status_code == 404
+
+
+def _token(client, user_id, role=None):
+    if role is not None:
+        seed_role(user_id, role)
+    body = client.post("/login", json={"user_email": f"user{user_id}@example.com", "user_password": "pw"}).json()
+    return {"Authorization": f"Bearer {body['token']}"}
+
+
+def seed_role(user_id, role):
+    with engine.begin() as conn:
+        conn.execute(update(User).where(User.user_id == user_id).values(user_role=role))
+
+
+def test_students_cannot_create_or_read_cohorts(client):
+    ids = _seed_class(3)
+    student = _token(client, ids[0])
+    response = client.post("/cohorts", json={"name": "Peek", "user_ids": ids}, headers=student)
+    assert response.status_code == 403
+    open_cohort = client.post("/cohorts", json={"name": "Open mode", "user_ids": ids}).json()
+    response = client.post("/progress/cohort", json={"cohort_id": open_cohort["cohort_id"]}, headers=student)
+    assert response.status_code == 403
+    assert client.post("/progress/cohort", json={"user_ids": ids}, headers=student).status_code == 403
+
+
+def test_instructors_read_their_own_cohorts_and_admins_any(client):
+    ids = _seed_class(3)
+    instructor = _token(client, ids[0], "instructor")
+    other = _token(client, ids[1], "instructor")
+    admin = _token(client, ids[2], "admin")
+    cohort = client.post("/cohorts", json={"name": "Mine", "user_ids": ids}, headers=instructor).json()
+    ownerless = client.post("/cohorts", json={"name": "Open mode", "user_ids": ids}).json()
+
+    def read(cohort_id, headers):
+        return client.post("/progress/cohort", json={"cohort_id": cohort_id}, headers=headers).status_code
+
+    assert read(cohort["cohort_id"], instructor) == 200
+    assert read(cohort["cohort_id"], other) == 403
+    assert read(ownerless["cohort_id"], instructor) == 403
+    assert read(cohort["cohort_id"], admin) == 200
+    assert read(ownerless["cohort_id"], admin) == 200
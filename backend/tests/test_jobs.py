@@ -0,0 +1,85 @@
+import datetime
+
+from sqlalchemy import select, update
+
+from conftest import seed_users
+from database import SessionLocal, engine
+from jobs import job_queue
+from timestamps import utcnow
+
+from py_models.job_models import BackgroundJob
+from py_models.signin_models import User
+
+
+def _job(job_id):
+    with engine.connect() as conn:
+        return conn.execute(select(BackgroundJob).where(BackgroundJob.job_id == job_id)).first()
+
+
+def _enqueue(name, **payload):
+    with SessionLocal() as db:
+        job_queue.enqueue(db, name, **payload)
+        db.commit()
+        return db.scalar(select(BackgroundJob.job_id).order_by(BackgroundJob.job_id.desc()))
+
+
+def _make_due(job_id):
+    with engine.begin() as conn:
+        conn.execute(update(BackgroundJob).where(BackgroundJob.job_id == job_id).values(run_after=utcnow()))
+
+
+def test_failed_jobs_back_off_then_succeed(monkeypatch):
+    seed_users(1)
+    calls = []
+
+    def flaky(db, user_id):
+        calls.append(user_id)
+        db.execute(update(User).where(User.user_id == user_id).values(user_name=f"try{len(calls)}"))
+        if len(calls) == 1:
+            raise RuntimeError("database hiccup")
+
+    monkeypatch.setitem(job_queue.handlers, "test.flaky", flaky)
+    monkeypatch.setattr(job_queue, "retry_base", 30)
+    job_id = _enqueue("test.flaky", user_id=1)
+
+    job_queue.run(job_id)
+    job = _job(job_id)
+    assert (job.status, job.attempts, job.last_error) == ("pending", 1, "RuntimeError: database hiccup")
+    assert job.run_after >= utcnow() + datetime.timedelta(seconds=25)
+    with engine.connect() as conn:   # the failed attempt's writes were rolled back
+        assert conn.scalar(select(User.user_name).where(User.user_id == 1)) == "user1"
+
+    # Not due yet: neither the poller nor a direct run picks it up
+    assert job_id not in job_queue.due_jobs(10)
+    job_queue.run(job_id)
+    assert calls == [1]
+
+    _make_due(job_id)
+    job_queue.run(job_id)
+    assert _job(job_id) is None
+    with engine.connect() as conn:
+        assert conn.scalar(select(User.user_name).where(User.user_id == 1)) == "try2"
+
+
+def test_exhausted_jobs_are_kept_as_failed(monkeypatch):
+    def broken(db):
+        raise ValueError("bad payload")
+
+    monkeypatch.setitem(job_queue.handlers, "test.broken", broken)
+    monkeypatch.setattr(job_queue, "max_attempts", 3)
+    failed_before = job_queue.failed
+    job_id = _enqueue("test.broken")
+
+    for _ in range(3):
+        _make_due(job_id)
+        job_queue.run(job_id)
+    job = _job(job_id)
+    assert (job.status, job.attempts, job.last_error) == ("failed", 3, "ValueError: bad payload")
+    assert job_queue.failed == failed_before + 1
+
+    # A dead job stays put for inspection and is never run again
+    _make_due(job_id)
+    assert job_id not in job_queue.due_jobs(10)
+    job_queue.run(job_id)
+    assert _job(job_id).attempts == 3
+    assert job_queue.stats()["table"] == {"failed": 1}
@@ -0,0 +1,29 @@
+from load_shed import LoadShedder, shedder
+
+
+def test_requests_above_the_in_flight_limit_are_shed(client, monkeypatch):
+    monkeypatch.setattr(shedder, "max_in_flight", 2)
+    monkeypatch.setattr(shedder, "in_flight", 1)
+    assert client.get("/users").status_code == 200
+
+    # Two requests already in flight: the next one fails fast
+    monkeypatch.setattr(shedder, "in_flight", 2)
+    shed = client.get("/users")
+    assert shed.status_code == 503
+    assert shed.headers["retry-after"] == str(shedder.retry_after)
+    assert shed.json()["reason"] == "too many requests in flight"
+    # Health checks keep answering while saturated
+    assert client.get("/health").status_code == 200
+    assert client.get("/diagnostics/load").json()["shed_in_flight"] >= 1
+
+
+def test_slots_are_given_back():
+    limited = LoadShedder(max_in_flight=1, retry_after=1)
+    assert limited.try_enter()
+    assert not limited.try_enter()
+    limited.leave()
+    assert limited.try_enter()
+    assert (limited.peak_in_flight, limited.shed_in_flight) == (1, 1)
+    # 0 turns shedding off
+    unlimited = LoadShedder(max_in_flight=0, retry_after=1)
+    assert all(unlimited.try_enter() for _ in range(100))
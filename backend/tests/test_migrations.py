@@ -0,0 +1,51 @@
+from sqlalchemy import create_engine, insert, select, text
+
+import migrations
+from database import Base, engine
+
+from py_models.signin_models import User
+from py_models.progress_models import QuizPartialProgress
+
+
+def test_startup_schema_upgrade_leaves_data_alone(tmp_path):
+    old = create_engine(f"sqlite:///{tmp_path}/old.db")
+    Base.metadata.create_all(bind=old)
+    with old.begin() as conn:
+        conn.execute(text(f"DROP INDEX {migrations.USER_EMAIL_INDEX.name}"))
+        conn.execute(insert(User), [
+            {"user_id": i, "user_name": f"u{i}", "user_email": "same@example.com", "user_password": "pw"}
+            for i in (1, 2)
+        ])
+
+    migrations.upgrade_schema(old)
+    with old.connect() as conn:
+        assert conn.execute(select(User.user_id).where(User.user_deleted_at.is_(None))).scalars().all() == [1, 2]
+    assert migrations.USER_EMAIL_INDEX.name not in migrations.index_names(old, "users")
+
+    migrations.upgrade(old)
+    assert migrations.USER_EMAIL_INDEX.name in migrations.index_names(old, "users")
+
+
+def test_partial_progress_saves_before_the_unique_index_exists(client, monkeypatch):
+    # A database from before the unique index, which only upgrade() creates
+    index = migrations.PARTIAL_PROGRESS_INDEX
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX {index.name}"))
+    monkeypatch.setattr(migrations, "_index_checks", {})
+    try:
+        client.post("/create_user", json={
+            "user_name": "ada", "user_email": "ada@example.com", "user_password": "pw",
+            "user_dateofbirth": "2000-01-01", "user_phone": "1", "user_gender": "x",
+        }).raise_for_status()
+        with engine.connect() as conn:   # ids keep counting across tests on Postgres
+            user_id = conn.scalar(select(User.user_id).where(User.user_email == "ada@example.com"))
+        for position in (1, 2):
+            saved = client.post("/progress/quiz/partial", json={
+                "user_id": user_id, "quiz_id": "python", "current_index": position, "score": position,
+            })
+            assert saved.status_code == 200, saved.text
+        with engine.connect() as conn:
+            rows = conn.execute(select(QuizPartialProgress.current_index)).scalars().all()
+        assert rows == [2]
+    finally:
+        index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,48 @@
+from fastapi.testclient import TestClient
+
+import profiling
+from conftest import seed_users
+from main import app
+
+
+def profiled_client(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "SECRET", b"test-secret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    return TestClient(profiling.ProfileMiddleware(app))
+
+
+def test_tokens_are_signed_and_expire(monkeypatch):
+    monkeypatch.setattr(profiling, "SECRET", b"test-secret")
+    token = profiling.make_token(ttl=60, now=1000)
+    assert profiling.verify_token(token, now=1030)
+    assert not profiling.verify_token(token, now=1061)
+    assert not profiling.verify_token(token.replace(".", ".0"), now=1030)
+    assert not profiling.verify_token("garbage")
+    assert not profiling.verify_token("1030.sïgnature", now=1000)
+
+
+def test_profiled_request_writes_stacks_and_allocations(monkeypatch, tmp_path):
+    seed_users(3)
+    client = profiled_client(monkeypatch, tmp_path)
+    response = client.get("/users", headers={"X-Profile": profiling.make_token()})
+    assert response.status_code == 200
+    name = response.headers["x-profile-id"]
+
+    allocations = (tmp_path / f"{name}.alloc.txt").read_text()
+    assert allocations.startswith(f"# {name}:")
+    for line in (tmp_path / f"{name}.folded").read_text().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack and int(count) > 0
+
+    (listed,) = profiling.list_profiles()
+    assert listed["id"] == name and set(listed["files"]) == {"folded", "alloc.txt"}
+
+
+def test_untagged_and_forged_requests(monkeypatch, tmp_path):
+    client = profiled_client(monkeypatch, tmp_path)
+    response = client.get("/health")
+    assert response.status_code == 200 and "x-profile-id" not in response.headers
+    assert client.get("/health?profile=1.abc").status_code == 403
+    # Header values arrive as latin-1 text; non-ASCII ones are refused, not a 500
+    assert client.get("/health", headers={"X-Profile": "9999999999.sïgnature".encode("latin-1")}).status_code == 403
+    assert profiling.list_profiles() == []
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import events
+from conftest import seed_users
+from database import SessionLocal
+from pubsub import LocalBackend, ProgressHub, hub
+
+
+def test_messages_reach_every_tab_of_the_user_only():
+    local = ProgressHub(LocalBackend(), queue_size=2, max_connections=3)
+
+    async def scenario():
+        tabs = [local.subscribe(1), local.subscribe(1)]
+        other = local.subscribe(2)
+        assert local.subscribe(3) is None   # process is full
+        # Handlers publish from threadpool threads
+        publisher = threading.Thread(target=local.publish, args=(1, {"n": 1}))
+        publisher.start()
+        publisher.join()
+        for tab in tabs:
+            assert await asyncio.wait_for(tab.get(), timeout=1) == {"n": 1}
+        assert other.empty()
+
+        # A stalled tab keeps the newest updates
+        for n in range(2, 5):
+            local.publish(2, {"n": n})
+        await asyncio.sleep(0)
+        assert [other.get_nowait() for _ in range(other.qsize())] == [{"n": 3}, {"n": 4}]
+
+        local.unsubscribe(1, tabs[0])
+        local.publish(1, {"n": 5})
+        await asyncio.sleep(0)
+        assert tabs[0].empty() and tabs[1].get_nowait() == {"n": 5}
+
+    asyncio.run(scenario())
+    assert local.stats() == {"connections": 2, "users": 2, "published": 5, "delivered": 6, "dropped": 1}
+
+
+def test_only_committed_events_are_pushed(client):
+    seed_users(1)
+    event = {"user_id": 1, "event_type": events.VIDEO_WATCHED, "subject_id": "html", "position": 2}
+
+    async def scenario():
+        tab = hub.subscribe(1)
+        try:
+            def write(commit):
+                with SessionLocal() as db:
+                    events.record(db, [dict(event)])
+                    if commit:
+                        db.commit()
+                    else:
+                        db.rollback()
+
+            await asyncio.to_thread(write, False)
+            await asyncio.to_thread(write, True)
+            pushed = await asyncio.wait_for(tab.get(), timeout=1)
+            assert pushed == {"type": events.VIDEO_WATCHED, "subject_id": "html", "position": 2, "score": None}
+            await asyncio.sleep(0.05)
+            assert tab.empty()
+        finally:
+            hub.unsubscribe(1, tab)
+
+    asyncio.run(scenario())
@@ -0,0 +1,125 @@
+"""Per-endpoint SQL statement budgets.
+
+Each budget is the number of statements the endpoint may send to the
+database for one request. A change that adds a query (or turns a batch
+into a loop) fails here instead of showing up as latency in production.
+"""
+import pytest
+
+import migrations
+from conftest import seed_rows, seed_users
+from database import engine
+
+from py_models.quiz_models import Quiz
+from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+from py_models.cohort_models import Cohort, CohortMember
+
+NEW_USER = {
+    "user_name": "new", "user_email": "new@example.com", "user_password": "pw",
+    "user_dateofbirth": "2000-01-01", "user_phone": "1", "user_gender": "x",
+}
+NEW_COURSE = {
+    "course_id": 1, "title": "Python basics", "description": "Intro", "category": "python",
+    "level": "beginner", "created_by": 1, "created_at": "2024-01-01T00:00:00",
+}
+EVENT_BATCH = {"user_id": 1, "events": [
+    {"event_type": "video_watched", "subject_id": "html", "position": 4},
+    {"event_type": "quiz_completed", "subject_id": "python", "score": 8},
+    {"event_type": "quiz_progress_saved", "subject_id": "js", "position": 2, "score": 1},
+    {"event_type": "quiz_progress_cleared", "subject_id": "python"},
+]}
+
+BUDGETS = [
+    ("get", "/users", None, 1),
+    ("get", "/user/1", None, 1),
+    ("post", "/create_user", NEW_USER, 2),
+    ("post", "/login", {"user_email": "user1@example.com", "user_password": "pw"}, 1),
+    ("put", "/user/1", {"user_name": "renamed"}, 3),
+    ("post", "/delete_user/2", {"password": "pw"}, 3),
+    ("post", "/create_course", NEW_COURSE, 1),
+    ("get", "/course", None, 1),
+    # Postgres counts and facets in SQL (two facets + total + page); SQLite uses the in-process index
+    ("get", "/course/search?q=python", None, 4 if engine.dialect.name == "postgresql" else 1),
+    ("post", "/create_quiz", {"user_id": 1, "quiz_id": "python", "score": 7, "attempt_date": "2024-03-01T10:00:00Z"}, 2),
+    ("post", "/progress/course/video", {"user_id": 1, "course_id": "html", "video_index": 3}, 3),
+    ("post", "/progress/quiz/partial", {"user_id": 1, "quiz_id": "python", "current_index": 4, "score": 2}, 3),
+    ("delete", "/progress/quiz/partial/1/python", None, 2),
+    # log + video progress + rollup jobs + quiz attempt + one per partial-progress event
+    ("post", "/events", EVENT_BATCH, 6),
+    ("get", "/progress/course/1", None, 1),
+    ("get", "/progress/quiz/1", None, 1),
+    ("get", "/progress/quiz/partial/1", None, 1),
+    ("get", "/recommendations/1", None, 3),
+    ("post", "/cohorts", {"name": "Class", "user_ids": [1, 2]}, 4),
+    # cohort + members + course progress + quiz progress, whatever the cohort size
+    ("post", "/progress/cohort", {"cohort_id": 1}, 4),
+    ("post", "/progress/cohort", {"user_ids": [1, 2]}, 2),
+    ("get", "/analytics/course/html/funnel", None, 1),
+    ("get", "/analytics/quiz/attempts_per_day?start=2024-01-01&end=2024-12-31", None, 1),
+    ("get", "/analytics/quiz/attempts_per_day?start=2024-01-01&end=2024-12-31&quiz_id=python", None, 1),
+    ("get", "/analytics/users/signups_per_month?start=2024-01-01&end=2024-12-31", None, 1),
+    ("get", "/session", None, 0),
+    ("get", "/health", None, 0),
+]
+
+
+@pytest.fixture
+def seeded():
+    seed_users(2)
+    seed_rows(Quiz, [{"user_id": 1, "quiz_id": "python", "score": i} for i in range(20)])
+    seed_rows(CourseVideoProgress, [{"user_id": 1, "course_id": "html", "video_index": i} for i in range(10)])
+    seed_rows(QuizPartialProgress, [{"user_id": 1, "quiz_id": "python", "current_index": 3, "score": 1}])
+    seed_rows(Cohort, [{"cohort_id": 1, "name": "Class"}])
+    seed_rows(CohortMember, [{"cohort_id": 1, "user_id": u} for u in (1, 2)])
+    # Each process looks the upsert indexes up once, not once per request
+    for index in migrations.DEDUPED_INDEXES:
+        migrations.index_ready(engine, index)
+
+
+@pytest.mark.parametrize("method,path,body,budget", BUDGETS, ids=[f"{m} {p}" for m, p, _, _ in BUDGETS])
+def test_endpoint_query_budget(client, queries, seeded, method, path, body, budget):
+    headers = {}
+    if path == "/session":
+        login = client.post("/login", json={"user_email": "user1@example.com", "user_password": "pw"})
+        headers["Authorization"] = f"Bearer {login.json()['token']}"
+    with queries:
+        response = client.request(method.upper(), path, json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    assert queries.count <= budget, queries.statements
+
+
+def test_user_revalidation_is_free(client, queries, seeded):
+    etag = client.get("/user/1").headers["etag"]
+    with queries:
+        response = client.get("/user/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert queries.count == 0
+
+
+@pytest.mark.parametrize("attempts", [1, 500])
+def test_quiz_progress_is_one_query_regardless_of_attempts(client, queries, attempts):
+    seed_users(1)
+    seed_rows(Quiz, [{"user_id": 1, "quiz_id": f"q{i % 7}", "score": i} for i in range(attempts)])
+    with queries:
+        response = client.get("/progress/quiz/1")
+    assert response.status_code == 200
+    assert sum(v["attempts"] for v in response.json().values()) == attempts
+    assert queries.count == 1
+
+
+@pytest.mark.parametrize("size", [1, 200])
+def test_event_batch_cost_is_independent_of_size(client, queries, size):
+    seed_users(1)
+    batch = {
+        "user_id": 1,
+        "events": [
+            {"event_type": "video_watched", "subject_id": "html", "position": i} for i in range(size)
+        ] + [
+            {"event_type": "quiz_completed", "subject_id": "python", "score": i} for i in range(size)
+        ],
+    }
+    with queries:
+        response = client.post("/events", json=batch)
+    assert response.status_code == 200, response.text
+    # log + video progress + rollup jobs + quiz attempts
+    assert queries.count <= 4, queries.statements
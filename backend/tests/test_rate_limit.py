@@ -0,0 +1,66 @@
+import pytest
+
+import rate_limit
+from conftest import seed_users
+from rate_limit import MemoryBucketStore, limiter
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(limiter, "enabled", True)
+    monkeypatch.setattr(limiter, "store", MemoryBucketStore())
+    monkeypatch.setattr(limiter, "limits", {**limiter.limits, "account": (2.0, 0.5), "account_ip": (4.0, 0.01)})
+    return limiter
+
+
+def _login(client, email):
+    return client.post("/login", json={"user_email": email, "user_password": "pw"})
+
+
+def test_buckets_refill_at_their_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    store = MemoryBucketStore()
+    assert store.take("k", 2, 0.5) == 0 and store.take("k", 2, 0.5) == 0
+    assert store.take("k", 2, 0.5) == 2.0
+    now[0] += 1
+    assert store.take("k", 2, 0.5) == 1.0
+    now[0] += 1
+    assert store.take("k", 2, 0.5) == 0
+    # Refill stops at the burst size
+    now[0] += 60
+    assert [store.take("k", 2, 0.5) for _ in range(3)] == [0, 0, 2.0]
+
+
+def test_over_the_limit_is_429_with_retry_after(client, limited):
+    seed_users(1)
+    assert [_login(client, "user1@example.com").status_code for _ in range(2)] == [200, 200]
+    rejected = _login(client, "user1@example.com")
+    assert rejected.status_code == 429
+    assert rejected.headers["retry-after"] == "2"
+
+
+def test_logins_from_one_address_are_limited_per_email(client, limited):
+    seed_users(3)
+    # A classroom behind one NAT: one student's retries do not block the others
+    for _ in range(2):
+        _login(client, "user1@example.com")
+    assert _login(client, " USER1@example.com").status_code == 429
+    assert _login(client, "user2@example.com").status_code == 200
+    # ...but one address cannot try emails without end
+    assert _login(client, "user3@example.com").status_code == 200
+    assert _login(client, "user4@example.com").status_code == 429
+
+
+def test_identity_falls_back_from_user_to_email_to_address(client, monkeypatch):
+    seen = []
+    monkeypatch.setattr(limiter, "check", lambda group, identity: seen.append((group, identity)))
+    seed_users(1)
+    client.put("/user/1", json={"user_name": "renamed"})
+    client.post("/login", json={"user_email": "User1@example.com", "user_password": "pw"})
+    client.post("/login", json={})
+    assert seen == [
+        ("account", "user:1"),
+        ("account", "email:user1@example.com"), ("account_ip", "ip:testclient"),
+        ("account", "ip:testclient"),
+    ]
@@ -0,0 +1,111 @@
+"""The replica is configured at import time, so this runs the app in a child
+process against a primary and a replica SQLite file that never sync."""
+import os
+import subprocess
+import sys
+import textwrap
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIO = textwrap.dedent('''
+    import time
+    from fastapi.testclient import TestClient
+    from main import app
+    from database import PRIMARY_UNTIL_COOKIE, PRIMARY_UNTIL_HEADER
+
+    with TestClient(app) as writer, TestClient(app) as stranger:
+        created = writer.post("/create_user", json={
+            "user_name": "ada", "user_email": "ada@example.com", "user_password": "pw",
+            "user_dateofbirth": "2000-01-01", "user_phone": "1", "user_gender": "x",
+        })
+        created.raise_for_status()
+        until = created.headers[PRIMARY_UNTIL_HEADER]
+        assert float(until) > time.time() and writer.cookies[PRIMARY_UNTIL_COOKIE] == until
+
+        # The writer's cookie keeps its reads on the primary, whichever worker serves them
+        assert [u["user_email"] for u in writer.get("/users").json()] == ["ada@example.com"]
+        # Everyone else reads the replica, which has not seen the row
+        assert stranger.get("/users").json() == []
+        # Clients without cookies can send the header back instead
+        assert len(stranger.get("/users", headers={PRIMARY_UNTIL_HEADER: until}).json()) == 1
+        expired = str(time.time() - 1)
+        assert stranger.get("/users", headers={PRIMARY_UNTIL_HEADER: expired}).json() == []
+
+        # A write that fails to commit does not pin the client
+        duplicate = stranger.post("/create_user", json={
+            "user_name": "ada", "user_email": "ada@example.com", "user_password": "pw",
+            "user_dateofbirth": "2000-01-01", "user_phone": "1", "user_gender": "x",
+        })
+        assert duplicate.status_code == 409 and PRIMARY_UNTIL_HEADER not in duplicate.headers
+
+        # A frontend on another origin reads the header through CORS and echoes it
+        origin = {"Origin": "https://app.example.com"}
+        cross = stranger.post("/create_user", headers=origin, json={
+            "user_name": "bob", "user_email": "bob@example.com", "user_password": "pw",
+            "user_dateofbirth": "2000-01-01", "user_phone": "1", "user_gender": "x",
+        })
+        assert cross.headers["access-control-allow-origin"] == "*"
+        assert PRIMARY_UNTIL_HEADER.lower() in cross.headers["access-control-expose-headers"].lower()
+        preflight = stranger.options("/users", headers={
+            **origin, "Access-Control-Request-Method": "GET", "Access-Control-Request-Headers": PRIMARY_UNTIL_HEADER,
+        })
+        assert preflight.status_code == 200
+        with TestClient(app) as browser:
+            echoed = {**origin, PRIMARY_UNTIL_HEADER: cross.headers[PRIMARY_UNTIL_HEADER]}
+            assert len(browser.get("/users", headers=echoed).json()) == 2
+            assert len(browser.get("/users", headers=origin).json()) == 0
+    print("ok")
+''')
+
+CREDENTIALED_SCENARIO = textwrap.dedent('''
+    from fastapi.testclient import TestClient
+    from main import app
+    from database import PRIMARY_UNTIL_COOKIE
+
+    origin = {"Origin": "https://app.example.com"}
+    with TestClient(app, base_url="https://testserver") as browser:
+        created = browser.post("/create_user", headers=origin, json={
+            "user_name": "ada", "user_email": "ada@example.com", "user_password": "pw",
+            "user_dateofbirth": "2000-01-01", "user_phone": "1", "user_gender": "x",
+        })
+        created.raise_for_status()
+        assert created.headers["access-control-allow-origin"] == "https://app.example.com"
+        assert created.headers["access-control-allow-credentials"] == "true"
+        cookie = created.headers["set-cookie"].lower()
+        assert "samesite=none" in cookie and "secure" in cookie
+
+        # The cookie alone keeps the listed origin's reads on the primary
+        assert browser.cookies[PRIMARY_UNTIL_COOKIE]
+        assert len(browser.get("/users", headers=origin).json()) == 1
+        # Unlisted origins get no CORS grant, even on errors
+        other = browser.get("/user/999", headers={"Origin": "https://elsewhere.example.com"})
+        assert other.status_code == 404 and "access-control-allow-origin" not in other.headers
+    print("ok")
+''')
+
+
+def _run(scenario, tmp_path, **config):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path / 'primary.db'}",
+        READ_REPLICA_URL=f"sqlite:///{tmp_path / 'replica.db'}",
+        RATE_LIMIT_ENABLED="0", CACHE_BUS="local", JOB_WORKERS="0", SIGNUP_FILTER="0",
+        **config,
+    )
+    env.pop("SHARD_DATABASE_URLS", None)
+    return subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", scenario],
+        cwd=BACKEND, env=env, capture_output=True, text=True, timeout=120,
+    )
+
+
+def test_reads_follow_the_client_to_the_primary_after_a_write(tmp_path):
+    result = _run(SCENARIO, tmp_path, CORS_ORIGINS="")
+    assert result.returncode == 0, result.stderr[-3000:]
+    assert result.stdout.strip().endswith("ok")
+
+
+def test_listed_origins_send_the_cookie_cross_site(tmp_path):
+    result = _run(CREDENTIALED_SCENARIO, tmp_path, CORS_ORIGINS="https://app.example.com")
+    assert result.returncode == 0, result.stderr[-3000:]
+    assert result.stdout.strip().endswith("ok")
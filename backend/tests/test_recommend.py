@@ -0,0 +1,34 @@
+from conftest import seed_rows, seed_users
+
+from recommend import COURSE_VIDEOS, recommender
+from py_models.quiz_models import Quiz
+from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+
+
+def _watched(user_id, course_id, videos):
+    return [{"user_id": user_id, "course_id": course_id, "video_index": i} for i in range(videos)]
+
+
+def test_only_completed_tracks_count(client):
+    seed_users(3)
+    # Users 1 and 2 finished html and the python quiz; user 3 finished html only
+    seed_rows(CourseVideoProgress, _watched(1, "html", COURSE_VIDEOS) + _watched(2, "html", COURSE_VIDEOS)
+              + _watched(3, "html", COURSE_VIDEOS) + _watched(3, "css", COURSE_VIDEOS - 1))
+    seed_rows(Quiz, [{"user_id": uid, "quiz_id": "python", "score": 5} for uid in (1, 2)])
+    # Started but unfinished work is not a completion
+    seed_rows(CourseVideoProgress, _watched(1, "css", 1) + _watched(2, "css", 2))
+    seed_rows(QuizPartialProgress, [{"user_id": 1, "quiz_id": "js", "current_index": 2, "score": 1}])
+    recommender.refresh()
+
+    body = client.get("/recommendations/3").json()
+    assert body["ready"] is True
+    assert [r["item"] for r in body["recommendations"]] == ["python"]
+
+
+def test_first_request_does_not_wait_for_the_build(client, monkeypatch):
+    seed_users(1)
+    with recommender._refreshing:   # let a build started by an earlier request finish
+        recommender._model = None
+    monkeypatch.setattr(recommender, "_refresh_in_background", lambda: None)
+    body = client.get("/recommendations/1").json()
+    assert body == {"user_id": 1, "ready": False, "built_at": None, "recommendations": []}
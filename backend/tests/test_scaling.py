@@ -0,0 +1,70 @@
+"""Per-request cost must not grow with the size of the tables.
+
+The SQLite instructions a per-user read runs are counted with a small and a
+10x larger population of other users' rows. With the user_id indexes in
+place the count barely moves; a full scan would grow roughly 10x and fail
+the ratio check. Counts, unlike timings, do not depend on machine load.
+"""
+import pytest
+
+from conftest import seed_rows, seed_users
+
+from py_models.quiz_models import Quiz
+from py_models.progress_models import CourseVideoProgress, QuizPartialProgress
+
+SMALL, LARGE = 5_000, 50_000
+# 10x the data may cost at most this much more per request
+MAX_RATIO = 1.5
+
+
+def _grow_to(total, already):
+    """Add other users' rows until each progress table holds `total` rows."""
+    extra = total - already
+    seed_rows(Quiz, [{"user_id": 2 + i % 1000, "quiz_id": f"q{i % 20}", "score": i % 10} for i in range(extra)])
+    seed_rows(CourseVideoProgress, [{"user_id": 2 + i % 1000, "course_id": f"c{i % 20}", "video_index": i % 30} for i in range(extra)])
+    # Partial progress is one row per user and quiz
+    seed_rows(QuizPartialProgress, [{"user_id": 2 + i % 1000, "quiz_id": f"q{already + i}", "current_index": 1, "score": 1} for i in range(extra)])
+
+
+def _cost(steps, fn):
+    fn()   # warm caches that only the first request fills
+    with steps:
+        fn()
+    return steps.steps
+
+
+@pytest.mark.parametrize("path", [
+    "/progress/quiz/1",
+    "/progress/course/1",
+    "/progress/quiz/partial/1",
+    "/user/1",
+])
+def test_per_user_reads_scale_sublinearly(client, steps, path):
+    seed_users(1001)
+    seed_rows(Quiz, [{"user_id": 1, "quiz_id": "python", "score": i} for i in range(10)])
+    seed_rows(CourseVideoProgress, [{"user_id": 1, "course_id": "html", "video_index": i} for i in range(10)])
+    seed_rows(QuizPartialProgress, [{"user_id": 1, "quiz_id": "python", "current_index": 3, "score": 1}])
+
+    _grow_to(SMALL, 0)
+    small = _cost(steps, lambda: client.get(path))
+    _grow_to(LARGE, SMALL)
+    large = _cost(steps, lambda: client.get(path))
+
+    assert large / small < MAX_RATIO, f"{path}: {small} -> {large} instructions"
+
+
+def test_quiz_progress_response_does_not_grow_with_attempts(client, queries):
+    # Aggregation happens in SQL, so the response (and the Python work to
+    # build it) stays the same size however many attempts a user has
+    seed_users(1)
+    seed_rows(Quiz, [{"user_id": 1, "quiz_id": f"q{i % 5}", "score": i} for i in range(100)])
+    with queries:
+        small = client.get("/progress/quiz/1").json()
+    seed_rows(Quiz, [{"user_id": 1, "quiz_id": f"q{i % 5}", "score": i} for i in range(900)])
+    with queries:
+        large = client.get("/progress/quiz/1").json()
+
+    assert queries.count == 1
+    assert large.keys() == small.keys()
+    assert [len(v) for v in large.values()] == [len(v) for v in small.values()]
+    assert sum(v["attempts"] for v in large.values()) == 1000
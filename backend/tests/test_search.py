@@ -0,0 +1,61 @@
+from conftest import seed_rows, seed_users
+from search import catalog_index
+
+from py_models.course_models import Course
+
+COURSES = [
+    (1, "Python Basics", "Learn python: variables, loops and python functions", "programming", "beginner"),
+    (2, "Advanced Python", "Python internals", "programming", "advanced"),
+    (3, "Web Design", "HTML and CSS layouts", "web", "beginner"),
+    (4, "Python for the Web", "Build web apps with python", "web", "intermediate"),
+]
+
+
+def _seed_catalog():
+    seed_users(1)
+    seed_rows(Course, [
+        {"course_id": cid, "title": title, "description": description, "category": category,
+         "level": level, "create_by": 1, "created_at": "2026-01-01"}
+        for cid, title, description, category, level in COURSES
+    ])
+    catalog_index.invalidate()
+
+
+def _ids(body):
+    return [course["course_id"] for course in body["results"]]
+
+
+def test_more_matching_terms_rank_first(client):
+    _seed_catalog()
+    # "python" appears 3x in course 1, 2x in course 2 and 4
+    body = client.get("/course/search", params={"q": "Python"}).json()
+    assert _ids(body) == [1, 2, 4]
+    assert body["total"] == 3
+    # Every term must match
+    assert _ids(client.get("/course/search", params={"q": "python web"}).json()) == [4]
+    assert client.get("/course/search", params={"q": "rust"}).json()["total"] == 0
+    # No query lists the catalog in id order
+    assert _ids(client.get("/course/search").json()) == [1, 2, 3, 4]
+
+
+def test_filters_facets_and_pages(client):
+    _seed_catalog()
+    body = client.get("/course/search", params={"q": "python", "level": "beginner"}).json()
+    assert _ids(body) == [1]
+    # Facets count every match, so clients can offer the other levels
+    assert body["facets"]["level"] == {"beginner": 1, "advanced": 1, "intermediate": 1}
+    assert body["facets"]["category"] == {"programming": 2, "web": 1}
+
+    second = client.get("/course/search", params={"q": "python", "page": 2, "page_size": 2}).json()
+    assert (_ids(second), second["total"], second["page"]) == ([4], 3, 2)
+
+
+def test_new_courses_are_searchable(client):
+    _seed_catalog()
+    assert client.get("/course/search", params={"q": "databases"}).json()["total"] == 0
+    client.post("/create_course", json={
+        "course_id": 5, "title": "Databases", "description": "SQL and python drivers", "category": "data",
+        "level": "beginner", "created_by": 1, "created_at": "2026-02-01",
+    }).raise_for_status()
+    assert _ids(client.get("/course/search", params={"q": "databases"}).json()) == [5]
+    assert _ids(client.get("/course/search", params={"q": "python"}).json()) == [1, 2, 4, 5]
@@ -0,0 +1,141 @@
+"""Sharding is configured at import time, so these run the app in a child
+process against two SQLite files."""
+import os
+import subprocess
+import sys
+import textwrap
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIO = textwrap.dedent('''
+    import sqlite3
+    from fastapi.testclient import TestClient
+    from main import app
+    import analytics
+    import shards
+    from database import SessionLocal, shard_directory, user_data_engines
+
+    def users_on(path):
+        return {row[0] for row in sqlite3.connect(path).execute("SELECT user_id FROM users")}
+
+    def partials_on(path, user_id):
+        return sqlite3.connect(path).execute(
+            "SELECT COUNT(*) FROM quiz_partial_progress WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    with TestClient(app) as client:
+        shards.init()
+        for i in range(8):
+            client.post("/create_user", json={
+                "user_name": f"u{i}", "user_email": f"user{i}@example.com", "user_password": "pw",
+                "user_dateofbirth": "2000-01-01", "user_phone": "1", "user_gender": "x",
+            }).raise_for_status()
+        first, second = users_on(SHARD_0), users_on(SHARD_1)
+        assert first and second and not first & second and len(first | second) == 8
+
+        user_id = min(second)
+        client.post("/progress/quiz/partial", json={
+            "user_id": user_id, "quiz_id": "python", "current_index": 3, "score": 2,
+        }).raise_for_status()
+        assert partials_on(SHARD_1, user_id) == 1 and partials_on(SHARD_0, user_id) == 0
+        assert len(client.get("/users").json()) == 8
+        login = client.post("/login", json={"user_email": f"user{user_id - 1}@example.com", "user_password": "pw"})
+        assert login.json()["user"]["user_id"] == user_id
+
+        shards._set_directory(user_id, moving=True)
+        shard_directory.forget(user_id)
+        blocked = client.post("/progress/quiz/partial", json={
+            "user_id": user_id, "quiz_id": "python", "current_index": 4, "score": 3,
+        })
+        assert blocked.status_code == 503 and "retry-after" in blocked.headers
+        shards._set_directory(user_id, moving=False)
+
+        assert shards.move_user(user_id, 0, wait=0) == 3   # user, event, partial progress
+        shard_directory.forget(user_id)   # instead of waiting out the cache TTL
+        assert client.get(f"/progress/quiz/partial/{user_id}").json() == {"python": {"currentIndex": 3, "score": 2}}
+        assert user_id in users_on(SHARD_0) and user_id not in users_on(SHARD_1)
+        assert partials_on(SHARD_1, user_id) == 0
+
+        shards.rebalance(wait=0)
+        assert max(shards.counts()) - min(shards.counts()) <= 1
+        shard_directory._cache.clear()
+
+        # Reports and cohorts see the users of every shard
+        everyone = sorted(users_on(SHARD_0) | users_on(SHARD_1))
+        for uid in everyone:
+            client.post("/create_quiz", json={
+                "user_id": uid, "quiz_id": "python", "score": 5, "attempt_date": "2026-01-05T10:00:00Z",
+            }).raise_for_status()
+            client.post("/progress/course/video", json={
+                "user_id": uid, "course_id": "html", "video_index": 0,
+            }).raise_for_status()
+        for bind in user_data_engines():
+            with SessionLocal(bind=bind) as db:
+                analytics.rebuild(db)
+        assert client.get("/analytics/course/html/funnel").json()["funnel"][0]["users_reached"] == 8
+        days = client.get("/analytics/quiz/attempts_per_day?start=2026-01-01&end=2026-01-31").json()
+        assert days == [{"day": "2026-01-05", "attempts": 8}]
+        signups = client.get("/analytics/users/signups_per_month?start=2020-01-01&end=2099-12-31").json()
+        assert sum(month["signups"] for month in signups) == 8
+        cohort = client.post("/cohorts", json={"name": "everyone", "user_ids": everyone}).json()
+        assert cohort["members"] == 8
+        body = client.post("/progress/cohort", json={"cohort_id": cohort["cohort_id"]}).json()
+        assert all(body["users"][str(uid)]["quiz"]["python"]["attempts"] == 1 for uid in everyone)
+    print("ok")
+''')
+
+
+def test_users_are_routed_moved_and_rebalanced_across_shards(tmp_path):
+    shard_0, shard_1 = tmp_path / "shard0.db", tmp_path / "shard1.db"
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{shard_0}",
+        SHARD_DATABASE_URLS=f"sqlite:///{shard_0},sqlite:///{shard_1}",
+        RATE_LIMIT_ENABLED="0", CACHE_BUS="local", JOB_WORKERS="0",
+    )
+    script = f"SHARD_0 = {str(shard_0)!r}\nSHARD_1 = {str(shard_1)!r}\n" + SCENARIO
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", script],
+        cwd=BACKEND, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr[-3000:]
+    assert result.stdout.strip().endswith("ok")
+
+
+def test_archived_attempts_stay_archived_after_a_move(tmp_path):
+    # Runs in process: _copy_rows only needs two sessions, not the shard config
+    import datetime
+
+    from sqlalchemy import create_engine, func, select
+    from sqlalchemy.orm import Session
+
+    import events
+    import shards
+    from database import Base
+    from partitions import archive_month
+    from py_models.quiz_models import Quiz, QuizArchiveSummary
+    from py_models.event_models import LearningEvent
+    from py_models.signin_models import User
+
+    month = datetime.datetime(2020, 3, 1)
+    source, target = create_engine("sqlite://"), create_engine("sqlite://")
+    for bind, user_id in ((source, 1), (target, 2)):
+        Base.metadata.create_all(bind=bind)
+        with Session(bind) as db:
+            db.add(User(user_id=user_id, user_name=f"u{user_id}", user_email=f"u{user_id}@example.com", user_password="pw"))
+            events.record(db, [
+                {"user_id": user_id, "event_type": events.QUIZ_COMPLETED, "subject_id": "python",
+                 "score": i, "occurred_at": month + datetime.timedelta(days=i)}
+                for i in range(3)
+            ])
+            db.commit()
+        archive_month(month, directory=str(tmp_path), bind=bind)
+
+    with Session(source) as source_db, Session(target) as target_db:
+        shards._copy_rows(source_db, target_db, 1)
+        target_db.commit()
+    events.replay(bind=target)
+
+    with Session(target) as db:
+        assert db.scalar(select(func.count()).select_from(Quiz)) == 0
+        assert db.scalar(select(QuizArchiveSummary.attempts).where(QuizArchiveSummary.user_id == 1)) == 3
+        assert db.scalar(select(func.count()).select_from(LearningEvent)) == 6
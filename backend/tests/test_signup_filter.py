@@ -0,0 +1,85 @@
+from sqlalchemy import create_engine, func, insert, select, text
+
+import migrations
+from conftest import seed_users
+from database import Base, engine
+from signup_filter import BloomFilter, fingerprint, signup_filter
+
+from py_models.signin_models import User
+
+NEW_USER = {
+    "user_name": "new", "user_email": "new@example.com", "user_password": "pw",
+    "user_dateofbirth": "2000-01-01", "user_phone": "1", "user_gender": "x",
+}
+
+
+def test_bloom_filter_has_no_false_negatives_and_a_bounded_rate():
+    bloom = BloomFilter(10_000, fp_rate=0.01)
+    for i in range(10_000):
+        bloom.add(fingerprint(f"user{i}@example.com"))
+    assert all(fingerprint(f"user{i}@example.com") in bloom for i in range(10_000))
+    false_positives = sum(fingerprint(f"other{i}@example.com") in bloom for i in range(10_000))
+    assert false_positives < 200
+    assert BloomFilter(10_000, fp_rate=0.01, max_bytes=1024).bytes == 1024
+
+
+def test_new_emails_skip_the_lookup_and_duplicates_get_409(client, queries):
+    seed_users(3)
+    signup_filter.build([engine])
+    with queries:
+        assert client.post("/create_user", json=NEW_USER).status_code == 200
+    assert not any("user_email" in s and s.lstrip().upper().startswith("SELECT") for s in queries.statements)
+
+    lookups = signup_filter.lookups
+    response = client.post("/create_user", json=dict(NEW_USER, user_name="again"))
+    assert response.status_code == 409
+    assert signup_filter.lookups == lookups + 1
+    response = client.post("/create_user", json=dict(NEW_USER, user_email="user2@example.com"))
+    assert response.status_code == 409
+
+
+def test_unique_index_catches_emails_the_filter_missed(client):
+    signup_filter.build([engine])
+    seed_users(1)   # written behind the filter's back, like another process would
+    assert client.post("/create_user", json=dict(NEW_USER, user_email="user1@example.com")).status_code == 409
+    assert client.put("/user/1", json={"user_email": "new@example.com"}).status_code == 200
+    assert client.post("/create_user", json=NEW_USER).status_code == 409
+
+
+def test_every_signup_is_looked_up_until_the_email_index_exists(client, monkeypatch):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX {migrations.USER_EMAIL_INDEX.name}"))
+    monkeypatch.setattr(migrations, "_index_checks", {})
+    try:
+        signup_filter.build([engine])
+        # Registered by a worker whose broadcast has not arrived yet
+        seed_users(1)
+        response = client.post("/create_user", json=dict(NEW_USER, user_email="user1@example.com"))
+        assert response.status_code == 409
+        with engine.connect() as conn:
+            assert conn.scalar(select(func.count()).select_from(User)) == 1
+    finally:
+        migrations.USER_EMAIL_INDEX.create(bind=engine)
+
+
+def test_deleted_accounts_free_their_email(client):
+    seed_users(1)
+    signup_filter.build([engine])
+    assert client.post("/delete_user/1", json={"password": "pw"}).status_code == 200
+    assert client.post("/create_user", json=dict(NEW_USER, user_email="user1@example.com")).status_code == 200
+
+
+def test_upgrade_soft_deletes_duplicate_accounts(tmp_path):
+    old = create_engine(f"sqlite:///{tmp_path}/old.db")
+    Base.metadata.create_all(bind=old)
+    with old.begin() as conn:
+        conn.execute(text(f"DROP INDEX {migrations.USER_EMAIL_INDEX.name}"))
+        conn.execute(insert(User), [
+            {"user_id": i, "user_name": f"u{i}", "user_email": email, "user_password": "pw"}
+            for i, email in [(1, "a@example.com"), (2, "b@example.com"), (3, "a@example.com")]
+        ])
+    migrations.upgrade(old)
+    with old.connect() as conn:
+        live = conn.execute(select(User.user_id).where(User.user_deleted_at.is_(None))).scalars().all()
+    assert sorted(live) == [1, 2]
+    assert migrations.USER_EMAIL_INDEX.name in migrations.index_names(old, "users")
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from sqlalchemy import event
+
+from conftest import seed_users
+from database import engine
+from single_flight import flights
+
+
+def test_concurrent_identical_reads_share_one_query(client, queries):
+    seed_users(1)
+
+    # Slow every statement down so the requests overlap
+    def slow(*args):
+        time.sleep(0.05)
+    event.listen(engine, "before_cursor_execute", slow)
+    before = flights.stats()["groups"].get("course_progress", {"coalesced": 0})["coalesced"]
+    try:
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(client.get("/progress/course/1")))
+            for _ in range(20)
+        ]
+        with queries:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+    finally:
+        event.remove(engine, "before_cursor_execute", slow)
+
+    assert [r.status_code for r in responses] == [200] * 20
+    assert queries.count < 20
+    coalesced = flights.stats()["groups"]["course_progress"]["coalesced"] - before
+    assert coalesced == 20 - queries.count
+
+
+def test_different_parameters_are_not_coalesced():
+    calls = []
+    results = [flights.do(("test", None, (("user_id", u),)), lambda u=u: calls.append(u) or u) for u in (1, 2)]
+    assert results == [1, 2]
+    assert calls == [1, 2]
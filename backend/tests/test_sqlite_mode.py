@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select, text
+
+from conftest import seed_users
+from database import engine, sqlite_writers
+from main import app
+
+from py_models.progress_models import QuizPartialProgress
+
+pytestmark = pytest.mark.skipif(engine not in sqlite_writers, reason="SQLite mode only")
+
+
+def test_wal_and_pragmas_are_applied():
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() > 0
+
+
+def test_saving_partial_progress_upserts_one_row(client):
+    seed_users(1)
+    for index in (1, 2, 3):
+        body = {"user_id": 1, "quiz_id": "python", "current_index": index, "score": index}
+        assert client.post("/progress/quiz/partial", json=body).status_code == 200
+    assert client.get("/progress/quiz/partial/1").json() == {"python": {"currentIndex": 3, "score": 3}}
+
+
+def test_concurrent_writers_queue_instead_of_failing():
+    seed_users(8)
+    writers = sqlite_writers[engine]
+    before = writers.transactions
+    failures = []
+
+    def student(user_id):
+        with TestClient(app) as client:
+            for index in range(10):
+                response = client.post("/progress/quiz/partial", json={
+                    "user_id": user_id, "quiz_id": "python", "current_index": index, "score": index,
+                })
+                if response.status_code != 200:
+                    failures.append(response.text)
+
+    threads = [threading.Thread(target=student, args=(user_id,)) for user_id in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    assert writers.transactions - before >= 80 and writers.timeouts == 0
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(QuizPartialProgress)).scalar() == 8
@@ -0,0 +1,32 @@
+from sqlalchemy.engine.default import CACHE_HIT
+
+from conftest import seed_users
+from database import SessionLocal, engine
+from statements import registry, statement
+
+
+def test_statements_are_built_once_and_served_from_the_compiled_cache():
+    seed_users(1)
+    db = SessionLocal()
+    try:
+        assert statement(db, "user_by_id") is statement(db, "user_by_id")
+        conn = db.connection()
+        conn.execute(statement(db, "user_version"), {"user_id": 1}).all()
+        again = conn.execute(statement(db, "user_version"), {"user_id": 1})
+        assert again.context.cache_hit == CACHE_HIT
+    finally:
+        db.close()
+    assert f"user_by_id:{engine.dialect.name}" in registry.stats()["built"]
+
+
+def test_login_uses_registered_statement(client):
+    seed_users(1)
+    user = client.get("/user/1").json()
+    served = registry.stats()["served"].get("login", 0)
+    ok = client.post("/login", json={"user_email": user["user_email"], "user_password": user["user_password"]})
+    assert ok.status_code == 200 and ok.json()["user"]["user_id"] == 1
+    bad = client.post("/login", json={"user_email": user["user_email"], "user_password": "wrong"})
+    assert bad.status_code == 401
+    stats = registry.stats()
+    assert stats["served"]["login"] == served + 2
+    assert f"login:{engine.dialect.name}" in stats["built"]
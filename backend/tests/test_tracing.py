@@ -0,0 +1,70 @@
+from conftest import seed_users
+from tracing import parse_traceparent, tracer
+
+PARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+class CollectingExporter:
+    path = endpoint = None
+    exported = dropped = 0
+
+    def __init__(self):
+        self.traces = []
+
+    def submit(self, trace):
+        self.traces.append(trace)
+
+
+def _enable(monkeypatch, inbound_per_second=10):
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracer, "exporter", exporter)
+    # Tracing on, but only inbound sampled flags pick requests
+    monkeypatch.setattr(tracer, "sample_rate", 1e-12)
+    monkeypatch.setattr(tracer, "inbound_per_second", inbound_per_second)
+    monkeypatch.setattr(tracer, "_inbound_second", 0)
+    return exporter
+
+
+def test_sampled_request_records_pool_sql_and_commit_spans(client, monkeypatch):
+    seed_users(1)
+    exporter = _enable(monkeypatch)
+
+    response = client.post(
+        "/progress/quiz/partial",
+        json={"user_id": 1, "quiz_id": "python", "current_index": 2, "score": 1},
+        headers={"traceparent": PARENT},
+    )
+    assert response.status_code == 200
+    trace_id, _, sampled = parse_traceparent(response.headers["traceparent"])
+    assert trace_id == "4bf92f3577b34da6a3ce929d0e0e4736" and sampled
+
+    (trace,) = exporter.traces
+    names = [s.name for s in trace.spans]
+    for expected in ("http.request", "route", "handler save_partial", "db.pool.checkout", "db.query", "db.commit", "serialize"):
+        assert expected in names
+    root = next(s for s in trace.spans if s.name == "http.request")
+    assert root.parent_id == "00f067aa0ba902b7"
+
+
+def test_unsampled_requests_are_not_exported(client, monkeypatch):
+    exporter = _enable(monkeypatch)
+    response = client.get("/course", headers={"traceparent": PARENT[:-2] + "00"})
+    assert response.headers["traceparent"].endswith("-00")
+    assert exporter.traces == []
+
+
+def test_disabled_tracing_ignores_inbound_sampled_flag(client, monkeypatch):
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracer, "exporter", exporter)
+    monkeypatch.setattr(tracer, "sample_rate", 0)
+    response = client.get("/course", headers={"traceparent": PARENT})
+    assert response.headers.get("traceparent") is None
+    assert exporter.traces == []
+
+
+def test_inbound_sampled_flags_are_capped(client, monkeypatch):
+    exporter = _enable(monkeypatch, inbound_per_second=2)
+    for _ in range(5):
+        assert client.get("/course", headers={"traceparent": PARENT}).status_code == 200
+    # All five requests run in well under a second unless the machine stalls
+    assert 2 <= len(exporter.traces) <= 4
@@ -0,0 +1,30 @@
+import datetime
+
+# Parsers for the legacy string columns: quizz.attempt_date holds whatever
+# the quiz page sent (an ISO-8601 string today) and users.user_created_at
+# holds "%B %Y" text such as "October 2026". Typed values are naive UTC.
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def naive_utc(value):
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+def parse_attempt_date(value):
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    return naive_utc(parsed)
+
+def parse_month_year(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value.strip(), "%B %Y")
+    except ValueError:
+        return None
@@ -0,0 +1,386 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from profiling import current as current_profile
+
+# --------------------------------------------------
+# REQUEST TRACING (W3C TRACE CONTEXT, OTLP JSON)
+# --------------------------------------------------
+# A sampled request records spans for the request itself, load shedding,
+# the route (dependencies + handler + serialization), pool checkout, every
+# SQL statement and every commit. Finished traces are written as OTLP/JSON
+# lines to TRACE_FILE and, when TRACE_OTLP_ENDPOINT is set, POSTed to an
+# OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces) from a
+# background thread. TRACE_SAMPLE_RATE picks the requests to sample, and 0
+# disables tracing whatever clients send. While it is on, an incoming
+# traceparent keeps its trace id, and its sampled flag is honoured for at most
+# TRACE_INBOUND_PER_SECOND requests a second, so clients cannot flood the
+# exporter.
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+INBOUND_PER_SECOND = int(os.getenv("TRACE_INBOUND_PER_SECOND", "10"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+SERVICE_NAME = "skillnest-api"
+MAX_STATEMENT_LENGTH = 500
+
+logger = logging.getLogger("skillnest.tracing")
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+def _now():
+    return time.time_ns()
+
+
+def _new_id(nbytes):
+    return random.getrandbits(nbytes * 8).to_bytes(nbytes, "big").hex()
+
+
+def parse_traceparent(value):
+    # version-traceid-parentid-flags, e.g. 00-4bf9...-00f0...-01
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Trace:
+    def __init__(self, trace_id, sampled):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans = []
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = _now()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, error=None):
+        if self.end is None:
+            self.end = _now()
+            if error is not None:
+                self.error = f"{type(error).__name__}: {error}"
+            if self.trace.sampled:
+                self.trace.spans.append(self)
+
+    def traceparent(self):
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.trace.sampled else '00'}"
+
+
+class Exporter:
+    """Writes finished traces off the request path; drops them when backed up."""
+
+    def __init__(self, path, endpoint, max_queued=EXPORT_QUEUE_SIZE):
+        self.path = path
+        self.endpoint = endpoint
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self.exported = 0
+        self.dropped = 0
+
+    def submit(self, trace):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            payload = json.dumps(otlp_json([self._queue.get()]))
+            try:
+                if self.path:
+                    with open(self.path, "a") as f:
+                        f.write(payload + "\n")
+                if self.endpoint:
+                    request = urllib.request.Request(
+                        self.endpoint, data=payload.encode(), method="POST",
+                        headers={"Content-Type": "application/json"},
+                    )
+                    urllib.request.urlopen(request, timeout=5).close()
+                self.exported += 1
+            except Exception:
+                logger.exception("Trace export failed")
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        wrapped = {"boolValue": value}
+    elif isinstance(value, int):
+        wrapped = {"intValue": str(value)}
+    elif isinstance(value, float):
+        wrapped = {"doubleValue": value}
+    else:
+        wrapped = {"stringValue": str(value)}
+    return {"key": key, "value": wrapped}
+
+
+# OTLP span kinds: 1 internal, 2 server, 3 client
+SPAN_KINDS = {"http": 2, "db": 3}
+
+
+def otlp_json(traces):
+    """ExportTraceServiceRequest in the OTLP/JSON encoding."""
+    spans = []
+    for trace in traces:
+        for span in trace.spans:
+            item = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": SPAN_KINDS.get(span.name.split(".")[0], 1),
+                "startTimeUnixNano": str(span.start),
+                "endTimeUnixNano": str(span.end),
+                "attributes": [_attribute(k, v) for k, v in span.attributes.items() if v is not None],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 0},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            spans.append(item)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+        "scopeSpans": [{"scope": {"name": "skillnest.tracing"}, "spans": spans}],
+    }]}
+
+
+class Tracer:
+    def __init__(self, sample_rate=SAMPLE_RATE, exporter=None, inbound_per_second=INBOUND_PER_SECOND):
+        self.sample_rate = sample_rate
+        self.exporter = exporter or Exporter(TRACE_FILE, OTLP_ENDPOINT)
+        self.inbound_per_second = inbound_per_second
+        self.started = 0
+        self.sampled = 0
+        self.inbound_refused = 0
+        self._inbound_second = 0
+        self._inbound_count = 0
+
+    def _admit_inbound(self):
+        # Fixed one-second window; a race between threads costs at most a few extra traces
+        second = int(time.monotonic())
+        if second != self._inbound_second:
+            self._inbound_second, self._inbound_count = second, 0
+        if self._inbound_count >= self.inbound_per_second:
+            self.inbound_refused += 1
+            return False
+        self._inbound_count += 1
+        return True
+
+    def start_request(self, name, traceparent=None, **attributes):
+        """Root span of a request, or None when tracing is off."""
+        if self.sample_rate <= 0:
+            return None
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+            sampled = sampled and self._admit_inbound()
+        else:
+            trace_id, parent_id, sampled = _new_id(16), None, random.random() < self.sample_rate
+        trace = Trace(trace_id, sampled)
+        self.started += 1
+        self.sampled += sampled
+        span = Span(trace, name, parent_id, attributes)
+        return span, _current.set(span)
+
+    def end_request(self, started, error=None):
+        span, token = started
+        _current.reset(token)
+        span.finish(error)
+        if span.trace.sampled:
+            self.exporter.submit(span.trace)
+
+    def start(self, name, **attributes):
+        parent = _current.get()
+        if parent is None or not parent.trace.sampled:
+            return None
+        return Span(parent.trace, name, parent.span_id, attributes)
+
+    def span(self, name, **attributes):
+        return _SpanContext(self, name, attributes)
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "requests_traced": self.started,
+            "requests_sampled": self.sampled,
+            "inbound_sampled_refused": self.inbound_refused,
+            "exported": self.exporter.exported,
+            "dropped": self.exporter.dropped,
+            "file": self.exporter.path,
+            "otlp_endpoint": self.exporter.endpoint,
+        }
+
+
+class _SpanContext:
+    __slots__ = ("tracer", "name", "attributes", "span", "token")
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer, self.name, self.attributes = tracer, name, attributes
+
+    def __enter__(self):
+        self.span = self.tracer.start(self.name, **self.attributes)
+        self.token = _current.set(self.span) if self.span is not None else None
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is not None:
+            _current.reset(self.token)
+            self.span.finish(exc)
+        return False
+
+
+tracer = Tracer()
+
+
+# --------------------------------------------------
+# INSTRUMENTATION
+# --------------------------------------------------
+class TracedRoute(APIRoute):
+    """Route class that times the handler and, after it, serialization."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def traced_handler(request):
+            span = tracer.start("route", **{"http.route": path})
+            if span is None:
+                return await handler(request)
+            token = _current.set(span)
+            try:
+                response = await handler(request)
+            except BaseException as exc:
+                span.finish(exc)
+                raise
+            finally:
+                _current.reset(token)
+            # Whatever ran between the handler returning and now was serialization
+            handler_span = next((
+                s for s in reversed(span.trace.spans)
+                if s.parent_id == span.span_id and s.name.startswith("handler ")
+            ), None)
+            if handler_span is not None:
+                serialize = Span(span.trace, "serialize", span.span_id, {})
+                serialize.start = handler_span.end
+                serialize.finish()
+            span.finish()
+            return response
+
+        return traced_handler
+
+
+def _traced_endpoint(endpoint):
+    name = f"handler {endpoint.__name__}"
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            # A profiled request also samples the worker thread running its handler
+            profile = current_profile()
+            with tracer.span(name), (profile.thread() if profile else contextlib.nullcontext()):
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+
+def _truncate(statement):
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= MAX_STATEMENT_LENGTH else statement[:MAX_STATEMENT_LENGTH] + "..."
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _sql_start(conn, cursor, statement, parameters, context, executemany):
+    span = tracer.start("db.query", **{
+        "db.system": conn.dialect.name,
+        "db.statement": _truncate(statement),
+        "db.executemany": executemany,
+    })
+    if span is not None:
+        conn.info.setdefault("trace_spans", []).append(span)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _sql_end(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        span = spans.pop()
+        span.set(**{"db.rows": cursor.rowcount if cursor.rowcount >= 0 else None})
+        span.finish()
+
+
+@event.listens_for(Engine, "handle_error")
+def _sql_error(context):
+    spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+    if spans:
+        spans.pop().finish(context.original_exception)
+
+
+@event.listens_for(Session, "before_commit")
+def _commit_start(session):
+    span = tracer.start("db.commit")
+    if span is not None:
+        # The flush inside commit nests its statements under this span
+        session.info["trace_commit"] = (span, _current.set(span))
+
+
+def _commit_end(session, error=None):
+    started = session.info.pop("trace_commit", None)
+    if started is not None:
+        span, token = started
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass  # ended from another context; the span still gets its end time
+        span.finish(error)
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_done(session):
+    _commit_end(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _commit_failed(session, previous_transaction):
+    _commit_end(session, RuntimeError("rolled back"))
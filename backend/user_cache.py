@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+
+from cache_bus import bus
+
+# --------------------------------------------------
+# USER PROFILE VERSIONS (CONDITIONAL GET)
+# --------------------------------------------------
+# user_id -> users.user_version, so If-None-Match revalidations can be
+# answered with a 304 without touching the database. Entries expire after
+# a short TTL because other instances may update the row.
+VERSION_CACHE_SECONDS = float(os.getenv("USER_VERSION_CACHE_SECONDS", "30"))
+VERSION_CACHE_SIZE = int(os.getenv("USER_VERSION_CACHE_SIZE", "50000"))
+
+
+def user_etag(user_id, version):
+    return f'W/"u{user_id}-v{version or 0}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+class VersionCache:
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}   # user_id -> (version, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, user_id, version):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._entries.clear()
+            self._entries[user_id] = (version or 0, time.monotonic() + self.ttl)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+user_versions = VersionCache(VERSION_CACHE_SECONDS, VERSION_CACHE_SIZE)
+# Another worker changed or deleted this profile
+bus.on("user_versions", user_versions.invalidate)
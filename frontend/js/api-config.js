@@ -19,6 +19,27 @@ const API_CONFIG = {
             args[0] = resource;
         }
 
+        // Attach the signed session token from /login to API calls
+        const token = localStorage.getItem('token');
+        if (token && typeof resource === 'string' && resource.startsWith(API_CONFIG.BASE_URL)) {
+            options.headers = {
+                ...options.headers,
+                'Authorization': `Bearer ${token}`
+            };
+            args[1] = options;
+        }
+
+        // Echo the read-your-writes deadline from our last write, so the next
+        // reads go to the primary even where the cookie is not sent
+        const primaryUntil = sessionStorage.getItem('readPrimaryUntil');
+        if (primaryUntil && typeof resource === 'string' && resource.startsWith(API_CONFIG.BASE_URL)) {
+            options.headers = {
+                ...options.headers,
+                'X-Read-Primary-Until': primaryUntil
+            };
+            args[1] = options;
+        }
+
         // Force Anti-Caching for all non-GET requests (Login, Signup, Progress, etc.)
         if (options.method && options.method.toUpperCase() !== 'GET') {
             options.cache = 'no-store';
@@ -31,6 +52,12 @@ const API_CONFIG = {
             args[1] = options;
         }
 
-        return originalFetch.apply(this, args);
+        return originalFetch.apply(this, args).then(function (response) {
+            const until = response.headers.get('X-Read-Primary-Until');
+            if (until) {
+                sessionStorage.setItem('readPrimaryUntil', until);
+            }
+            return response;
+        });
     };
 })();
@@ -95,8 +95,22 @@
         };
 
         // Confirm buttons
-        document.getElementById('confirmSignOutBtn').onclick = () => {
+        document.getElementById('confirmSignOutBtn').onclick = async () => {
+            // Revoke the token on the server too, not just in this browser
+            const token = localStorage.getItem('token');
+            if (token) {
+                try {
+                    await fetch(`${API_BASE_URL}/logout`, {
+                        method: 'POST',
+                        headers: { 'Authorization': `Bearer ${token}` },
+                        cache: 'no-store'
+                    });
+                } catch (error) {
+                    console.error('Error signing out:', error);
+                }
+            }
             localStorage.removeItem('user');
+            localStorage.removeItem('token');
             window.location.href = 'login.html';
         };
 
@@ -130,6 +144,7 @@
                 const result = await response.json();
                 if (result.status === 'success') {
                     localStorage.removeItem('user');
+                    localStorage.removeItem('token');
                     window.location.href = 'signup.html';
                 } else {
                     alert(result.message || 'Failed to delete account');